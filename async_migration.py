@@ -0,0 +1,643 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+The create pipeline of github_duplication, as coroutines.
+
+The phases populating a destination, from its milestones to the comment threads of its issues and prs, are
+implemented once, here, over a client sending their requests. The synchronous functions of github_duplication
+(populate_repository, create_issues, migrate_comments, ...) run them through a ThreadedGitHub, which sends every
+request with the blocking functions of github_duplication on worker threads. The asyncio client path runs them
+through an AsyncGitHub instead: one httpx client per API root, which multiplexes requests over HTTP/2 connections
+when the h2 package is installed. Its requests in flight are bounded by a semaphore rather than by a number of
+threads, so several migrations can run in one process on a small machine. Both clients pace, retry and record
+requests with github_duplication.RequestAttempts, and deduplicate against the same destination index and journal.
+
+The asyncio client path requires httpx, installed with `pip3 install httpx[http2]`.
+"""
+
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import github_duplication
+import migration_metrics
+from github_duplication import check_res, journal, journaled, log, record_failure, READ_HEADERS, WRITE_HEADERS
+from migration_records import project
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import h2
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+# Requests in flight at the same time, across every migration run on the event loop
+CONCURRENCY = 20
+
+# Seconds before a request without any response is abandoned
+TIMEOUT = 60.0
+
+
+class AsyncGitHub(object):
+    """
+    The httpx clients of every GitHub API root and the semaphore bounding the requests in flight through them,
+    shared by every migration run on the event loop.
+    INPUT:
+        concurrency: the number of requests in flight at the same time
+    """
+
+    def __init__(self, concurrency=CONCURRENCY):
+        if httpx is None:
+            raise ImportError("The asyncio client requires httpx: pip3 install httpx[http2]")
+        self.concurrency = concurrency
+        # the number of comment threads, labels or collaborators migrated at the same time
+        self.workers = concurrency
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.clients = {}
+        # the pending listing of every element type of every destination, awaited by all who consult it meanwhile
+        self.listings = {}
+
+    def client(self, url):
+        """
+        INPUT: any url belonging to a GitHub API installation
+        OUTPUT: the client shared by all requests to that API root
+        """
+        root = github_duplication.api_root(url)
+        if root not in self.clients:
+            limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+            self.clients[root] = httpx.AsyncClient(http2=HTTP2, limits=limits, timeout=TIMEOUT)
+        return self.clients[root]
+
+    async def close(self):
+        """Close every client and release the connections they hold open"""
+        for client in self.clients.values():
+            await client.aclose()
+        self.clients.clear()
+
+    async def send_req(self, method, url, credentials, data=None, headers=READ_HEADERS, write=None):
+        """
+        INPUT: the same as github_duplication.send_req
+        OUTPUT: the response object of the request, scheduled, retried and recorded as by github_duplication.send_req
+        """
+        if write is None:
+            write = method != 'GET'
+        if write and github_duplication.PLAN is not None:
+            return github_duplication.PLAN.respond(method, url, data)
+        attempts = github_duplication.RequestAttempts(method, url, credentials, headers, write)
+        while True:
+            sender, delay = attempts.start()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            async with self.semaphore:
+                started = time.time()
+                try:
+                    r = await self.client(url).request(method, url, content=data, headers=headers,
+                                                       auth=(sender['user_name'], sender['token']))
+                except httpx.TransportError:
+                    delay = attempts.failed()
+                    if delay is None:
+                        raise
+                    r = None
+                latency = time.time() - started
+            if r is not None:
+                delay = attempts.answered(r, latency)
+                if delay is None:
+                    return r
+            await asyncio.sleep(delay)
+
+    async def get_req(self, url, credentials):
+        return await self.send_req('GET', url, credentials)
+
+    async def post_req(self, url, data, credentials):
+        return await self.send_req('POST', url, credentials, data, WRITE_HEADERS)
+
+    async def put_req(self, url, data, credentials):
+        return await self.send_req('PUT', url, credentials, data, WRITE_HEADERS)
+
+    async def patch_req(self, url, data, credentials):
+        return await self.send_req('PATCH', url, credentials, data, WRITE_HEADERS)
+
+    async def get_pages(self, url, credentials):
+        """
+        INPUT: an API endpoint listing items over one or more pages
+        OUTPUT: a list of every listed item, following the 'next' links of the responses. If any page cannot be
+                retrieved, False is returned
+        """
+        r = await self.get_req(github_duplication.paged_url(url), credentials)
+        if not check_res(r):
+            return False
+        items = r.json()
+        while 'next' in r.links:
+            r = await self.get_req(r.links['next']['url'], credentials)
+            if not check_res(r):
+                sys.stderr.write("ERROR: Failed to retrieve the page " + str(r.url) + ", the listing is incomplete.\n")
+                return False
+            items.extend(r.json())
+        return items
+
+    async def index(self, destination_url, destination, kind, credentials):
+        """The same as github_duplication.INDEX.index, listing the destination without blocking the event loop.
+        Each element type of a destination is listed once, however many coroutines consult it while it is listed
+        """
+        index = github_duplication.INDEX
+        if not index.loaded(destination_url, destination, kind):
+            key = (destination_url, destination, 'issues' if kind == 'prs' else kind)
+            # a finished listing of a destination which is still not indexed failed, and is listed again
+            if key not in self.listings or self.listings[key].done():
+                self.listings[key] = asyncio.ensure_future(self.list_index(key, kind, credentials))
+            if not await self.listings[key]:
+                return None
+        return index.indexes.get((destination_url, destination, kind))
+
+    async def list_index(self, key, kind, credentials):
+        """
+        INPUT: the root url, destination and listed element type of the listing, and the kind it was started for
+        OUTPUT: True once the destination is indexed. False if it could not be listed
+        """
+        destination_url, destination, _ = key
+        index = github_duplication.INDEX
+        elements = await self.get_pages(index.listing(destination_url, destination, kind), credentials)
+        elements = index.listed(destination, kind, elements)
+        if elements is False:
+            return False
+        # the same destination may have been listed on another thread meanwhile
+        if not index.loaded(destination_url, destination, kind):
+            index.store(destination_url, destination, kind, elements)
+        return True
+
+    async def claim(self, destination_url, destination, kind, key, credentials):
+        """The same as github_duplication.INDEX.claim, listing the destination without blocking the event loop"""
+        if await self.index(destination_url, destination, kind, credentials) is None:
+            return None
+        return github_duplication.INDEX.claim(destination_url, destination, kind, key, credentials)
+
+
+class ThreadedGitHub(object):
+    """
+    The client the synchronous functions of github_duplication run the pipeline through: every request is sent by
+    the blocking function of github_duplication making it, on a worker thread, and the destination is indexed by
+    github_duplication.INDEX itself. Comment threads are migrated WORKERS at a time, as by the synchronous path
+    before it ran on this pipeline.
+    """
+
+    def __init__(self):
+        self.workers = github_duplication.WORKERS
+
+    async def get_req(self, url, credentials):
+        return await asyncio.to_thread(github_duplication.get_req, url, credentials)
+
+    async def post_req(self, url, data, credentials):
+        return await asyncio.to_thread(github_duplication.post_req, url, data, credentials)
+
+    async def put_req(self, url, data, credentials):
+        return await asyncio.to_thread(github_duplication.put_req, url, data, credentials)
+
+    async def patch_req(self, url, data, credentials):
+        return await asyncio.to_thread(github_duplication.patch_req, url, data, credentials)
+
+    async def get_pages(self, url, credentials):
+        """The same as github_duplication.list_pages"""
+        return await asyncio.to_thread(github_duplication.list_pages, url, credentials)
+
+    async def index(self, destination_url, destination, kind, credentials):
+        """The same as github_duplication.INDEX.index"""
+        return await asyncio.to_thread(github_duplication.INDEX.index, destination_url, destination, kind, credentials)
+
+    async def claim(self, destination_url, destination, kind, key, credentials):
+        """The same as github_duplication.INDEX.claim"""
+        return await asyncio.to_thread(github_duplication.INDEX.claim, destination_url, destination, kind, key,
+                                       credentials)
+
+
+def run_threaded(function, *args):
+    """Run a coroutine function of the pipeline to completion on a new event loop, through a ThreadedGitHub
+    INPUT:
+        function: the coroutine function, called with the client then args
+    OUTPUT: the value it returns
+    """
+    async def main():
+        # every phase running concurrently, plus every worker, waits on its own thread for its requests
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=len(github_duplication.PHASES) + 2 * github_duplication.WORKERS))
+        return await function(ThreadedGitHub(), *args)
+
+    return asyncio.run(main())
+
+
+async def elements_of(elements):
+    """
+    INPUT: the elements of a phase, as a list or as a generator streaming them from the source or an archive
+    OUTPUT: an asynchronous generator of the elements. Those of a generator are read on a worker thread, so the
+            event loop is not blocked while its pages are retrieved
+    """
+    if isinstance(elements, list):
+        for element in elements:
+            yield element
+        return
+    iterator = iter(elements)
+    end = object()
+    while True:
+        element = await asyncio.to_thread(next, iterator, end)
+        if element is end:
+            return
+        yield element
+
+
+async def bounded(semaphore, coroutine):
+    """Await a coroutine once the semaphore lets it run"""
+    async with semaphore:
+        return await coroutine
+
+
+async def download_template(client, source_url, source, credentials, phases=github_duplication.PHASES):
+    """Download the elements of a repository to be migrated, and the comments of its issues and prs
+    INPUT:
+        client: the AsyncGitHub the comment threads are downloaded through
+        source_url: the root url for the GitHub API
+        source: the team and repo '<team>/<repo>' to download from
+        phases: the element types to download
+    OUTPUT: the same dict as github_duplication.download_template with materialize set. False if any element
+            type failed to be retrieved
+    """
+    # the listings are few pages each, streamed by the downloaders of github_duplication on a worker thread
+    template = await asyncio.to_thread(github_duplication.download_elements, source_url, source, credentials,
+                                       phases, True)
+    if template is False:
+        return False
+    # the comment threads are one listing per issue/pr, downloaded concurrently on the event loop
+    with migration_metrics.phase('download'):
+        items = template.get('issues', []) + template.get('prs', [])
+        threads = await asyncio.gather(*[client.get_pages(item['comments_url'], credentials) for item in items])
+    if any(thread is False for thread in threads):
+        sys.stderr.write('ERROR: Comments failed to be retrieved.\n')
+        return False
+    template['comments'] = {item['comments_url']: list(project('comments', thread))
+                            for item, thread in zip(items, threads)}
+    return template
+
+
+async def create_collaborators(client, collaborators, destination_url, destination, credentials):
+    """Add collaborators to GitHub, client.workers at a time
+    INPUT:
+        collaborators: the collaborators downloaded from the source
+        destination_url: the root url for the GitHub API
+        destination: the team and repo '<team>/<repo>' to add collaborators to
+    OUTPUT: Null
+    """
+    async def add(collaborator):
+        if collaborator['login'] == credentials['user_name'] or journaled(destination, 'collaborators', collaborator['login']):
+            return
+        if await client.claim(destination_url, destination, 'collaborators', collaborator['login'], credentials) is not None:
+            return
+        url = destination_url + "repos/" + destination + "/collaborators/" + collaborator["login"]
+        perm = "admin" if collaborator["permissions"]["admin"] == True else "push"
+        r = await client.put_req(url, json.dumps({"permission": perm}), credentials)
+        if check_res(r):
+            journal(destination, 'collaborators', collaborator['login'])
+            github_duplication.INDEX.add(destination_url, destination, 'collaborators', collaborator['login'],
+                                         {"login": collaborator['login']})
+            # a collaborator can be assigned as soon as it is added, so issues and prs are not validated without it
+            github_duplication.INDEX.add(destination_url, destination, 'assignees', collaborator['login'],
+                                         {"login": collaborator['login']})
+        else:
+            record_failure('collaborators', collaborator['login'])
+
+    semaphore = asyncio.Semaphore(client.workers)
+    await asyncio.gather(*[bounded(semaphore, add(collaborator)) async for collaborator in elements_of(collaborators)])
+
+
+async def create_milestones(client, milestones, destination_url, destination, credentials):
+    """Post milestones to GitHub
+    INPUT:
+        milestones: the milestones downloaded from the source, sorted by their number
+        destination_url: the root url for the GitHub API
+        destination: the team and repo '<team>/<repo>' to post milestones to
+    OUTPUT: A dict of milestone numbering that maps from source milestone numbers to destination milestone numbers
+    """
+    url = destination_url + "repos/" + destination + "/milestones"
+    # milestones created by a previous run are mapped from the journal rather than created again
+    milestone_map = github_duplication.JOURNAL.mapping(destination, 'milestones') \
+        if github_duplication.JOURNAL is not None else {}
+    # milestones are created in order, so destination numbers match the source
+    async for milestone in elements_of(milestones):
+        if milestone['number'] in milestone_map:
+            continue
+        # a milestone already in the destination is mapped rather than created again
+        existing_milestone = await client.claim(destination_url, destination, 'milestones', milestone['title'],
+                                                credentials)
+        if existing_milestone is not None:
+            milestone_map[milestone['number']] = existing_milestone['number']
+            continue
+        milestone_prime = {"title": milestone["title"], "state": milestone["state"],
+                           "description": milestone["description"], "due_on": milestone["due_on"]}
+        r = await client.post_req(url, json.dumps(milestone_prime), credentials)
+        if check_res(r):
+            returned_milestone = r.json()
+            milestone_map[milestone['number']] = returned_milestone['number']
+            journal(destination, 'milestones', milestone['number'], returned_milestone['number'])
+            github_duplication.INDEX.add(destination_url, destination, 'milestones', milestone['title'],
+                                         returned_milestone)
+        else:
+            record_failure('milestones', milestone['title'])
+    return milestone_map
+
+
+async def create_labels(client, labels, destination_url, destination, credentials):
+    """Post the labels missing from the destination, client.workers at a time
+    INPUT:
+        labels: the labels downloaded from the source
+        destination_url: the root url for the GitHub API
+        destination: the team and repo '<team>/<repo>' to post labels to
+    OUTPUT: Null
+    """
+    url = destination_url + "repos/" + destination + "/labels"
+
+    async def add(label):
+        if journaled(destination, 'labels', label["name"]):
+            return
+        if await client.claim(destination_url, destination, 'labels', label["name"], credentials) is not None:
+            return
+        log("Migrating Label: " + label["name"])
+        r = await client.post_req(url, json.dumps({"name": label["name"], "color": label["color"]}), credentials)
+        if check_res(r):
+            journal(destination, 'labels', label["name"])
+            github_duplication.INDEX.add(destination_url, destination, 'labels', label["name"], r.json())
+        else:
+            record_failure('labels', label["name"])
+
+    semaphore = asyncio.Semaphore(client.workers)
+    await asyncio.gather(*[bounded(semaphore, add(label)) async for label in elements_of(labels)])
+
+
+async def migrate_comments(client, source_comments_url, destination_comments_url, credentials, source_credentials,
+                           source_comments=None, destination=None, posted=0):
+    """Copy the comment thread of one issue/pr
+    INPUT:
+        source_comments_url: the url used to GET comments from the original issue/pr
+        destination_comments_url: the url used to POST comments to the migrated issue/pr
+        source_comments: the comments of the original issue/pr, if they were already downloaded
+        destination: the team and repo '<team>/<repo>' the comments are journaled under
+        posted: the number of comments of the thread already in the migrated issue/pr, which are skipped
+    OUTPUT: Null
+    """
+    if journaled(destination, 'threads', source_comments_url):
+        return
+    my_comments = source_comments
+    if my_comments is None:
+        pages = await client.get_pages(source_comments_url, source_credentials)
+        if pages is False:
+            # the thread is left unjournaled, so a resumed run migrates it
+            sys.stderr.write("ERROR: The comments of " + source_comments_url + " failed to be retrieved.\n")
+            record_failure('threads', source_comments_url)
+            return
+        my_comments = project('comments', pages)
+    if await append_comments(client, list(my_comments)[posted:], credentials, destination_comments_url, destination):
+        journal(destination, 'threads', source_comments_url)
+    else:
+        record_failure('threads', source_comments_url)
+
+
+async def append_comments(client, comments, credentials, comment_url, destination=None):
+    """Post comments to an issue/pr, in order
+    OUTPUT: True if every comment was posted (or journaled as posted by a previous run). False otherwise
+    """
+    complete = True
+    for comment in comments:
+        if 'id' in comment and journaled(destination, 'comments', comment['id']):
+            continue
+        body = comment['body'] + '\n\n' + 'Original by @' + comment['user']['login']
+        r = await client.post_req(comment_url, json.dumps({'body': body}), credentials)
+        if not check_res(r):
+            complete = False
+        elif 'id' in comment:
+            journal(destination, 'comments', comment['id'])
+    return complete
+
+
+async def post_issue(client, url, issue_prime, credentials):
+    """
+    INPUT:
+        url: the issues endpoint of the destination
+        issue_prime: the issue object returned by github_duplication.issue_payload
+    OUTPUT: the issue created in the destination, as returned by GitHub. False if it failed to be created
+    """
+    r = await client.post_req(url, json.dumps(issue_prime), credentials)
+    # if adding the issue failed because of the assignee field, remove it and repost with no assignee
+    if not check_res(r) and github_duplication.invalid_assignee(r, issue_prime):
+        r = await client.post_req(url, json.dumps(issue_prime), credentials)
+    my_data = r.json()
+    if 'comments_url' in my_data.keys():
+        return my_data
+    return False
+
+
+async def fold_thread(client, item, body, comments, source_credentials):
+    """
+    INPUT:
+        item: an issue/pr downloaded from the source
+        body: the body it is about to be created with
+        comments: a dict mapping the comments_url of each issue/pr to its already downloaded comments
+    OUTPUT: the body with the comment thread of the item folded into it if FOLD_COMMENTS is set, and the comments
+            still to be posted to the thread. None if they were not downloaded yet
+    """
+    thread = comments.get(item["comments_url"])
+    if not github_duplication.FOLD_COMMENTS:
+        return body, thread
+    if thread is None:
+        pages = await client.get_pages(item["comments_url"], source_credentials)
+        if pages is False:
+            # the thread is posted comment by comment instead, once it can be downloaded
+            return body, None
+        thread = project('comments', pages)
+    return github_duplication.fold_comments(body, thread)
+
+
+async def create_items(client, kind, items, destination_url, destination, milestones, labels, milestone_map,
+                       credentials, sameInstall, comments=None, source_credentials=None):
+    """Post issues or prs to GitHub, one at a time and in order, so destination numbers match the source. The
+    comment thread of each is migrated while the following ones are created, client.workers threads at a time
+    INPUT:
+        kind: 'issues' or 'prs'
+        items: the issues/prs downloaded from the source
+        destination_url: the root url for the GitHub API
+        destination: the team and repo '<team>/<repo>' to post to
+        milestones: a boolean flag indicating that milestones were included in this migration
+        labels: a boolean flag indicating that labels were included in this migration
+        comments: an optional dict mapping the comments_url of each issue/pr to its already downloaded comments
+        source_credentials: the credentials used to GET comments that were not already downloaded
+    OUTPUT: Null
+    """
+    url = destination_url + "repos/" + destination + ("/issues" if kind == 'issues' else "/pulls")
+    comments = comments or {}
+    source_credentials = source_credentials or credentials
+    semaphore = asyncio.Semaphore(client.workers)
+    threads = []
+
+    async def thread(source_comments_url, destination_number, source_comments, posted=0):
+        destination_comments_url = destination_url + "repos/" + destination + "/issues/" + \
+            str(destination_number) + "/comments"
+        migration = migrate_comments(client, source_comments_url, destination_comments_url, credentials,
+                                     source_credentials, source_comments, destination, posted)
+        if client.workers == 1:
+            # a single worker migrates each thread before the following issue/pr is created
+            await migration
+        else:
+            threads.append(asyncio.ensure_future(bounded(semaphore, migration)))
+
+    async for item in elements_of(items):
+        existing_item = await client.claim(destination_url, destination, kind, item['title'], credentials)
+        if existing_item is not None and item.get("comments") is not None and \
+                existing_item.get("comments", 0) >= item["comments"] and not journaled(destination, kind, item['number']):
+            # the issue/pr already exists in the destination with its whole comment thread
+            continue
+        if kind == 'issues':
+            item_prime = github_duplication.issue_payload(item, milestones, labels, milestone_map, sameInstall)
+        else:
+            item_prime = github_duplication.pr_payload(item, milestones, labels, milestone_map, sameInstall)
+        item_prime["body"], source_comments = await fold_thread(client, item, item_prime["body"], comments,
+                                                                source_credentials)
+        if journaled(destination, kind, item['number']):
+            # the issue/pr was created by a previous run, only its comment thread may be unfinished
+            await thread(item["comments_url"], github_duplication.JOURNAL.lookup(destination, kind, item['number']),
+                         source_comments)
+            continue
+        if existing_item is not None:
+            # the issue/pr already exists in the destination, only the comments its thread is missing are posted
+            await thread(item["comments_url"], existing_item["number"], source_comments,
+                         existing_item.get("comments", 0))
+            continue
+        if kind == 'prs':
+            # the branches of the destination are listed once, before the first pr is created, rather than
+            # discovered by failing writes
+            branches = await client.index(destination_url, destination, 'branches', credentials)
+            if github_duplication.missing_branches(item_prime, branches, destination):
+                continue
+        github_duplication.validate_payload(
+            item_prime, {validated: await client.index(destination_url, destination, validated, credentials)
+                         for validated in github_duplication.validated_kinds(item_prime)}, destination)
+        if kind == 'issues':
+            my_data = await post_issue(client, url, item_prime, credentials)
+        else:
+            r = await client.post_req(url, json.dumps(github_duplication.pull_payload(item_prime)), credentials)
+            my_data = check_res(r) and r.json()
+        if not my_data:
+            record_failure(kind, item['title'])
+            continue
+        journal(destination, kind, item['number'], my_data['number'])
+        github_duplication.INDEX.add(destination_url, destination, kind, item['title'], my_data)
+        await thread(item["comments_url"], my_data["number"], source_comments)
+        # the labels, assignees, milestone and state of a pr are set through its issue, in a single request
+        pr_update = kind == 'prs' and github_duplication.issue_update(item_prime)
+        if pr_update:
+            issue_url = destination_url + "repos/" + destination + "/issues/" + str(my_data["number"])
+            if not check_res(await client.patch_req(issue_url, json.dumps(pr_update), credentials)):
+                record_failure('prs', item['title'])
+    await asyncio.gather(*threads)
+
+
+async def populate_repository(client, template, destination_url, destination, credentials, sameInstall,
+                              source_credentials=None):
+    """Post the elements of a downloaded template to GitHub, every phase as a task started once the phases it
+    depends on (see github_duplication.PHASE_DEPENDENCIES) have finished
+    INPUT:
+        template: the dict of elements returned by download_template
+        destination_url: the root url for the GitHub API
+        destination: the team and repo '<team>/<repo>' to post to
+        sameInstall: a boolean flag indicating that the source and destination are the same GitHub installation
+        source_credentials: the credentials used to GET comments that were not downloaded with the template
+    OUTPUT: True if every element was migrated. False if any failed to be, or a phase was only partly migrated
+    """
+    phases = [phase for phase in github_duplication.PHASES if phase in template]
+    milestone_map = {}
+    failures = []
+    tasks = {}
+
+    async def run_phase(phase):
+        await asyncio.gather(*[tasks[dependency] for dependency in github_duplication.PHASE_DEPENDENCIES[phase]
+                               if dependency in tasks])
+        try:
+            # every request made while migrating the phase is attributed to it in the metrics
+            with migration_metrics.phase(phase):
+                await migrate_phase(phase)
+        except IOError as error:
+            # a listing streamed from the source failed part way, the elements it did not list are left to a resumed run
+            sys.stderr.write("ERROR: " + str(error) + " " + github_duplication.PHASE_NAMES[phase] +
+                             " were only partly migrated.\n")
+            failures.append((phase, None))
+
+    async def migrate_phase(phase):
+        elements = template[phase]
+        if not elements:
+            log("No " + github_duplication.PHASE_NAMES[phase] + " found. None migrated")
+        elif phase == 'milestones':
+            milestone_map.update(await create_milestones(client, elements, destination_url, destination, credentials))
+        elif phase == 'labels':
+            await create_labels(client, elements, destination_url, destination, credentials)
+        elif phase == 'collaborators':
+            await create_collaborators(client, elements, destination_url, destination, credentials)
+        elif phase == 'releases':
+            # releases stream their binary assets from the source into the destination, which is left to the
+            # pooled threads of github_duplication rather than held on the event loop
+            await asyncio.to_thread(github_duplication.create_releases, elements, destination_url, destination,
+                                    credentials, source_credentials)
+        else:
+            await create_items(client, phase, elements, destination_url, destination, 'milestones' in template,
+                               'labels' in template, milestone_map, credentials, sameInstall,
+                               template.get('comments'), source_credentials)
+
+    # the elements failing to be migrated are recorded from the tasks of the phases, and the tasks and threads they
+    # start, which all copy the context they were started from
+    token = github_duplication.FAILURES.set(failures)
+    try:
+        # phases are started in order, so the tasks of their dependencies already exist
+        for phase in phases:
+            tasks[phase] = asyncio.ensure_future(run_phase(phase))
+    finally:
+        github_duplication.FAILURES.reset(token)
+    await asyncio.gather(*tasks.values())
+    if failures:
+        sys.stderr.write("ERROR: " + str(len(failures)) + " elements failed to be migrated to " + destination + ".\n")
+    return not failures
+
+
+async def migrate(client, source_url, source, destinations, credentials, sameInstall, source_credentials=None,
+                  phases=github_duplication.PHASES, template=None):
+    """Download a repository once and populate every destination with it concurrently
+    INPUT:
+        destinations: a list of tuples of the root url for the GitHub API and the team and repo '<team>/<repo>'
+                      of each repository to populate
+        template: the already downloaded elements of the source, if any
+    OUTPUT: the downloaded template. False if it failed to be retrieved
+    """
+    source_credentials = source_credentials or credentials
+    if template is None:
+        template = await download_template(client, source_url, source, source_credentials, phases)
+        if template is False:
+            return False
+    await asyncio.gather(*[populate_repository(client, template, destination_url, destination, credentials,
+                                               sameInstall, source_credentials)
+                           for destination_url, destination in destinations])
+    return template
+
+
+def run(source_url, source, destinations, credentials, sameInstall, source_credentials=None,
+        phases=github_duplication.PHASES, template=None, concurrency=CONCURRENCY):
+    """The synchronous wrapper of migrate, running it on a new event loop through an AsyncGitHub
+    OUTPUT: the same as migrate
+    """
+    async def main():
+        client = AsyncGitHub(concurrency)
+        try:
+            return await migrate(client, source_url, source, destinations, credentials, sameInstall,
+                                 source_credentials, phases, template)
+        finally:
+            await client.close()
+
+    return asyncio.run(main())
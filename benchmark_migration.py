@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Offline benchmark of the github_duplication migration pipeline.
+
+Each run serves a synthetic template from fake_github_api, then downloads it and populates a fresh destination
+through the same functions main uses, reporting the wall-clock time and request throughput of the migration.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+
+import fake_github_api
+import github_duplication
+import migration_metrics
+
+TEMPLATE = "owner/template"
+CREDENTIALS = {'user_name': 'owner', 'token': 'benchmark-token'}
+
+
+def configure(workers, write_interval):
+    """Reset the module state of github_duplication between runs, so no run inherits warm connections, budgets or indexes"""
+    github_duplication.close_sessions()
+    github_duplication.SCHEDULER = github_duplication.RequestScheduler()
+    github_duplication.INDEX = github_duplication.DestinationIndex()
+    github_duplication.WORKERS = workers
+    github_duplication.WRITE_INTERVAL = write_interval
+    github_duplication.POOL_SIZE = max(github_duplication.POOL_SIZE, workers + len(github_duplication.PHASES))
+    migration_metrics.reset()
+
+
+def run(size, args):
+    """
+    INPUT:
+        size: the number of issues in the synthetic template
+        args: the parsed command line arguments
+    OUTPUT: a dict of the measurements of one migration of the template
+    """
+    api = fake_github_api.FakeGitHub(args.latency, args.rateLimit, args.rateLimitWindow, args.writeLimit)
+    fake_github_api.populate(api, TEMPLATE, issues=size, comments=args.comments)
+    server = fake_github_api.serve(api)
+    root = "http://127.0.0.1:" + str(server.server_address[1]) + "/"
+    configure(args.workers, args.writeInterval)
+    destination = "owner/destination-" + str(size)
+    try:
+        started = time.time()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            template = github_duplication.download_template(root, TEMPLATE, CREDENTIALS)
+            github_duplication.populate_repository(template, root, destination, CREDENTIALS, True, CREDENTIALS)
+        elapsed = time.time() - started
+    finally:
+        server.shutdown()
+        server.server_close()
+    migrated = api.repository(destination)
+    phases = migration_metrics.aggregate()
+    return {'issues': size, 'comments': args.comments, 'seconds': elapsed, 'calls': api.calls,
+            'calls_per_second': api.calls / elapsed, 'issues_per_second': size / elapsed,
+            'migrated_issues': len(migrated["issues"]),
+            'migrated_comments': sum(len(thread) for thread in migrated["comments"].values()),
+            'throttled_seconds': sum(totals['throttled'] for totals in phases.values()),
+            'phases': {name: {'calls': totals['calls'], 'p50': totals['p50'], 'p95': totals['p95']}
+                       for name, totals in phases.items()}}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure the end-to-end throughput of github_duplication against a local fake GitHub API, for synthetic templates of several sizes.')
+    parser.add_argument('--sizes', '-s', nargs='+', default=[10, 1000, 10000], type=int,
+                        help='The number of issues of each synthetic template. Defaults to 10 1000 10000.')
+    parser.add_argument('--comments', '-c', nargs='?', default=2, type=int,
+                        help='The number of comments on each issue. Defaults to 2.')
+    parser.add_argument('--latency', '-l', nargs='?', default=0.0, type=float,
+                        help='Seconds the fake API adds to every response, to model the network. Defaults to 0.')
+    parser.add_argument('--workers', '-w', nargs='?', default=github_duplication.WORKERS, type=int,
+                        help='The number of comment threads migrated concurrently. Defaults to ' + str(github_duplication.WORKERS) + '.')
+    parser.add_argument('--writeInterval', '-wi', nargs='?', default=0.0, type=float,
+                        help='The minimum number of seconds between two writes. Defaults to 0, as the fake API only enforces the --writeLimit given to it.')
+    parser.add_argument('--rateLimit', '-rl', nargs='?', type=int,
+                        help='Requests the fake API allows per token and window. Unlimited by default.')
+    parser.add_argument('--rateLimitWindow', '-rw', nargs='?', default=3600, type=int,
+                        help='Seconds before the fake API resets a token\'s rate limit. Defaults to 3600.')
+    parser.add_argument('--writeLimit', '-wl', nargs='?', type=int,
+                        help='Writes the fake API allows per token and minute. Unlimited by default.')
+    parser.add_argument('--json', '-j', nargs='?', type=str,
+                        help='A file to write every measurement to, as JSON.')
+    args = parser.parse_args()
+
+    results = []
+    print("%8s %10s %8s %10s %10s %10s" % ("issues", "seconds", "calls", "calls/s", "issues/s", "throttled"))
+    for size in args.sizes:
+        result = run(size, args)
+        results.append(result)
+        print("%8d %10.2f %8d %10.1f %10.1f %9.1fs" % (size, result['seconds'], result['calls'],
+                                                      result['calls_per_second'], result['issues_per_second'],
+                                                      result['throttled_seconds']))
+        if result['migrated_issues'] != size or result['migrated_comments'] != size * args.comments:
+            sys.stderr.write("WARNING: Only " + str(result['migrated_issues']) + " issues and " +
+                             str(result['migrated_comments']) + " comments were migrated.\n")
+    github_duplication.close_sessions()
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump({'arguments': vars(args), 'results': results}, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
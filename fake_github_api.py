@@ -0,0 +1,653 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+A local, in-memory stand-in for the GitHub REST endpoints used by github_duplication.
+
+Serves milestones, labels, collaborators, assignees, issues, pulls, releases and their assets, branches and issue comments for any number
+of repositories, and generates repositories from templates, with configurable latency, page sizes and (primary and
+secondary) rate limits, so migrations can be run and measured without a network, tokens or rate limit. The few
+GraphQL queries of github_graphql are answered from the same repositories.
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote, urlencode
+
+# Page size used when a listing does not ask for one, and the largest one it may ask for, as on GitHub
+DEFAULT_PER_PAGE = 30
+MAX_PER_PAGE = 100
+
+# release assets are uploaded under /api/uploads, as on GitHub Enterprise, rather than to a separate uploads host
+REPOSITORY_PATH = re.compile(r"^(?:/api/v3|/api/uploads)?/repos/(?P<repository>[^/]+/[^/]+)(?P<endpoint>/.*)?$")
+
+
+class FakeGitHub(object):
+    """
+    The state of the fake API: its repositories, the rate limit budget of every token and the calls served.
+    INPUT:
+        latency: seconds added to every response
+        rate_limit: requests allowed per token and window, None for no primary rate limit
+        rate_limit_window: seconds before a token's budget resets
+        write_limit: writes allowed per token and minute, None for no secondary rate limit
+        generation_delay: seconds a repository generated from a template stays empty before its content is copied
+    """
+
+    def __init__(self, latency=0.0, rate_limit=None, rate_limit_window=3600, write_limit=None, generation_delay=0.0):
+        self.latency = latency
+        self.generation_delay = generation_delay
+        # the most nodes a page of a GraphQL connection holds, whatever the query asks for
+        self.graphql_page_size = MAX_PER_PAGE
+        self.rate_limit = rate_limit
+        self.rate_limit_window = rate_limit_window
+        self.write_limit = write_limit
+        self.repositories = {}
+        self.budgets = {}
+        self.writes = {}
+        self.calls = 0
+        # the method and path, with its query, of every request served, in the order they were served
+        self.requests = []
+        # the requests made to fail, see fail
+        self.faults = []
+        # the repositories each restricted token can see, see restrict
+        self.access = {}
+        self.lock = threading.Lock()
+
+    def repository(self, full_name):
+        """
+        INPUT: the team and repo '<team>/<repo>' of a repository
+        OUTPUT: the state of the repository, created empty on first use
+        """
+        if full_name not in self.repositories:
+            owner, name = full_name.split("/", 1)
+            self.repositories[full_name] = {"owner": owner, "name": name, "milestones": [], "labels": [],
+                                            "collaborators": {}, "issues": [], "comments": {}, "releases": [],
+                                            "assets": {}, "branches": ["master"], "next_id": 1}
+        return self.repositories[full_name]
+
+    def fail(self, method, pattern, status=502, times=None, after=0):
+        """Make requests fail, e.g. to test how an interrupted migration is resumed
+        INPUT:
+            method: the method of the requests to fail
+            pattern: a regular expression searched for in the path, with its query, of the requests to fail
+            status: the status the requests fail with
+            times: the number of requests to fail, None to fail every matching request until the faults are cleared
+            after: the number of matching requests served as usual before they start failing
+        OUTPUT: Null
+        """
+        with self.lock:
+            self.faults.append({'method': method, 'pattern': re.compile(pattern), 'status': status, 'times': times,
+                                'after': after})
+
+    def restrict(self, token, repositories):
+        """Let a token see only the given repositories '<team>/<repo>', its requests to any other are answered
+        with a 404, as GitHub answers requests for a private repository the token cannot read
+        """
+        with self.lock:
+            self.access[token] = set(repositories)
+
+    def allowed(self, authorization, path):
+        """
+        INPUT: the Authorization header and the path of a request
+        OUTPUT: False if the request is made with a restricted token to a repository it cannot see. True otherwise
+        """
+        if not self.access or not authorization.startswith("Basic "):
+            return True
+        token = base64.b64decode(authorization[6:]).decode("utf-8").rpartition(":")[2]
+        match = REPOSITORY_PATH.match(path)
+        return token not in self.access or match is None or match.group(1) in self.access[token]
+
+    def fault(self, method, path):
+        """
+        INPUT: the method and path, with its query, of a request
+        OUTPUT: the status to fail the request with, None to serve it
+        """
+        for fault in self.faults:
+            if fault['method'] == method and fault['times'] != 0 and fault['pattern'].search(path):
+                if fault['after']:
+                    fault['after'] -= 1
+                    continue
+                if fault['times'] is not None:
+                    fault['times'] -= 1
+                return fault['status']
+        return None
+
+    def throttle(self, token, write):
+        """
+        INPUT:
+            token: the Authorization header of a request
+            write: a boolean flag indicating that the request creates or modifies content
+        OUTPUT: the rate limit headers of the response, and the status and message of the error to return, if any
+        """
+        headers = {}
+        if self.rate_limit is not None:
+            now = int(time.time())
+            remaining, reset = self.budgets.get(token, (self.rate_limit, now + self.rate_limit_window))
+            if now >= reset:
+                remaining, reset = self.rate_limit, now + self.rate_limit_window
+            if remaining <= 0:
+                headers = {"X-RateLimit-Limit": str(self.rate_limit), "X-RateLimit-Remaining": "0",
+                           "X-RateLimit-Reset": str(reset)}
+                return headers, 403, "API rate limit exceeded"
+            remaining -= 1
+            self.budgets[token] = (remaining, reset)
+            headers = {"X-RateLimit-Limit": str(self.rate_limit), "X-RateLimit-Remaining": str(remaining),
+                       "X-RateLimit-Reset": str(reset)}
+        if write and self.write_limit is not None:
+            now = time.time()
+            recent = [t for t in self.writes.get(token, []) if t > now - 60]
+            if len(recent) >= self.write_limit:
+                headers["Retry-After"] = str(int(recent[0] + 60 - now) + 1)
+                return headers, 403, "You have exceeded a secondary rate limit"
+            recent.append(now)
+            self.writes[token] = recent
+        return headers, None, None
+
+
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeGitHub/1.0"
+    # headers and body are written separately, which would otherwise stall on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload, headers):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_bytes(self, status, payload, headers):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_not_modified(self, headers):
+        self.send_response(304)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def handle_request(self, method):
+        api = self.server.api
+        if api.latency:
+            time.sleep(api.latency)
+        parts = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        # the body is always read, so the connection can be kept alive even when the request is refused
+        length = int(self.headers.get("Content-Length") or 0)
+        data = self.rfile.read(length) if length else b""
+        # release assets are uploaded as raw bytes, everything else as JSON
+        if "json" in self.headers.get("Content-Type", "application/json"):
+            data = json.loads(data.decode("utf-8") or "{}") if data else {}
+        binary = self.headers.get("Accept") == "application/octet-stream"
+        base = "http://" + self.headers.get("Host", "localhost")
+        with api.lock:
+            api.calls += 1
+            api.requests.append((method, self.path))
+            headers, status, message = api.throttle(self.headers.get("Authorization", ""), method != "GET")
+            if status is None:
+                status = api.fault(method, self.path)
+                message = "Injected failure"
+            if status is None and not api.allowed(self.headers.get("Authorization", ""), parts.path):
+                status, message = 404, "Not Found"
+            if status is None:
+                status, payload = route(api, base, method, parts.path, query, data, binary)
+            else:
+                payload = {"message": message}
+        if isinstance(payload, bytes):
+            self.send_bytes(status, payload, headers)
+            return
+        if isinstance(payload, list):
+            payload, link = paginate(base + parts.path, query, payload)
+            if link:
+                headers["Link"] = link
+        if method == "GET" and status == 200:
+            headers["ETag"] = '"' + hashlib.sha1(json.dumps(payload).encode("utf-8")).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == headers["ETag"]:
+                self.send_not_modified(headers)
+                return
+        self.send_json(status, payload, headers)
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_PUT(self):
+        self.handle_request("PUT")
+
+    def do_PATCH(self):
+        self.handle_request("PATCH")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+
+class FakeGitHubServer(ThreadingHTTPServer):
+    # concurrent clients open many connections at once, which the default backlog of 5 would reset
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def paginate(url, query, items):
+    """
+    INPUT:
+        url: the url of a listing, without its query
+        query: the query of the listing
+        items: every item listed
+    OUTPUT: the items on the requested page, and the Link header pointing to the next page (None on the last page)
+    """
+    per_page = min(int(query.get("per_page", DEFAULT_PER_PAGE)), MAX_PER_PAGE)
+    page = int(query.get("page", 1))
+    start = (page - 1) * per_page
+    link = None
+    if start + per_page < len(items):
+        link = '<' + url + '?' + urlencode(dict(query, page=str(page + 1))) + '>; rel="next"'
+    return items[start:start + per_page], link
+
+
+def timestamp():
+    """OUTPUT: the current time, in the ISO 8601 format of the updated_at and since fields"""
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+def label_names(labels):
+    """Labels may be posted as names or as label objects"""
+    return [{"name": label if isinstance(label, str) else label["name"]} for label in labels]
+
+
+def asset_content(asset_id, size):
+    """OUTPUT: the synthetic content of a release asset of the given size"""
+    pattern = hashlib.sha1(str(asset_id).encode("utf-8")).digest()
+    return (pattern * (size // len(pattern) + 1))[:size]
+
+
+def route(api, base, method, path, query, data, binary=False):
+    """
+    INPUT:
+        api: the FakeGitHub state
+        base: the '<scheme>://<host>' the request was sent to
+        method, path, query, data: the request
+        binary: a boolean flag indicating that the request accepts the raw content of a release asset
+    OUTPUT: the status and the JSON payload of the response, or the bytes of a release asset.
+            A list payload is paginated by the caller
+    """
+    if path == "/api/graphql" and method == "POST":
+        return graphql(api, data)
+    match = REPOSITORY_PATH.match(path)
+    if not match:
+        return 404, {"message": "Not Found"}
+    repository = api.repository(match.group("repository"))
+    endpoint = match.group("endpoint") or ""
+    prefix = base + "/repos/" + match.group("repository")
+
+    def issue_view(issue):
+        view = dict(issue)
+        view["comments_url"] = prefix + "/issues/" + str(issue["number"]) + "/comments"
+        view["comments"] = len(repository["comments"][issue["number"]])
+        return view
+
+    def asset_view(asset):
+        view = dict(asset)
+        view["url"] = prefix + "/releases/assets/" + str(asset["id"])
+        view["browser_download_url"] = view["url"]
+        return view
+
+    def release_view(release):
+        view = dict(release)
+        view["upload_url"] = base + "/api/uploads" + prefix[len(base):] + "/releases/" + str(release["id"]) + \
+            "/assets{?name,label}"
+        view["assets"] = [asset_view(asset) for asset in release["assets"]]
+        return view
+
+    def new_issue(fields):
+        number = len(repository["issues"]) + 1
+        issue = dict({"number": number, "id": number, "assignee": None, "assignees": [], "milestone": None,
+                      "labels": [], "state": "open", "user": {"login": repository["owner"]},
+                      "updated_at": timestamp()}, **fields)
+        repository["issues"].append(issue)
+        repository["comments"][number] = []
+        return issue
+
+    if endpoint == "/generate" and method == "POST":
+        full_name = data["owner"] + "/" + data["name"]
+        if full_name in api.repositories:
+            return 422, {"message": "Repository creation failed.",
+                         "errors": [{"resource": "Repository", "code": "custom", "field": "name",
+                                     "message": "name already exists on this account"}]}
+        generated = api.repository(full_name)
+        # the content of the template is copied after the repository is answered, as on GitHub
+        generated["branches"] = []
+        generated["ready_at"] = time.time() + api.generation_delay
+        generated["template_branches"] = repository["branches"] if data.get("include_all_branches") else \
+            repository["branches"][:1]
+        return 201, {"full_name": full_name, "name": data["name"], "owner": {"login": data["owner"]},
+                     "private": data.get("private", False), "default_branch": repository["branches"][0]}
+    if "ready_at" in repository and time.time() >= repository["ready_at"]:
+        repository["branches"] = repository.pop("template_branches") + repository["branches"]
+        del repository["ready_at"]
+    if endpoint == "" and method == "GET":
+        return 200, {"full_name": repository["owner"] + "/" + repository["name"],
+                     "default_branch": repository["branches"][0]}
+    if endpoint == "/milestones":
+        if method == "GET":
+            state = query.get("state", "open")
+            return 200, [milestone for milestone in repository["milestones"]
+                         if state == "all" or milestone["state"] == state]
+        milestone = {"number": len(repository["milestones"]) + 1, "title": data["title"],
+                     "state": data.get("state", "open"), "description": data.get("description"),
+                     "due_on": data.get("due_on")}
+        repository["milestones"].append(milestone)
+        return 201, milestone
+    if endpoint == "/labels":
+        if method == "GET":
+            return 200, list(repository["labels"])
+        label = {"name": data["name"], "color": data.get("color", "ededed")}
+        repository["labels"].append(label)
+        return 201, label
+    match = re.match(r"^/(?P<kind>milestones|labels|releases)/(?P<key>[^/]+)$", endpoint)
+    if match and method == "PATCH":
+        key = "number" if match.group("kind") == "milestones" else "name" if match.group("kind") == "labels" else "id"
+        for element in repository[match.group("kind")]:
+            if str(element[key]) == unquote(match.group("key")):
+                element.update(data)
+                return 200, element
+        return 404, {"message": "Not Found"}
+    if endpoint == "/collaborators" and method == "GET":
+        return 200, list(repository["collaborators"].values())
+    match = re.match(r"^/collaborators/(?P<login>[^/]+)$", endpoint)
+    if match and method == "PUT":
+        login = match.group("login")
+        repository["collaborators"][login] = {"login": login, "id": len(repository["collaborators"]) + 1,
+                                              "permissions": {"admin": data.get("permission") == "admin"}}
+        return 201, {}
+    if endpoint == "/assignees" and method == "GET":
+        # the owner of a repository can always be assigned, as can its collaborators
+        logins = [repository["owner"]] + [login for login in repository["collaborators"] if login != repository["owner"]]
+        return 200, [{"login": login} for login in logins]
+    if endpoint == "/branches" and method == "GET":
+        return 200, [{"name": branch} for branch in repository["branches"]]
+    if endpoint == "/issues":
+        if method == "GET":
+            state = query.get("state", "open")
+            since = query.get("since", "")
+            return 200, [issue_view(issue) for issue in repository["issues"]
+                         if (state == "all" or issue["state"] == state) and issue["updated_at"] >= since]
+        issue = new_issue({"title": data["title"], "body": data.get("body"), "state": data.get("state", "open"),
+                           "assignee": {"login": data["assignee"]} if data.get("assignee") else None,
+                           "milestone": {"number": data["milestone"]} if data.get("milestone") else None,
+                           "labels": label_names(data.get("labels", []))})
+        return 201, issue_view(issue)
+    if endpoint == "/pulls":
+        if method == "GET":
+            return 200, [issue_view(issue) for issue in repository["issues"] if "pull_request" in issue]
+        head = data["head"].split(":")[-1]
+        for field, branch in (("head", head), ("base", data.get("base"))):
+            if branch not in repository["branches"]:
+                return 422, {"message": "Validation Failed", "errors": [{"field": field, "code": "invalid"}]}
+        pr = new_issue({"title": data["title"], "body": data.get("body"), "pull_request": {},
+                        "head": {"label": repository["owner"] + ":" + head, "ref": head},
+                        "base": {"ref": data.get("base")}})
+        return 201, issue_view(pr)
+    match = re.match(r"^/issues/(?P<number>\d+)(?P<comments>/comments)?$", endpoint)
+    if match:
+        number = int(match.group("number"))
+        if number not in repository["comments"]:
+            return 404, {"message": "Not Found"}
+        issue = repository["issues"][number - 1]
+        if match.group("comments"):
+            if method == "GET":
+                return 200, list(repository["comments"][number])
+            comment = {"id": repository["next_id"], "body": data["body"], "user": {"login": repository["owner"]}}
+            repository["next_id"] += 1
+            repository["comments"][number].append(comment)
+            issue["updated_at"] = timestamp()
+            return 201, comment
+        if method != "GET":
+            for key in ("title", "body", "state"):
+                if key in data:
+                    issue[key] = data[key]
+            if "milestone" in data:
+                issue["milestone"] = {"number": data["milestone"]} if data["milestone"] else None
+            if "labels" in data:
+                issue["labels"] = label_names(data["labels"])
+            if "assignees" in data:
+                issue["assignees"] = [{"login": login} for login in data["assignees"]]
+            issue["updated_at"] = timestamp()
+        return 200, issue_view(issue)
+    if endpoint == "/releases":
+        if method == "GET":
+            return 200, [release_view(release) for release in repository["releases"]]
+        release = dict(data, id=repository["next_id"], assets=[])
+        repository["next_id"] += 1
+        repository["releases"].append(release)
+        return 201, release_view(release)
+    match = re.match(r"^/releases/(?P<id>\d+)/assets$", endpoint)
+    if match and method == "POST":
+        release = next((release for release in repository["releases"] if release["id"] == int(match.group("id"))),
+                       None)
+        if release is None:
+            return 404, {"message": "Not Found"}
+        if any(asset["name"] == query.get("name") for asset in release["assets"]):
+            return 422, {"message": "Validation Failed",
+                         "errors": [{"resource": "ReleaseAsset", "code": "already_exists", "field": "name"}]}
+        asset = {"id": repository["next_id"], "name": query.get("name"), "label": query.get("label"),
+                 "content_type": "application/octet-stream", "size": len(data), "state": "uploaded"}
+        repository["next_id"] += 1
+        repository["assets"][asset["id"]] = data
+        release["assets"].append(asset)
+        return 201, asset_view(asset)
+    match = re.match(r"^/releases/assets/(?P<id>\d+)$", endpoint)
+    if match:
+        asset_id = int(match.group("id"))
+        for release in repository["releases"]:
+            for asset in release["assets"]:
+                if asset["id"] != asset_id:
+                    continue
+                if method == "DELETE":
+                    release["assets"].remove(asset)
+                    repository["assets"].pop(asset_id, None)
+                    return 204, b""
+                if binary:
+                    return 200, repository["assets"][asset_id]
+                return 200, asset_view(asset)
+    return 404, {"message": "Not Found"}
+
+
+def graphql(api, data):
+    """
+    INPUT:
+        api: the FakeGitHub state
+        data: the body of a query to the GraphQL endpoint
+    OUTPUT: the status and the JSON payload answering the query. Only the queries of github_graphql are answered:
+            the open milestones, labels, issues and pull requests of a repository, and the comments of one of its
+            issues/prs, each a connection of at most graphql_page_size nodes after its cursor
+    """
+    query, variables = data["query"], data.get("variables") or {}
+    full_name = variables["owner"] + "/" + variables["name"]
+    if full_name not in api.repositories:
+        return 200, {"data": {"repository": None},
+                     "errors": [{"type": "NOT_FOUND", "message": "Could not resolve to a Repository."}]}
+    repository = api.repositories[full_name]
+    colors = {label["name"]: label["color"] for label in repository["labels"]}
+
+    def connection(nodes, first, cursor=None):
+        # cursors are the offsets of the nodes following a page
+        start = int(cursor or 0)
+        end = start + min(first, api.graphql_page_size)
+        return {"pageInfo": {"hasNextPage": end < len(nodes), "endCursor": str(end)}, "nodes": nodes[start:end]}
+
+    def comments(number, cursor=None):
+        return connection([{"databaseId": comment["id"], "body": comment["body"], "author": comment["user"]}
+                           for comment in repository["comments"][number]], MAX_PER_PAGE, cursor)
+
+    def item_node(issue):
+        node = {"number": issue["number"], "title": issue["title"], "body": issue["body"],
+                "state": issue["state"].upper(), "author": issue["user"],
+                "assignees": {"nodes": issue["assignees"]}, "milestone": issue["milestone"],
+                "labels": {"nodes": [{"name": label["name"], "color": colors.get(label["name"], "ededed")}
+                                     for label in issue["labels"]]},
+                "comments": comments(issue["number"])}
+        if "pull_request" in issue:
+            node.update({"headRefName": issue["head"]["ref"], "baseRefName": issue["base"]["ref"],
+                         "headRepositoryOwner": {"login": repository["owner"]}})
+        return node
+
+    first = int(re.search(r"\(first: (\d+), after: \$cursor", query).group(1))
+    cursor = variables.get("cursor")
+    if "issueOrPullRequest(" in query:
+        result = {"issueOrPullRequest": {"comments": comments(variables["number"], cursor)}}
+    elif "pullRequests(" in query:
+        result = {"pullRequests": connection([item_node(issue) for issue in repository["issues"]
+                                              if "pull_request" in issue and issue["state"] == "open"], first, cursor)}
+    elif "issues(" in query:
+        result = {"issues": connection([item_node(issue) for issue in repository["issues"]
+                                        if "pull_request" not in issue and issue["state"] == "open"], first, cursor)}
+    elif "milestones(" in query:
+        result = {"milestones": connection([{"number": milestone["number"], "title": milestone["title"],
+                                             "state": milestone["state"].upper(),
+                                             "description": milestone["description"], "dueOn": milestone["due_on"]}
+                                            for milestone in repository["milestones"] if milestone["state"] == "open"],
+                                           first, cursor)}
+    elif "labels(" in query:
+        result = {"labels": connection([{"name": label["name"], "color": label["color"]}
+                                        for label in repository["labels"]], first, cursor)}
+    else:
+        return 200, {"errors": [{"message": "Unsupported query."}]}
+    return 200, {"data": {"repository": result}}
+
+
+def populate(api, full_name, issues=10, comments=2, milestones=3, labels=5, releases=1, assets=0,
+             asset_size=1024 * 1024, prs=0):
+    """Fill a repository of the fake API with a synthetic template
+    INPUT:
+        api: the FakeGitHub state
+        full_name: the team and repo '<team>/<repo>' of the template
+        issues: the number of issues, each with the given number of comments
+        prs: the number of prs following the issues, each from its own branch into master
+        assets: the number of assets of every release, each of asset_size bytes
+    OUTPUT: the state of the repository
+    """
+    repository = api.repository(full_name)
+    owner = repository["owner"]
+    repository["collaborators"][owner] = {"login": owner, "id": 1, "permissions": {"admin": True}}
+    for number in range(1, milestones + 1):
+        repository["milestones"].append({"number": number, "title": "Milestone " + str(number), "state": "open",
+                                         "description": "Milestone " + str(number), "due_on": None})
+    for index in range(labels):
+        repository["labels"].append({"name": "label-" + str(index), "color": "0e8a16"})
+    for number in range(1, issues + 1):
+        repository["issues"].append({
+            "number": number, "id": number, "title": "Issue " + str(number), "body": "Task " + str(number),
+            "state": "open", "user": {"login": owner}, "assignee": {"login": owner}, "assignees": [{"login": owner}],
+            "milestone": {"number": number % milestones + 1} if milestones else None,
+            "labels": [{"name": "label-" + str(number % labels), "color": "0e8a16"}] if labels else [],
+            "updated_at": timestamp()})
+        repository["comments"][number] = [
+            {"id": repository["next_id"] + index, "body": "Comment " + str(index), "user": {"login": owner}}
+            for index in range(comments)]
+        repository["next_id"] += comments
+    for number in range(issues + 1, issues + prs + 1):
+        branch = "feature-" + str(number)
+        repository["branches"].append(branch)
+        repository["issues"].append({
+            "number": number, "id": number, "title": "Pull request " + str(number), "body": "Change " + str(number),
+            "state": "open", "user": {"login": owner}, "assignee": {"login": owner}, "assignees": [{"login": owner}],
+            "milestone": None, "labels": [{"name": "label-" + str(number % labels), "color": "0e8a16"}] if labels else [],
+            "pull_request": {}, "head": {"label": owner + ":" + branch, "ref": branch}, "base": {"ref": "master"},
+            "updated_at": timestamp()})
+        repository["comments"][number] = [
+            {"id": repository["next_id"] + index, "body": "Review " + str(index), "user": {"login": owner}}
+            for index in range(comments)]
+        repository["next_id"] += comments
+    for index in range(releases):
+        release = {"id": repository["next_id"], "tag_name": "v" + str(index), "target_commitish": "master",
+                   "name": "Release " + str(index), "body": "", "prerelease": False, "assets": []}
+        repository["next_id"] += 1
+        for number in range(assets):
+            asset = {"id": repository["next_id"], "name": "dataset-" + str(index) + "-" + str(number) + ".bin",
+                     "label": None, "content_type": "application/octet-stream", "size": asset_size,
+                     "state": "uploaded"}
+            repository["assets"][asset["id"]] = asset_content(asset["id"], asset_size)
+            repository["next_id"] += 1
+            release["assets"].append(asset)
+        repository["releases"].append(release)
+    return repository
+
+
+def serve(api, host="127.0.0.1", port=0):
+    """
+    INPUT:
+        api: the FakeGitHub state to serve
+        port: the port to listen on, 0 picks a free one
+    OUTPUT: the running server, serving from a daemon thread. Its url is 'http://<host>:<server.server_address[1]>/'
+    """
+    server = FakeGitHubServer((host, port), FakeGitHubHandler)
+    server.api = api
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Serve a fake GitHub REST API holding a synthetic template repository, for running migrations offline.')
+    parser.add_argument('--port', '-p', nargs='?', default=8000, type=int,
+                        help='The port to listen on. Defaults to 8000.')
+    parser.add_argument('--template', '-t', nargs='?', default='owner/template', type=str,
+                        help='The team and repo of the synthetic template: <team_name>/<repo_name>. Defaults to owner/template.')
+    parser.add_argument('--issues', '-i', nargs='?', default=100, type=int,
+                        help='The number of issues in the template. Defaults to 100.')
+    parser.add_argument('--comments', '-c', nargs='?', default=2, type=int,
+                        help='The number of comments on each issue. Defaults to 2.')
+    parser.add_argument('--prs', '-pr', nargs='?', default=0, type=int,
+                        help='The number of prs in the template, each from its own branch. Defaults to 0.')
+    parser.add_argument('--assets', '-a', nargs='?', default=0, type=int,
+                        help='The number of assets of the template\'s release. Defaults to 0.')
+    parser.add_argument('--assetSize', '-as', nargs='?', default=1024 * 1024, type=int,
+                        help='The number of bytes of every release asset. Defaults to 1 MiB.')
+    parser.add_argument('--latency', '-l', nargs='?', default=0.0, type=float,
+                        help='Seconds added to every response. Defaults to 0.')
+    parser.add_argument('--rateLimit', '-rl', nargs='?', type=int,
+                        help='Requests allowed per token and rate limit window. Unlimited by default.')
+    parser.add_argument('--rateLimitWindow', '-rw', nargs='?', default=3600, type=int,
+                        help='Seconds before a token\'s rate limit resets. Defaults to 3600.')
+    parser.add_argument('--writeLimit', '-wl', nargs='?', type=int,
+                        help='Writes allowed per token and minute, beyond which a secondary rate limit is returned. Unlimited by default.')
+    parser.add_argument('--generationDelay', '-gd', nargs='?', default=0.0, type=float,
+                        help='Seconds a repository generated from the template stays empty before its content is copied. Defaults to 0.')
+    args = parser.parse_args()
+
+    api = FakeGitHub(args.latency, args.rateLimit, args.rateLimitWindow, args.writeLimit, args.generationDelay)
+    populate(api, args.template, args.issues, args.comments, assets=args.assets, asset_size=args.assetSize,
+             prs=args.prs)
+    server = serve(api, port=args.port)
+    print("Serving a fake GitHub API with the template " + args.template + " on http://127.0.0.1:" +
+          str(server.server_address[1]) + "/")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,662 @@
 #!/usr/bin/env python3
 # coding=utf-8
 
-import requests
 import json
 import argparse
+import collections
 import sys
+import os
+import re
+import hashlib
+import random
+import time
+import threading
+import contextvars
+import migration_metrics
+from migration_records import project
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlencode
 
 VERBOSE = False
 
+# Suppresses the progress and error messages of the migration, for programs embedding it through migrate
+QUIET = False
+
+# Root url of the API of github.com, the default source and destination of a migration
+GITHUB_API_ROOT = 'https://api.github.com/'
+
+# Size of the keep-alive connection pool held open for each GitHub API root
+POOL_SIZE = 10
+
+# Number of issue/pr comment threads migrated concurrently, 1 migrates them one at a time
+WORKERS = 1
+
+# One pooled session per API root, shared by every download_* and create_* call
+SESSIONS = {}
+SESSIONS_LOCK = threading.Lock()
+
+# Number of items requested per page when listing, the largest page size the API allows
+PER_PAGE = 100
+
+# Seconds kept between two writes made with the same token, which keeps them under the
+# 80 content-creating requests per minute allowed by GitHub's secondary rate limits.
+WRITE_INTERVAL = 0.75
+
+# Content-creating requests one token is allowed per hour by GitHub's secondary rate limits,
+# which the writes of a token are held to in any hour
+WRITES_PER_HOUR = 500
+
+# Number of times a rate limited (or, for reads, failed) request is retried before giving up
+MAX_RETRIES = 5
+
+# Remaining requests held back from each token's rate limit window
+RATE_LIMIT_RESERVE = 10
+
+# Fraction of a token's rate limit below which its requests are spread over the rest of the window
+RATE_LIMIT_PACING = 0.1
+
+# Render the comment thread of every issue/pr into its body when creating it, rather than posting each comment
+FOLD_COMMENTS = False
+
+# Largest number of characters GitHub accepts in the body of an issue, pr or comment
+MAX_BODY_LENGTH = 65536
+
+# Number of release assets transferred concurrently, each streamed from its download straight into its upload
+ASSET_WORKERS = 4
+
+# Number of bytes of a release asset read from its download, and written to its upload, at a time
+ASSET_CHUNK_SIZE = 1024 * 1024
+
+# Seconds waited before checking again whether a repository generated from a template is ready, doubled after
+# every check up to READY_POLL_MAX_INTERVAL, and the seconds waited in total before giving up on it
+READY_POLL_INTERVAL = 0.5
+READY_POLL_MAX_INTERVAL = 8.0
+READY_TIMEOUT = 120.0
+
+# Journal of the elements already created in each destination, set by enable_journal. None keeps no journal
+JOURNAL = None
+
+# On-disk snapshot of the source repository, set by enable_snapshot. None reads everything from the API
+SNAPSHOT = None
+
+# Plan recording the writes of a dry run instead of sending them, set by enable_plan. None sends every write
+PLAN = None
+
+# Pools of additional credentials the reads of the source repositories on each GitHub API root are spread across,
+# keyed by API root and set by enable_credential_pool. Writes, and the reads of any other repository, such as the
+# destination, are always made with the credentials they are given
+CREDENTIAL_POOLS = {}
+
+# The '<team>/<repo>' a url of the API belongs to
+REPOSITORY_PATH = re.compile(r"/repos/([^/]+/[^/]+)")
+
+# The elements which failed to be migrated by the populate_repository call being run, set by it and propagated to
+# the tasks and threads it starts, which copy the context they are started from. None outside of populate_repository
+FAILURES = contextvars.ContextVar('failures', default=None)
+
+READ_HEADERS = {'Content-type': 'application/json'}
+WRITE_HEADERS = {'Content-type': 'application/json', 'Accept': 'application/vnd.github.v3.html+json'}
+ASSET_HEADERS = {'Accept': 'application/octet-stream'}
+
+def log(message):
+    """Print a progress or error message of the migration, unless QUIET is set"""
+    if not QUIET:
+        print(message)
+
+
+def record_failure(kind, name):
+    """Count an element which failed to be migrated against the populate_repository call migrating it"""
+    failures = FAILURES.get()
+    if failures is not None:
+        failures.append((kind, name))
+
+
 def check_res(r):
     """Test if a response object is valid"""
     # if the response status code is a failure (outside of 200 range)
     if r.status_code < 200 or r.status_code >= 300:
         # print the status code and associated response. Return false
-        print("STATUS CODE: " + str(r.status_code))
-        print("ERROR MESSAGE: " + r.text)
-        print("REQUEST: " + str(r))
+        log("STATUS CODE: " + str(r.status_code))
+        log("ERROR MESSAGE: " + r.text)
+        log("REQUEST: " + str(r))
         # if error, return False
         return False
     # if successful, return True
     return True
 
 
+def api_root(url):
+    """
+    INPUT: any url belonging to a GitHub API installation
+    OUTPUT: the '<scheme>://<host>' root the url belongs to
+    """
+    parts = urlsplit(url)
+    return parts.scheme + "://" + parts.netloc
+
+
+def get_session(url):
+    """
+    INPUT: any url belonging to a GitHub API installation
+    OUTPUT: the pooled, keep-alive session shared by all requests to that API root
+    """
+    # requests is only imported once the first request is made, so importing this module stays fast
+    import requests
+    root = api_root(url)
+    with SESSIONS_LOCK:
+        session = SESSIONS.get(root)
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount(root + "/", adapter)
+            SESSIONS[root] = session
+    return session
+
+
+def close_sessions():
+    """Close every pooled session and release the connections they hold open"""
+    with SESSIONS_LOCK:
+        for session in SESSIONS.values():
+            session.close()
+        SESSIONS.clear()
+
+
+class RequestScheduler(object):
+    """
+    Paces every API request against the rate limit budget of the token making it, as reported by the
+    X-RateLimit-* headers of its responses. Each token is tracked separately, so source and destination
+    credentials are throttled independently. Writes are additionally spaced WRITE_INTERVAL apart, and held once
+    a token has made WRITES_PER_HOUR of them within the last hour until the oldest of them is an hour old.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.budgets = {}
+
+    def budget(self, token):
+        if token not in self.budgets:
+            self.budgets[token] = {'limit': None, 'remaining': None, 'reset': 0.0,
+                                   'blocked_until': 0.0, 'next_request': 0.0, 'next_write': 0.0,
+                                   'writes': collections.deque(), 'writes_held': False}
+        return self.budgets[token]
+
+    def reserve(self, token, write):
+        """
+        INPUT:
+            token: the token about to make a request
+            write: a boolean flag indicating that the request creates or modifies content
+        OUTPUT: the number of seconds the request must be delayed by, without sleeping. The request is counted
+                against the budget of the token as if it were sent after that delay
+        """
+        held = False
+        with self.lock:
+            now = time.time()
+            budget = self.budget(token)
+            start = max(now, budget['blocked_until'], budget['next_request'])
+            if budget['remaining'] is not None and budget['reset'] > start:
+                if budget['remaining'] <= RATE_LIMIT_RESERVE:
+                    # the window is spent, hold every request until it resets
+                    start = budget['reset']
+                elif budget['limit'] and budget['remaining'] < budget['limit'] * RATE_LIMIT_PACING:
+                    # the window is nearly spent, spread the rest of it evenly until it resets
+                    interval = (budget['reset'] - start) / (budget['remaining'] - RATE_LIMIT_RESERVE)
+                    budget['next_request'] = start + interval
+                # count the request against the budget before its response reports the new remaining
+                budget['remaining'] -= 1
+            if write:
+                start = max(start, budget['next_write'])
+                # the times the writes of the last hour were scheduled at, in order
+                writes = budget['writes']
+                while writes and writes[0] <= start - 3600.0:
+                    writes.popleft()
+                spent = len(writes) >= WRITES_PER_HOUR
+                if spent:
+                    # the hourly budget is spent, hold the write until the oldest write of the hour leaves it
+                    start = writes[len(writes) - WRITES_PER_HOUR] + 3600.0
+                # warn once each time the writes start being held
+                held = spent and not budget['writes_held']
+                budget['writes_held'] = spent
+                writes.append(start)
+                budget['next_write'] = start + WRITE_INTERVAL
+        if held:
+            sys.stderr.write("WARNING: " + str(WRITES_PER_HOUR) + " writes were made within the hour, the next are " +
+                             "held " + str(int(start - now)) + " seconds for GitHub's secondary rate limits.\n")
+        return max(start - now, 0.0)
+
+    def update(self, token, r):
+        """Record the rate limit budget reported by the response r of a request made with token"""
+        headers = r.headers
+        if 'X-RateLimit-Remaining' not in headers:
+            return
+        with self.lock:
+            budget = self.budget(token)
+            remaining = int(headers['X-RateLimit-Remaining'])
+            reset = float(headers.get('X-RateLimit-Reset', 0))
+            if 'X-RateLimit-Limit' in headers:
+                budget['limit'] = int(headers['X-RateLimit-Limit'])
+            # responses arrive out of order across threads, keep the lowest count seen in the current window
+            if reset != budget['reset'] or budget['remaining'] is None:
+                budget['remaining'] = remaining
+                budget['reset'] = reset
+            else:
+                budget['remaining'] = min(budget['remaining'], remaining)
+
+    def headroom(self, token):
+        """
+        INPUT: a token requests may be made with
+        OUTPUT: a tuple of a boolean flag indicating that a request made with the token now would not be held, and
+                the requests left in its rate limit window, infinite if the API has not reported them yet
+        """
+        with self.lock:
+            budget = self.budgets.get(token)
+            if budget is None:
+                return True, float('inf')
+            now = time.time()
+            ready = max(budget['blocked_until'], budget['next_request']) <= now
+            if budget['remaining'] is None or budget['reset'] <= now:
+                # a window that has reset holds the whole limit again
+                return ready, budget['limit'] or float('inf')
+            return ready and budget['remaining'] > RATE_LIMIT_RESERVE, budget['remaining']
+
+    def block(self, token, seconds):
+        """Hold every request made with token for the given number of seconds"""
+        with self.lock:
+            budget = self.budget(token)
+            budget['blocked_until'] = max(budget['blocked_until'], time.time() + seconds)
+
+
+SCHEDULER = RequestScheduler()
+
+
+class CredentialPool(object):
+    """
+    Additional credentials valid on one GitHub API installation, such as the personal access tokens of several
+    accounts or the tokens of several GitHub App installations, across which the reads of some repositories are
+    spread. Every such read is sent with whichever credentials, pooled or given, have the most requests left in
+    their rate limit window, as tracked by the scheduler from the headers of their responses, so the reads of a
+    migration are capped by the combined rate limit of the pool rather than by that of one token.
+    INPUT:
+        credentials: a list of credentials, each with read access to the repositories
+        repositories: the team and repo '<team>/<repo>' of the repositories read with the pool, e.g. the source.
+                      The pool's credentials may not see any other, such as a private destination just generated
+    """
+
+    def __init__(self, credentials, repositories):
+        self.lock = threading.Lock()
+        self.credentials = list(credentials)
+        self.repositories = set(repository.lower() for repository in repositories)
+        # reads sent with each token, spreading reads evenly between tokens whose budget is not known yet
+        self.reads = {}
+
+    def pick(self, credentials):
+        """
+        INPUT: the credentials a read was made with
+        OUTPUT: the credentials to send it with instead
+        """
+        candidates = [credentials] + [pooled for pooled in self.credentials if pooled['token'] != credentials['token']]
+        with self.lock:
+            chosen = max(candidates, key=lambda candidate: SCHEDULER.headroom(candidate['token']) +
+                         (-self.reads.get(candidate['token'], 0),))
+            self.reads[chosen['token']] = self.reads.get(chosen['token'], 0) + 1
+        return chosen
+
+    def covers(self, url):
+        """
+        INPUT: the url of a read
+        OUTPUT: True if it reads one of the repositories of the pool, or is a GraphQL query, which only reads the source
+        """
+        match = REPOSITORY_PATH.search(urlsplit(url).path)
+        if match is None:
+            return urlsplit(url).path.rstrip('/').endswith('/graphql')
+        return match.group(1).lower() in self.repositories
+
+
+def enable_credential_pool(credentials, url=GITHUB_API_ROOT, repositories=()):
+    """
+    INPUT:
+        credentials: a list of additional credentials to spread the reads made on an API installation across
+        url: any url belonging to that GitHub API installation
+        repositories: the team and repo '<team>/<repo>' of the repositories whose reads are spread across them
+    OUTPUT: Null
+    """
+    CREDENTIAL_POOLS[api_root(url)] = CredentialPool(credentials, repositories)
+
+
+def read_credentials(url, credentials, headers=READ_HEADERS):
+    """
+    INPUT:
+        url, credentials, headers: a read about to be sent
+    OUTPUT: the credentials of the pool of the url's API root with the most requests left, if the url reads one
+            of the pool's repositories. The given credentials otherwise, so a destination the pooled credentials
+            may not see is never read with them. Conditional reads keep their credentials, as GitHub only answers
+            them with a 304, which does not count against the rate limit, for the token that stored the validators
+    """
+    pool = CREDENTIAL_POOLS.get(api_root(url)) if CREDENTIAL_POOLS else None
+    if pool is None or not pool.covers(url) or 'If-None-Match' in headers or 'If-Modified-Since' in headers:
+        return credentials
+    return pool.pick(credentials)
+
+
+def parse_credentials(value):
+    """
+    INPUT: credentials given on the command line, as '<user_name>:<token>' or as a token alone
+    OUTPUT: the credentials. A token given alone is authenticated as a GitHub App installation token
+    """
+    user_name, separator, token = value.rpartition(':')
+    return {'user_name': user_name if separator else 'x-access-token', 'token': token}
+
+
+def rate_limit_delay(r):
+    """
+    INPUT: a response object
+    OUTPUT: the number of seconds to wait if the response reports a (primary or secondary) rate limit. None otherwise
+    """
+    if r.status_code not in (403, 429):
+        return None
+    if 'Retry-After' in r.headers:
+        return float(r.headers['Retry-After'])
+    if r.headers.get('X-RateLimit-Remaining') == '0':
+        return max(float(r.headers.get('X-RateLimit-Reset', 0)) - time.time(), 0.0) + 1.0
+    if r.status_code == 429 or 'rate limit' in r.text.lower():
+        # secondary rate limits without a Retry-After header ask for at least a minute
+        return 60.0
+    return None
+
+
+def backoff_delay(attempt):
+    """
+    INPUT: the number of attempts already made
+    OUTPUT: a jittered, exponentially growing number of seconds to wait before the next attempt
+    """
+    return random.uniform(0, min(60.0, 2.0 ** attempt))
+
+
+class RequestAttempts(object):
+    """
+    The scheduling, retry and metrics policy of one request, shared by send_req and the asyncio client of
+    async_migration, which only differ in how they wait and how they send each attempt.
+    INPUT:
+        method, url, credentials, headers: the same as send_req
+        write: a boolean flag indicating that the request creates or modifies content
+    """
+
+    def __init__(self, method, url, credentials, headers, write):
+        self.method = method
+        self.url = url
+        self.credentials = credentials
+        self.headers = headers
+        self.write = write
+        self.attempt = 0
+        self.token = None
+        # seconds spent waiting on the scheduler and on retry backoff, reported to the metrics
+        self.throttled = 0.0
+
+    def start(self):
+        """
+        OUTPUT: the credentials to send the next attempt with, and the number of seconds to wait before sending it
+        """
+        # every attempt of a read is sent with the pooled credentials that have the most requests left
+        sender = self.credentials if self.write else read_credentials(self.url, self.credentials, self.headers)
+        self.token = sender['token']
+        delay = SCHEDULER.reserve(self.token, self.write)
+        self.throttled += delay
+        return sender, delay
+
+    def failed(self):
+        """
+        OUTPUT: the number of seconds to wait before retrying an attempt whose connection failed.
+                None if it is not retried, and the failure is raised
+        """
+        if self.write or self.attempt >= MAX_RETRIES:
+            return None
+        self.attempt += 1
+        delay = backoff_delay(self.attempt)
+        self.throttled += delay
+        return delay
+
+    def answered(self, r, latency, stream=False):
+        """
+        INPUT:
+            r: the response of the attempt
+            latency: the number of seconds the attempt took
+            stream: a boolean flag indicating that the body of the response is left unread
+        OUTPUT: the number of seconds to wait before retrying the request. None if the response is final, once
+                it is recorded in the metrics
+        """
+        SCHEDULER.update(self.token, r)
+        delay = rate_limit_delay(r) if self.attempt < MAX_RETRIES else None
+        if delay is not None:
+            sys.stderr.write("WARNING: Rate limited on " + self.url + ", retrying in " + str(int(delay)) + " seconds.\n")
+            # pause every request made with this token, not only this one. The next attempt waits on the scheduler
+            SCHEDULER.block(self.token, delay + random.uniform(0, 1.0))
+            delay = 0.0
+        elif not self.write and r.status_code >= 500 and self.attempt < MAX_RETRIES:
+            delay = backoff_delay(self.attempt + 1)
+            self.throttled += delay
+        else:
+            remaining = r.headers.get('X-RateLimit-Remaining')
+            size = int(r.headers.get('Content-Length', 0)) if stream else len(r.content)
+            migration_metrics.record(self.url, self.method, r.status_code, latency, size, self.attempt,
+                                     self.throttled, int(remaining) if remaining is not None else None)
+            return None
+        self.attempt += 1
+        return delay
+
+
+def send_req(method, url, credentials, data=None, headers=READ_HEADERS, write=None, stream=False):
+    """
+    INPUT:
+        method: the HTTP method of the request
+        url: an API endpoint
+        data: the body of the request, if any
+        headers: the headers of the request
+        write: a boolean flag indicating that the request creates or modifies content. Defaults to any method but GET
+        stream: a boolean flag to leave the body of the response unread, for the caller to stream
+    OUTPUT: the response object of the request. Every request goes through the rate limit scheduler; rate limited
+            requests are retried after the wait GitHub asks for. Reads are spread across the credential pool of
+            their API root, if it has one. Reads are also retried, with jittered backoff, on
+            server errors and connection failures. Writes are not, as they may already have been applied.
+    """
+    import requests
+    if write is None:
+        write = method != 'GET'
+    if write and PLAN is not None:
+        return PLAN.respond(method, url, data)
+    attempts = RequestAttempts(method, url, credentials, headers, write)
+    while True:
+        sender, delay = attempts.start()
+        if delay > 0:
+            time.sleep(delay)
+        started = time.time()
+        try:
+            r = get_session(url).request(method, url=url, data=data, headers=headers, stream=stream,
+                                         auth=(sender['user_name'], sender['token']))
+        except requests.exceptions.ConnectionError:
+            delay = attempts.failed()
+            if delay is None:
+                raise
+        else:
+            delay = attempts.answered(r, time.time() - started, stream)
+            if delay is None:
+                return r
+        time.sleep(delay)
+
+
+class SnapshotCache(object):
+    """
+    Stores the JSON of every GET made to one repository on disk, keyed by repository and endpoint, along with
+    its ETag/Last-Modified validators. Later reads revalidate the stored JSON with a conditional request,
+    whose 304 responses do not count against the rate limit, or are served from disk alone when offline.
+    """
+
+    def __init__(self, directory, repository, offline=False):
+        self.directory = os.path.join(directory, *repository.lower().split('/'))
+        self.marker = '/repos/' + repository.lower() + '/'
+        self.offline = offline
+
+    def covers(self, url):
+        """Test if the url is an endpoint of the snapshotted repository"""
+        return self.marker in urlsplit(url).path.lower()
+
+    def path(self, url):
+        """
+        INPUT: an endpoint of the snapshotted repository
+        OUTPUT: the file storing that endpoint, named after the endpoint and a hash of it
+        """
+        parts = urlsplit(url)
+        endpoint = parts.path.lower().split(self.marker, 1)[1] + '?' + parts.query
+        name = re.sub(r'[^a-z0-9._-]+', '_', endpoint.lower()).strip('_')
+        return os.path.join(self.directory, name + '-' + hashlib.sha1(endpoint.encode('utf-8')).hexdigest()[:10] + '.json')
+
+    def load(self, url):
+        try:
+            with open(self.path(url)) as snapshot_file:
+                return json.load(snapshot_file)
+        except (IOError, ValueError):
+            return None
+
+    def store(self, url, r):
+        entry = {'url': url, 'etag': r.headers.get('ETag'), 'last_modified': r.headers.get('Last-Modified'),
+                 'link': r.headers.get('Link'), 'body': r.text}
+        path = self.path(url)
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory, exist_ok=True)
+        # write to a temporary file first, so concurrent readers never see a partial snapshot
+        temporary = path + '.' + str(threading.get_ident()) + '.tmp'
+        with open(temporary, 'w') as snapshot_file:
+            json.dump(entry, snapshot_file)
+        os.replace(temporary, path)
+
+    def response(self, url, entry, status_code=200):
+        """Rebuild a response object from a stored snapshot entry"""
+        import requests
+        r = requests.models.Response()
+        r.url = url
+        r.status_code = status_code
+        r.encoding = 'utf-8'
+        if entry is None:
+            r._content = json.dumps({'message': 'Not found in the snapshot ' + self.directory}).encode('utf-8')
+            return r
+        r._content = entry['body'].encode('utf-8')
+        if entry['link']:
+            r.headers['Link'] = entry['link']
+        return r
+
+    def get(self, url, credentials):
+        """
+        INPUT: an endpoint of the snapshotted repository
+        OUTPUT: the response object for the endpoint, revalidated against the API unless offline
+        """
+        entry = self.load(url)
+        if self.offline:
+            return self.response(url, entry, 200 if entry is not None else 404)
+        headers = dict(READ_HEADERS)
+        if entry is not None and entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        elif entry is not None and entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        r = send_req('GET', url, credentials, headers=headers)
+        if r.status_code == 304 and entry is not None:
+            return self.response(url, entry)
+        if r.status_code == 200:
+            self.store(url, r)
+        return r
+
+
+def enable_snapshot(directory, source, offline=False):
+    """
+    INPUT:
+        directory: the directory storing snapshots
+        source: the team and repo '<team>/<repo>' whose reads are snapshotted
+        offline: a boolean flag to serve the reads of the source from the snapshot alone
+    OUTPUT: Null
+    """
+    global SNAPSHOT
+    SNAPSHOT = SnapshotCache(directory, source, offline)
+
+
+class MigrationJournal(object):
+    """
+    Append-only JSONL file recording every element created in a destination, as one line mapping the element's
+    source key to its destination number (when it has one). Loaded back into memory on resume, so a resumed run
+    skips completed work and rebuilds milestone_map without touching the API.
+    """
+
+    def __init__(self, path, resume=False):
+        self.lock = threading.Lock()
+        self.entries = {}
+        if resume and os.path.exists(path):
+            with open(path) as journal_file:
+                for line in journal_file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # the last line of an interrupted run may have been cut short
+                        continue
+                    self.entries.setdefault((entry['destination'], entry['kind']), {})[entry['source']] = entry['value']
+        self.file = open(path, 'a' if resume else 'w')
+
+    def completed(self, destination, kind, key):
+        with self.lock:
+            return key in self.entries.get((destination, kind), {})
+
+    def lookup(self, destination, kind, key):
+        """
+        OUTPUT: the destination number journaled for an element, None if it has none or was not journaled
+        """
+        with self.lock:
+            return self.entries.get((destination, kind), {}).get(key)
+
+    def mapping(self, destination, kind):
+        """
+        OUTPUT: a dict mapping the source key of every journaled element of a kind to its destination number
+        """
+        with self.lock:
+            return dict(self.entries.get((destination, kind), {}))
+
+    def record(self, destination, kind, key, value=None):
+        with self.lock:
+            self.entries.setdefault((destination, kind), {})[key] = value
+            self.file.write(json.dumps({'destination': destination, 'kind': kind, 'source': key, 'value': value}) + '\n')
+            # flush every entry, so a crash loses at most the element being created
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def enable_journal(path, resume=False):
+    """
+    INPUT:
+        path: the journal file recording the elements created by the migration
+        resume: a boolean flag to skip the elements recorded in the journal by a previous run, rather than starting a new journal
+    OUTPUT: Null
+    """
+    global JOURNAL
+    JOURNAL = MigrationJournal(path, resume)
+
+
+def journaled(destination, kind, key):
+    """Test if an element was already created in the destination, according to the journal"""
+    return JOURNAL is not None and JOURNAL.completed(destination, kind, key)
+
+
+def journal(destination, kind, key, value=None):
+    """Record an element created in the destination, if a journal is kept. Nothing is created by a dry run"""
+    if JOURNAL is not None and PLAN is None:
+        JOURNAL.record(destination, kind, key, value)
+
+
+def enable_plan():
+    """Record every write made from now on in a migration_plan.MigrationPlan rather than sending it
+    OUTPUT: the plan
+    """
+    global PLAN
+    import migration_plan
+    PLAN = migration_plan.MigrationPlan()
+    return PLAN
+
+
 def get_req(url, credentials):
     """
     INPUT: an API endpoint for retrieving data
@@ -29,8 +664,9 @@ def get_req(url, credentials):
     """
     if VERBOSE:
         print("GETTING: " + url)
-    r = requests.get(url=url, auth=(credentials['user_name'], credentials['token']), headers={
-                     'Content-type': 'application/json'})
+    if SNAPSHOT is not None and SNAPSHOT.covers(url):
+        return SNAPSHOT.get(url, credentials)
+    r = send_req('GET', url, credentials)
     return r
 
 
@@ -41,8 +677,7 @@ def post_req(url, data, credentials):
     """
     if VERBOSE:
         print("POSTING: " + url)
-    r = requests.post(url=url, data=data, auth=(credentials['user_name'], credentials['token']), headers={
-                      'Content-type': 'application/json', 'Accept': 'application/vnd.github.v3.html+json'})
+    r = send_req('POST', url, credentials, data, WRITE_HEADERS)
     return r
 
 
@@ -53,11 +688,251 @@ def put_req(url, data, credentials):
     """
     if VERBOSE:
         print("PUTTING: " + url)
-    r = requests.put(url=url, data=data, auth=(credentials['user_name'], credentials['token']), headers={
-                      'Content-type': 'application/json', 'Accept': 'application/vnd.github.v3.html+json'})
+    r = send_req('PUT', url, credentials, data, WRITE_HEADERS)
+    return r
+
+
+def patch_req(url, data, credentials):
+    """
+    INPUT: an API endpoint for updating data
+    OUTPUT: the request object containing the updated data response for successful requests. If a request fails, False is returned.
+    """
+    if VERBOSE:
+        print("PATCHING: " + url)
+    r = send_req('PATCH', url, credentials, data, WRITE_HEADERS)
     return r
 
 
+def delete_req(url, credentials):
+    """
+    INPUT: an API endpoint for deleting data
+    OUTPUT: the request object containing the response of the deletion
+    """
+    if VERBOSE:
+        print("DELETING: " + url)
+    r = send_req('DELETE', url, credentials, headers=WRITE_HEADERS)
+    return r
+
+
+def paged_url(url):
+    """
+    INPUT: an API endpoint listing items
+    OUTPUT: the same endpoint requesting the largest page size the API allows
+    """
+    if 'per_page=' in url:
+        return url
+    separator = '&' if '?' in url else '?'
+    return url + separator + 'per_page=' + str(PER_PAGE)
+
+
+def get_pages(url, credentials):
+    """
+    INPUT: an API endpoint listing items over one or more pages
+    OUTPUT: a generator of the listed items, following the 'next' links of the response as it is consumed.
+            An empty list if the endpoint lists no items. If the first page cannot be retrieved, False is returned.
+    """
+    r = get_req(paged_url(url), credentials)
+    status = check_res(r)
+    if not status:
+        return False
+    items = json.loads(r.text)
+    if not items and 'next' not in r.links:
+        return []
+    return follow_pages(r, items, credentials)
+
+
+def follow_pages(r, items, credentials):
+    """
+    INPUT:
+        r: the response of a page that has already been retrieved
+        items: the items listed on that page
+    OUTPUT: a generator yielding those items, then the items of every following page.
+            Only a single page is held in memory at any time. If a following page cannot be retrieved, IOError is
+            raised once the items before it have been yielded, so the listing is never mistaken for a complete one
+    """
+    while True:
+        for item in items:
+            yield item
+        if 'next' not in r.links:
+            return
+        r = get_req(r.links['next']['url'], credentials)
+        status = check_res(r)
+        if not status:
+            raise IOError("Failed to retrieve the page " + r.url + ", the listing is incomplete.")
+        items = json.loads(r.text)
+
+
+def list_pages(url, credentials):
+    """
+    INPUT: an API endpoint listing items over one or more pages
+    OUTPUT: a list of every listed item. False, after reporting it, if any page cannot be retrieved
+    """
+    pages = get_pages(url, credentials)
+    if pages is False:
+        return False
+    try:
+        return list(pages)
+    except IOError as error:
+        sys.stderr.write("ERROR: " + str(error) + "\n")
+        return False
+
+
+class DestinationIndex(object):
+    """
+    The elements already in every destination, keyed as the create_* functions deduplicate them: milestones by
+    title, labels and releases by name, collaborators by login, and issues and prs by title. Each element type of
+    a destination is listed in full the first time it is consulted, once per run, and every element created
+    afterwards is added to it, so an existing element is found in O(1) without any further GET.
+    An existing element is claimed by the first source element with its key, so a source holding two issues
+    with the same title still gets both migrated.
+    """
+
+    # the listing of every element type, and the field it is keyed by. The issues listing also indexes the prs,
+    # which it lists along with the number of comments on each of them, unlike the pulls listing. Branches and
+    # assignees are never created, they are only listed to validate prs before they are written
+    LISTINGS = {'milestones': ("/milestones?state=all", 'title'), 'labels': ("/labels", 'name'),
+                'releases': ("/releases", 'name'), 'collaborators': ("/collaborators", 'login'),
+                'issues': ("/issues?state=all&sort=created&direction=asc", 'title'),
+                'branches': ("/branches", 'name'), 'assignees': ("/assignees", 'login')}
+    VALIDATED = ('branches', 'assignees')
+
+    def __init__(self):
+        self.indexes = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def index(self, destination_url, destination, kind, credentials):
+        """
+        OUTPUT: a dict mapping the key of every element of the kind in the destination to the elements with
+                that key, and the number of them already claimed. None if the destination could not be listed
+        """
+        listed = 'issues' if kind == 'prs' else kind
+        with self.lock:
+            lock = self.locks.setdefault((destination_url, destination, listed), threading.Lock())
+        # destinations and element types are listed concurrently, but each of them only once
+        with lock:
+            if not self.loaded(destination_url, destination, kind):
+                elements = list_pages(self.listing(destination_url, destination, kind), credentials)
+                elements = self.listed(destination, kind, elements)
+                if elements is False:
+                    return None
+                self.store(destination_url, destination, kind, elements)
+            return self.indexes.get((destination_url, destination, kind))
+
+    def listed(self, destination, kind, elements):
+        """
+        INPUT: the elements listed for the kind in the destination, False if the listing failed
+        OUTPUT: the elements to index. False, after warning about it, if there are none to index
+        """
+        listed = 'issues' if kind == 'prs' else kind
+        if elements is False and PLAN is not None and PLAN.generated(destination):
+            # a repository generated by a dry run does not exist, so holds nothing to deduplicate against. What it
+            # would be generated with is unknown, so nothing is validated against it either
+            return False if kind in self.VALIDATED else []
+        if elements is False and kind in self.VALIDATED:
+            sys.stderr.write("WARNING: The " + listed + " of " + destination + " could not be listed, " +
+                             "prs are written without validating them.\n")
+        elif elements is False:
+            sys.stderr.write("WARNING: The " + listed + " of " + destination + " could not be listed, " +
+                             "existing " + listed + " may be duplicated.\n")
+        return elements
+
+    def loaded(self, destination_url, destination, kind):
+        """Test if the elements of the kind in the destination were already listed"""
+        return (destination_url, destination, kind) in self.indexes
+
+    def listing(self, destination_url, destination, kind):
+        """
+        OUTPUT: the endpoint listing the elements of the kind in the destination
+        """
+        return destination_url + "repos/" + destination + self.LISTINGS['issues' if kind == 'prs' else kind][0]
+
+    def store(self, destination_url, destination, kind, elements):
+        """Index the elements listed by the listing of the kind in the destination"""
+        listed = 'issues' if kind == 'prs' else kind
+        field = self.LISTINGS[listed][1]
+        indexes = {listed: {}, 'prs': {}}
+        for element in elements:
+            indexed = 'prs' if listed == 'issues' and 'pull_request' in element else listed
+            indexes[indexed].setdefault(element[field], [[], 0])[0].append(element)
+        with self.lock:
+            self.indexes[(destination_url, destination, listed)] = indexes[listed]
+            if listed == 'issues':
+                self.indexes[(destination_url, destination, 'prs')] = indexes['prs']
+
+    def claim(self, destination_url, destination, kind, key, credentials):
+        """
+        OUTPUT: an element of the kind with the key in the destination not yet claimed by another source element.
+                None if there is none, and the source element has to be created
+        """
+        index = self.index(destination_url, destination, kind, credentials)
+        if index is None:
+            return None
+        with self.lock:
+            entry = index.get(key)
+            if entry is None or entry[1] >= len(entry[0]):
+                return None
+            entry[1] += 1
+            return entry[0][entry[1] - 1]
+
+    def contains(self, destination_url, destination, kind, key, credentials):
+        """Test if an element of the kind with the key exists in the destination, claimed or not"""
+        index = self.index(destination_url, destination, kind, credentials)
+        return index is not None and key in index
+
+    def forget(self, destination_url, destination):
+        """Drop every listing of the destination, so a long-running process only holds those it is migrating"""
+        with self.lock:
+            for key in [key for key in self.indexes if key[:2] == (destination_url, destination)]:
+                del self.indexes[key]
+            for key in [key for key in self.locks if key[:2] == (destination_url, destination)]:
+                del self.locks[key]
+
+    def add(self, destination_url, destination, kind, key, element):
+        """Record an element created in the destination, already claimed by the source element it was created for"""
+        with self.lock:
+            index = self.indexes.get((destination_url, destination, kind))
+            if index is not None:
+                entry = index.setdefault(key, [[], 0])
+                entry[0].append(element)
+                entry[1] += 1
+
+
+INDEX = DestinationIndex()
+
+
+class WorkerPool(object):
+    """
+    Runs the tasks submitted to it on a number of worker threads while the submitting thread carries on, e.g. the
+    release assets on ASSET_WORKERS threads while the following releases are created. With a single worker every
+    submitted task is run immediately on the calling thread.
+    INPUT:
+        workers: the number of worker threads
+    """
+
+    def __init__(self, workers):
+        self.executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        self.futures = []
+
+    def submit(self, fn, *args):
+        if self.executor is None:
+            fn(*args)
+        else:
+            # the task is attributed to the phase, and populate_repository call, it was submitted from
+            self.futures.append(self.executor.submit(contextvars.copy_context().run, fn, *args))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            # re-raise the first failure of a task, if any
+            for future in self.futures:
+                future.result()
+        return False
+
+
 def download_milestones(source_url, source, credentials):
     """
     INPUT:
@@ -66,32 +941,24 @@ def download_milestones(source_url, source, credentials):
     OUTPUT: retrieved milestones sorted by their number if request was successful. False otherwise
     """
     url = source_url + "repos/" + source + "/milestones?filter=all"
-    r = get_req(url, credentials)
-    status = check_res(r)
-    if status:
-        # if the request succeeded, sort the retrieved milestones by their number
-        sorted_milestones = sorted(json.loads(
-            r.text), key=lambda k: k['number'])
-        return sorted_milestones
-    return False
+    pages = get_pages(url, credentials)
+    if pages is False:
+        return False
+    # the API cannot order milestones by number, so the (few) milestones are held and sorted here
+    sorted_milestones = sorted(project('milestones', pages), key=lambda k: k['number'])
+    return sorted_milestones
 
 
 def download_collaborators(source_url, source, credentials):
     """
     INPUT:
         source_url: the root url for the GitHub API
-        source: the team and repo '<team>/<repo>' to retrieve milestones from
-    OUTPUT: retrieved milestones sorted by their number if request was successful. False otherwise
+        source: the team and repo '<team>/<repo>' to retrieve collaborators from
+    OUTPUT: a generator of the retrieved collaborators if request was successful. False otherwise
     """
     url = source_url + "repos/" + source + "/collaborators?filter=all"
-    r = get_req(url, credentials)
-    status = check_res(r)
-    if status:
-        # if the request succeeded, sort the retrieved collaborators by their number
-        sorted_collaborators = sorted(json.loads(
-            r.text), key=lambda k: k['id'])
-        return sorted_collaborators
-    return False
+    pages = get_pages(url, credentials)
+    return pages and project('collaborators', pages)
 
 
 def download_issues(source_url, source, credentials):
@@ -99,17 +966,15 @@ def download_issues(source_url, source, credentials):
     INPUT:
         source_url: the root url for the GitHub API
         source: the team and repo '<team>/<repo>' to retrieve issues from
-    OUTPUT: retrieved issues sorted by their number if request was successful. False otherwise
+    OUTPUT: a generator of the retrieved issues in order of their number if request was successful. False otherwise
     """
-    url = source_url + "repos/" + source + "/issues?filter=all"
-    r = get_req(url, credentials)
-    status = check_res(r)
-    if status:
-        # if the requests succeeded, sort the retireved issues by their number
-        sorted_issues = sorted(json.loads(r.text), key=lambda k: k['number'])
-        sorted_issues = [i for i in sorted_issues if not 'pull_request' in i.keys()]
-        return sorted_issues
-    return False
+    # issues are numbered in order of creation, so the API can stream them already sorted by their number
+    url = source_url + "repos/" + source + "/issues?filter=all&sort=created&direction=asc"
+    pages = get_pages(url, credentials)
+    if not pages:
+        return pages
+    # the issues endpoint also lists prs, which are migrated separately
+    return project('issues', (i for i in pages if not 'pull_request' in i.keys()))
 
 
 def download_prs(source_url, source, credentials):
@@ -117,16 +982,11 @@ def download_prs(source_url, source, credentials):
     INPUT:
         source_url: the root url for the GitHub API
         source: the team and repo '<team>/<repo>' to retrieve prs from
-    OUTPUT: retrieved prs sorted by their number if request was successful. False otherwise
+    OUTPUT: a generator of the retrieved prs in order of their number if request was successful. False otherwise
     """
-    url = source_url + "repos/" + source + "/pulls?filter=all"
-    r = get_req(url, credentials)
-    status = check_res(r)
-    if status:
-        # if the requests succeeded, sort the retireved prs by their number
-        sorted_prs = sorted(json.loads(r.text), key=lambda k: k['number'])
-        return sorted_prs
-    return False
+    url = source_url + "repos/" + source + "/pulls?filter=all&sort=created&direction=asc"
+    pages = get_pages(url, credentials)
+    return pages and project('prs', pages)
 
 
 def download_labels(source_url, source, credentials):
@@ -134,14 +994,11 @@ def download_labels(source_url, source, credentials):
     INPUT:
         source_url: the root url for the GitHub API
         source: the team and repo ']<team>/<repo>' to retrieve labels from
-    OUTPUT: retrieved labels if request was successful. False otherwise
+    OUTPUT: a generator of the retrieved labels if request was successful. False otherwise
     """
     url = source_url + "repos/" + source + "/labels?filter=all"
-    r = get_req(url, credentials)
-    status = check_res(r)
-    if status:
-        return json.loads(r.text)
-    return False
+    pages = get_pages(url, credentials)
+    return pages and project('labels', pages)
 
 
 def download_releases(source_url, source, credentials):
@@ -149,14 +1006,11 @@ def download_releases(source_url, source, credentials):
     INPUT:
         source_url: the root url for the GitHub API
         source: the team and repo '<team>/<repo>' to retrieve releases from
-    OUTPUT: retrieved releases if request was successful. False otherwise
+    OUTPUT: a generator of the retrieved releases if request was successful. False otherwise
     """
     url = source_url + "repos/" + source + "/releases"
-    r = get_req(url, credentials)
-    status = check_res(r)
-    if status:
-        return json.loads(r.text)
-    return False
+    pages = get_pages(url, credentials)
+    return pages and project('releases', pages)
 
 def create_collaborators(collaborators, destination_url, destination, credentials):
     """Post collaborators to GitHub
@@ -166,20 +1020,12 @@ def create_collaborators(collaborators, destination_url, destination, credential
         destination: the team and repo '<team>/<repo>' to post milestones to
     OUTPUT: A list of collaborators
     """
-    for collaborator in collaborators:
-        if collaborator['login'] == credentials['user_name']:
-            continue
-        url = destination_url + "repos/" + destination + "/collaborators/" + collaborator["login"]
-        perm = "push"
-        if collaborator["permissions"]["admin"] == True or collaborator['login'] == credentials['user_name']:
-            perm = "admin"
-
-        # create a new collaborator that includes only the attributes needed to create a new milestone
-        r = put_req(url, json.dumps({"permission": perm}), credentials)
-        status = check_res(r)
-        print(status)
+    import async_migration
+    async_migration.run_threaded(async_migration.create_collaborators, collaborators, destination_url, destination,
+                                 credentials)
     return {"done": "true"}
 
+
 def create_milestones(milestones, destination_url, destination, credentials):
     """Post milestones to GitHub
     INPUT:
@@ -188,22 +1034,9 @@ def create_milestones(milestones, destination_url, destination, credentials):
         destination: the team and repo '<team>/<repo>' to post milestones to
     OUTPUT: A dict of milestone numbering that maps from source milestone numbers to destination milestone numbers
     """
-    url = destination_url + "repos/" + destination + "/milestones"
-    milestone_map = {}
-    for milestone in milestones:
-        # create a new milestone that includes only the attributes needed to create a new milestone
-        milestone_prime = {"title": milestone["title"], "state": milestone["state"],
-                           "description": milestone["description"], "due_on": milestone["due_on"]}
-        r = post_req(url, json.dumps(milestone_prime), credentials)
-        status = check_res(r)
-        if status:
-            # if the POST request succeeded, parse and store the new milestone returned from GitHub
-            returned_milestone = json.loads(r.text)
-            # map the original source milestone's number to the newly created milestone's number
-            milestone_map[milestone['number']] = returned_milestone['number']
-        else:
-            print(status)
-    return milestone_map
+    import async_migration
+    return async_migration.run_threaded(async_migration.create_milestones, milestones, destination_url, destination,
+                                        credentials)
 
 
 def create_labels(labels, destination_url, destination, credentials):
@@ -214,53 +1047,133 @@ def create_labels(labels, destination_url, destination, credentials):
         destination: the team and repo '<team>/<repo>' to post labels to
     OUTPUT: Null
     """
-    url = destination_url + "repos/" + destination + "/labels?filter=all"
-    # download labels from the destination and pass them into dictionary of label names
-    check_labels = download_labels(destination_url, destination, credentials) or []
-    existing_labels = {}
-    for existing_label in check_labels:
-        existing_labels[existing_label["name"]] = existing_label
-    for label in labels:
-        # for every label that was downloaded from the source, check if it already exists in the source.
-        # If it does, don't add it.
-        if label["name"] not in existing_labels:
-            label_prime = {"name": label["name"], "color": label["color"]}
-            print("Migrating Label: " + label["name"])
-            r = post_req(url, json.dumps(label_prime), credentials)
-            check_res(r)
-
-
-def create_releases(releases, destination_url, destination, credentials):
-    """Post releases to GitHub
+    import async_migration
+    async_migration.run_threaded(async_migration.create_labels, labels, destination_url, destination, credentials)
+
+
+def create_releases(releases, destination_url, destination, credentials, source_credentials=None):
+    """Post releases to GitHub, along with their assets
     INPUT:
         releases: python list of dicts containing release info to be POSTED to GitHub
         destination_url: the root url for the GitHub API
         destination: the team and repo '<team>/<repo>' to post releases to
+        source_credentials: the credentials used to download the assets of the releases
     OUTPUT: Null
     """
     url = destination_url + "repos/" + destination + "/releases"
-    # download releases from the destination and pass them into dictionary of
-    # release names
-    check_releases = download_releases(destination_url, destination, credentials) or []
-    existing_releases = {}
-    for existing_release in check_releases:
-        existing_releases[existing_release["name"]] = existing_release
-    for release in releases:
-        # for every release that was downloaded from the source, check if it
-        # already exists in the destination.
-        # If it does, don't add it.
-        if release["name"] not in existing_releases:
-            release_prime = {"tag_name": release["tag_name"],
-                    "target_commitish": release["target_commitish"],
-                    "name": release["name"],
-                    "body": release["body"],
-                    "prerelease": release["prerelease"]}
-            print("Migrating Release: " + release["name"])
-            r = post_req(url, json.dumps(release_prime), credentials)
-            check_res(r)
-
-
-def create_issues(issues, destination_url, destination, milestones, labels, milestone_map, credentials, sameInstall):
+    source_credentials = source_credentials or credentials
+    with WorkerPool(ASSET_WORKERS) as pool:
+        for release in releases:
+            # for every release that was downloaded from the source, check if it
+            # already exists in the destination.
+            # If it does, don't add it.
+            if journaled(destination, 'releases', release["name"]) and not release.get("assets"):
+                continue
+            # releases created by a previous run are still looked up, to resume the transfer of their assets
+            existing_release = INDEX.claim(destination_url, destination, 'releases', release["name"], credentials)
+            if existing_release is None and not journaled(destination, 'releases', release["name"]):
+                release_prime = {"tag_name": release["tag_name"],
+                        "target_commitish": release["target_commitish"],
+                        "name": release["name"],
+                        "body": release["body"],
+                        "prerelease": release["prerelease"]}
+                log("Migrating Release: " + release["name"])
+                r = post_req(url, json.dumps(release_prime), credentials)
+                if check_res(r):
+                    existing_release = json.loads(r.text)
+                    journal(destination, 'releases', release["name"])
+                    INDEX.add(destination_url, destination, 'releases', release["name"], existing_release)
+                else:
+                    record_failure('releases', release["name"])
+            if existing_release is not None:
+                # the assets of the release are transferred while the following releases are created
+                migrate_assets(release, existing_release, destination, credentials, source_credentials, pool)
+
+
+def migrate_assets(release, release_prime, destination, credentials, source_credentials, pool):
+    """Copy the assets of one release missing from its counterpart in the destination
+    INPUT:
+        release: a release downloaded from the source
+        release_prime: the release it was migrated to, as returned by GitHub
+        pool: the WorkerPool the assets are transferred on
+    OUTPUT: Null
+    """
+    # an upload interrupted by a previous run leaves its asset behind in the 'starter' state, which is replaced
+    existing_assets = {asset["name"]: asset for asset in release_prime.get("assets", [])}
+    for asset in release.get("assets", []):
+        if journaled(destination, 'assets', asset["id"]):
+            continue
+        existing_asset = existing_assets.get(asset["name"])
+        if existing_asset is not None and existing_asset.get("state") == "uploaded":
+            journal(destination, 'assets', asset["id"])
+            continue
+        pool.submit(transfer_asset, asset, release_prime["upload_url"], destination, credentials,
+                    source_credentials, existing_asset)
+
+
+class AssetStream(object):
+    """
+    The body of the upload of a release asset, streamed from the download of the source asset ASSET_CHUNK_SIZE
+    bytes at a time, so the asset is never held whole in memory or on disk. Every iteration downloads the asset
+    again, so an upload retried after a rate limit is sent in full.
+    INPUT:
+        asset: the asset of a source release
+        credentials: the credentials used to download it
+    """
+
+    def __init__(self, asset, credentials):
+        self.asset = asset
+        self.credentials = credentials
+
+    def __len__(self):
+        # uploads must declare their Content-Length, as GitHub refuses chunked transfer encoding
+        return self.asset["size"]
+
+    def __iter__(self):
+        r = send_req('GET', self.asset["url"], self.credentials, headers=ASSET_HEADERS, stream=True)
+        try:
+            if not check_res(r):
+                raise IOError("The asset " + self.asset["name"] + " failed to be downloaded.")
+            for chunk in r.raw.stream(ASSET_CHUNK_SIZE, decode_content=False):
+                yield chunk
+        finally:
+            r.close()
+
+
+def transfer_asset(asset, upload_url, destination, credentials, source_credentials, existing_asset=None):
+    """Stream one release asset from the source into the upload of a release in the destination
+    INPUT:
+        asset: the asset of a source release
+        upload_url: the upload_url of the release in the destination
+        existing_asset: an unfinished upload of the asset in the destination, replaced by this one
+    OUTPUT: True if the asset was uploaded. False otherwise
+    """
+    if existing_asset is not None and not check_res(delete_req(existing_asset["url"], credentials)):
+        record_failure('assets', asset["name"])
+        return False
+    query = {"name": asset["name"]}
+    if asset.get("label"):
+        query["label"] = asset["label"]
+    # the upload_url is a URI template, e.g. https://uploads.github.com/repos/<team>/<repo>/releases/1/assets{?name,label}
+    url = upload_url.split("{")[0] + "?" + urlencode(query)
+    headers = {'Content-Type': asset.get("content_type") or 'application/octet-stream',
+               'Accept': 'application/vnd.github.v3+json'}
+    log("Migrating Asset: " + asset["name"])
+    try:
+        r = send_req('POST', url, credentials, AssetStream(asset, source_credentials), headers)
+    except IOError as error:
+        sys.stderr.write("ERROR: The asset " + asset["name"] + " failed to be transferred: " + str(error) + "\n")
+        record_failure('assets', asset["name"])
+        return False
+    if not check_res(r):
+        record_failure('assets', asset["name"])
+        return False
+    journal(destination, 'assets', asset["id"])
+    return True
+
+
+def create_issues(issues, destination_url, destination, milestones, labels, milestone_map, credentials, sameInstall,
+                  comments=None, source_credentials=None):
     """Post issues to GitHub
     INPUT:
         issues: python list of dicts containing issue info to be POSTED to GitHub
@@ -268,70 +1181,172 @@ def create_issues(issues, destination_url, destination, milestones, labels, mile
         destination_urlination: the team and repo '<team>/<repo>' to post issues to
         milestones: a boolean flag indicating that milestones were included in this migration
         labels: a boolean flag indicating that labels were included in this migration
+        comments: an optional dict mapping the comments_url of each issue to its already downloaded comments
+        source_credentials: the credentials used to GET comments that were not already downloaded
     OUTPUT: Null
     """
-    url = destination_url + "repos/" + destination + "/issues"
-    for issue in issues:
-        # create a new issue object containing only the data necessary for the creation of a new issue
-        assignee = None
-        if (issue["assignee"] and sameInstall):
-            assignee = issue["assignee"]["login"]
-        body = issue['body']# + '\n\n' + 'Original by @' + issue['user']['login']
-        issue_prime = {"title": issue["title"], "body": body,
-                       "assignee": assignee, "state": issue["state"]}
-        # if milestones were migrated and the issue to be posted contains milestones
-        if milestones and "milestone" in issue and issue["milestone"] is not None:
-            # if the milestone associated with the issue is in the milestone map
-            if issue['milestone']['number'] in milestone_map:
-                # set the milestone value of the new issue to the updated number of the migrated milestone
-                issue_prime["milestone"] = milestone_map[issue["milestone"]["number"]]
-        # if labels were migrated and the issue to be migrated contains labels
-        if labels and "labels" in issue:
-            issue_prime["labels"] = issue["labels"]
-        r = post_req(url, json.dumps(issue_prime), credentials)
-
-
-        my_data = r.json() # my_data is the response from the POST of the issue
-        comment_url = issue["comments_url"] # this is the comment URL used to GET comments from the original issue/pr
-        c = get_req(comment_url, credentials) # this is the response from GET of the original comment URL
-        my_comments = c.json() # this is the response from GET of the original comment URL in json
-        if 'comments_url' in my_data.keys():
-            append_comments(my_comments, credentials, my_data["comments_url"])
+    import async_migration
+    async_migration.run_threaded(async_migration.create_items, 'issues', issues, destination_url, destination,
+                                 milestones, labels, milestone_map, credentials, sameInstall, comments,
+                                 source_credentials)
 
-        status = check_res(r)
-        # if adding the issue failed
-        if not status:
-            # get the message from the response
-            message = json.loads(r.text)
-            # if the error message is for an invalid entry because of the assignee field, remove it and repost with no assignee
-            if 'errors' in message and message['errors'][0]['code'] == 'invalid' and message['errors'][0]['field'] == 'assignee':
-                sys.stderr.write("WARNING: Assignee " + message['errors'][0]['value'] + " on issue \"" + issue_prime['title'] +
-                                 "\" does not exist in the destination repository. Issue added without assignee field.\n\n")
-                issue_prime.pop('assignee')
-                post_req(url, json.dumps(issue_prime), credentials)
-
-def append_comments(comments, credentials, comment_url):
-    for comment in comments:
-
-        body = comment['body'] + '\n\n' + 'Original by @' + comment['user']['login']
-        comment_prime = {'body' : body}
-        r = post_req(comment_url, json.dumps(comment_prime), credentials)
 
-        status = check_res(r)
-        # if adding the issue failed
-        if not status:
-            # get the message from the response
-            message = json.loads(r.text)
-            # if the error message is for an invalid entry because of the assignee field, remove it and repost with no assignee
-            if 'errors' in message and message['errors'][0]['code'] == 'invalid' and message['errors'][0]['field'] == 'assignee':
-                sys.stderr.write("WARNING: Assignee " + message['errors'][0]['value'] + " on issue \"" + comment_prime['title'] +
-                                 "\" does not exist in the destination repository. Issue added without assignee field.\n\n")
-                issue_prime.pop('assignee')
-                post_req(comment_url, json.dumps(comment_prime), credentials)
+def issue_payload(issue, milestones, labels, milestone_map, sameInstall):
+    """
+    INPUT:
+        issue: a dict containing the issue info downloaded from the source
+        milestones: a boolean flag indicating that milestones were included in this migration
+        labels: a boolean flag indicating that labels were included in this migration
+    OUTPUT: a new issue object containing only the data necessary for the creation of the issue in the destination
+    """
+    assignee = None
+    if (issue["assignee"] and sameInstall):
+        assignee = issue["assignee"]["login"]
+    body = issue['body']# + '\n\n' + 'Original by @' + issue['user']['login']
+    issue_prime = {"title": issue["title"], "body": body,
+                   "assignee": assignee, "state": issue["state"]}
+    # if milestones were migrated and the issue to be posted contains milestones
+    if milestones and "milestone" in issue and issue["milestone"] is not None:
+        # if the milestone associated with the issue is in the milestone map
+        if issue['milestone']['number'] in milestone_map:
+            # set the milestone value of the new issue to the updated number of the migrated milestone
+            issue_prime["milestone"] = milestone_map[issue["milestone"]["number"]]
+    # if labels were migrated and the issue to be migrated contains labels
+    if labels and "labels" in issue:
+        issue_prime["labels"] = [label["name"] for label in issue["labels"]]
+    return issue_prime
+
+
+def fold_comments(body, comments):
+    """
+    INPUT:
+        body: the body of an issue/pr about to be created
+        comments: the comment thread of the original issue/pr
+    OUTPUT: the body with as many of the comments as fit within MAX_BODY_LENGTH rendered after it, in order and
+            attributed to their authors, and the list of the comments which did not fit and still have to be posted
+    """
+    body = body or ''
+    comments = list(comments)
+    for index, comment in enumerate(comments):
+        block = '\n\n---\n\n' + comment['body'] + '\n\n' + 'Original by @' + comment['user']['login']
+        if len(body) + len(block) > MAX_BODY_LENGTH:
+            return body, comments[index:]
+        body += block
+    return body, []
+
+
+def post_issue(url, issue_prime, credentials):
+    """
+    INPUT:
+        url: the issues endpoint of the destination
+        issue_prime: the issue object returned by issue_payload
+    OUTPUT: the issue created in the destination, as returned by GitHub. False if it failed to be created
+    """
+    import async_migration
+    return async_migration.run_threaded(async_migration.post_issue, url, issue_prime, credentials)
+
+
+def validated_kinds(item_prime):
+    """
+    INPUT: the issue/pr object returned by issue_payload or pr_payload
+    OUTPUT: the element types of the destination its fields are validated against by validate_payload
+    """
+    kinds = []
+    if item_prime.get("assignee") or item_prime.get("assignees"):
+        kinds.append('assignees')
+    if item_prime.get("labels"):
+        kinds.append('labels')
+    if item_prime.get("milestone") is not None:
+        kinds.append('milestones')
+    return kinds
+
+
+def validate_payload(item_prime, indexes, destination):
+    """Normalize an issue/pr object against the destination before it is written, so it is not rejected, and
+    posted again, because of a field the destination does not hold
+    INPUT:
+        item_prime: the issue/pr object returned by issue_payload or pr_payload. It is updated in place
+        indexes: a dict mapping each element type returned by validated_kinds to its index in the destination,
+                 as returned by DestinationIndex.index. A field is left as is if its index could not be listed
+        destination: the team and repo '<team>/<repo>' the issue/pr is written to
+    OUTPUT: the issue/pr object, without the assignees who cannot be assigned in the destination, nor the labels
+            and milestone missing from it. Labels are renamed as they are spelled in the destination
+    """
+    dropped = []
+    assignable = indexes.get('assignees')
+    if assignable is not None:
+        if item_prime.get("assignee") and item_prime["assignee"] not in assignable:
+            dropped.append("assignee " + item_prime.pop("assignee"))
+        for assignee in item_prime.get("assignees", []):
+            if assignee not in assignable:
+                dropped.append("assignee " + assignee)
+        if "assignees" in item_prime:
+            item_prime["assignees"] = [assignee for assignee in item_prime["assignees"] if assignee in assignable]
+    labels = indexes.get('labels')
+    if labels is not None and item_prime.get("labels"):
+        # label names are unique regardless of their case
+        spellings = {name.lower(): name for name in labels}
+        for label in item_prime["labels"]:
+            if label.lower() not in spellings:
+                dropped.append("label " + label)
+        item_prime["labels"] = [spellings[label.lower()] for label in item_prime["labels"] if label.lower() in spellings]
+    milestones = indexes.get('milestones')
+    if milestones is not None and item_prime.get("milestone") is not None:
+        numbers = set(milestone['number'] for elements, claimed in milestones.values() for milestone in elements)
+        if item_prime["milestone"] not in numbers:
+            dropped.append("milestone " + str(item_prime.pop("milestone")))
+    if dropped:
+        sys.stderr.write("WARNING: \"" + item_prime['title'] + "\" was added without the " + ", ".join(dropped) +
+                         ", missing from " + destination + ".\n\n")
+    return item_prime
+
+
+def invalid_assignee(r, issue_prime):
+    """
+    INPUT:
+        r: the failed response of a request creating an issue/pr
+        issue_prime: the issue/pr object that was posted
+    OUTPUT: True if the request failed because of an assignee missing from the destination, in which case the
+            assignee is removed from issue_prime so it can be posted again. False otherwise
+    """
+    # get the message from the response
+    message = json.loads(r.text)
+    # if the error message is for an invalid entry because of the assignee field
+    if 'errors' in message and message['errors'][0]['code'] == 'invalid' and message['errors'][0]['field'] == 'assignee':
+        sys.stderr.write("WARNING: Assignee " + message['errors'][0]['value'] + " on \"" + issue_prime['title'] +
+                         "\" does not exist in the destination repository. Added without assignee field.\n\n")
+        issue_prime.pop('assignee')
+        return True
+    return False
+
+
+def migrate_comments(source_comments_url, destination_comments_url, credentials, source_credentials, source_comments=None,
+                     destination=None, posted=0):
+    """Copy the comment thread of one issue/pr
+    INPUT:
+        source_comments_url: the url used to GET comments from the original issue/pr
+        destination_comments_url: the url used to POST comments to the migrated issue/pr
+        source_comments: the comments of the original issue/pr, if they were already downloaded
+        destination: the team and repo '<team>/<repo>' the comments are journaled under
+        posted: the number of comments of the thread already in the migrated issue/pr, which are skipped
+    OUTPUT: Null
+    """
+    import async_migration
+    async_migration.run_threaded(async_migration.migrate_comments, source_comments_url, destination_comments_url,
+                                 credentials, source_credentials, source_comments, destination, posted)
 
 
+def append_comments(comments, credentials, comment_url, destination=None):
+    """Post comments to an issue/pr
+    OUTPUT: True if every comment was posted (or journaled as posted by a previous run). False otherwise
+    """
+    import async_migration
+    return async_migration.run_threaded(async_migration.append_comments, comments, credentials, comment_url,
+                                        destination)
+
 
-def create_prs(prs, destination_url, destination, milestones, labels, milestone_map, credentials, sameInstall):
+def create_prs(prs, destination_url, destination, milestones, labels, milestone_map, credentials, sameInstall,
+               comments=None, source_credentials=None):
     """Post prs to GitHub
     INPUT:
         prs: python list of dicts containing pr info to be POSTED to GitHub
@@ -339,64 +1354,266 @@ def create_prs(prs, destination_url, destination, milestones, labels, milestone_
         destination_urlination: the team and repo '<team>/<repo>' to post prs to
         milestones: a boolean flag indicating that milestones were included in this migration
         labels: a boolean flag indicating that labels were included in this migration
+        comments: an optional dict mapping the comments_url of each pr to its already downloaded comments
+        source_credentials: the credentials used to GET comments that were not already downloaded
     OUTPUT: Null
     """
-    url = destination_url + "repos/" + destination + "/pulls"
-    for pr in prs:
-        # create a new pr object containing only the data necessary for the creation of a new pr
-        assignee = None
-        if (pr["assignee"] and sameInstall):
-            assignee = pr["assignee"]["login"]
-        body = pr['body'] + '\n\n' + 'Original by @' + pr['user']['login']
-        pr_prime = {"title": pr["title"], "body": body,
-                       "assignee": assignee, "state": pr["state"],
-                       "head": pr["head"]["label"], "base": "master"}
-        # if milestones were migrated and the pr to be posted contains milestones
-        if milestones and "milestone" in pr and pr["milestone"] is not None:
-            # if the milestone associated with the pr is in the milestone map
-            if pr['milestone']['number'] in milestone_map:
-                # set the milestone value of the new pr to the updated number of the migrated milestone
-                pr_prime["milestone"] = milestone_map[pr["milestone"]["number"]]
-        # if labels were migrated and the pr to be migrated contains labels
-        if labels and "labels" in pr:
-            pr_prime["labels"] = pr["labels"]
-        r = post_req(url, json.dumps(pr_prime), credentials)
-        status = check_res(r)
-        # if adding the pr failed
-        if not status:
-            # get the message from the response
-            message = json.loads(r.text)
-            # if the error message is for an invalid entry because of the assignee field, remove it and repost with no assignee
-            if 'errors' in message and message['errors'][0]['code'] == 'invalid' and message['errors'][0]['field'] == 'assignee':
-                sys.stderr.write("WARNING: Assignee " + message['errors'][0]['value'] + " on pr \"" + pr_prime['title'] +
-                                 "\" does not exist in the destination repository. pr added without assignee field.\n\n")
-                pr_prime.pop('assignee')
-                post_req(url, json.dumps(pr_prime), credentials)
-
-        my_data = r.json() # my_data is the response from the POST of the issue
-        comment_url = pr["comments_url"] # this is the comment URL used to GET comments from the original issue/pr
-        c = get_req(comment_url, credentials) # this is the response from GET of the original comment URL
-        my_comments = c.json() # this is the response from GET of the original comment URL in json
-        if 'comments_url' in my_data.keys():
-            append_comments(my_comments, credentials, my_data["comments_url"])
-
-        issue_url = destination_url + "repos/" + destination + "/issues/" + str(my_data["number"])
-        pr_update = {'labels': [i['name'] for i in pr['labels']], 'assignees': [i['login'] for i in pr['assignees']]}
-        r = post_req(issue_url, json.dumps(pr_update), credentials)
-        status = check_res(r)
-        # if adding the pr failed
-        if not status:
-            # get the message from the response
-            message = json.loads(r.text)
-            # if the error message is for an invalid entry because of the assignee field, remove it and repost with no assignee
-            if 'errors' in message and message['errors'][0]['code'] == 'invalid' and message['errors'][0]['field'] == 'assignee':
-                sys.stderr.write("WARNING: Assignee " + message['errors'][0]['value'] + " on pr \"" + pr_prime['title'] +
-                                 "\" does not exist in the destination repository. pr added without assignee field.\n\n")
-                pr_prime.pop('assignee')
-                post_req(url, json.dumps(pr_prime), credentials)
+    import async_migration
+    async_migration.run_threaded(async_migration.create_items, 'prs', prs, destination_url, destination, milestones,
+                                 labels, milestone_map, credentials, sameInstall, comments, source_credentials)
+
+
+def pr_payload(pr, milestones, labels, milestone_map, sameInstall):
+    """
+    INPUT:
+        pr: a dict containing the pr info downloaded from the source
+        milestones: a boolean flag indicating that milestones were included in this migration
+        labels: a boolean flag indicating that labels were included in this migration
+    OUTPUT: a new pr object containing only the data necessary for the creation of the pr in the destination.
+            Its head and base are the branches of the source pr, which must exist in the destination
+    """
+    assignees = []
+    if (pr["assignees"] and sameInstall):
+        assignees = [assignee["login"] for assignee in pr["assignees"]]
+    body = pr['body'] + '\n\n' + 'Original by @' + pr['user']['login']
+    pr_prime = {"title": pr["title"], "body": body,
+                   "assignees": assignees, "state": pr["state"],
+                   "head": pr["head"]["ref"], "base": pr["base"]["ref"]}
+    # if milestones were migrated and the pr to be posted contains milestones
+    if milestones and "milestone" in pr and pr["milestone"] is not None:
+        # if the milestone associated with the pr is in the milestone map
+        if pr['milestone']['number'] in milestone_map:
+            # set the milestone value of the new pr to the updated number of the migrated milestone
+            pr_prime["milestone"] = milestone_map[pr["milestone"]["number"]]
+    # if labels were migrated and the pr to be migrated contains labels
+    if labels and "labels" in pr:
+        pr_prime["labels"] = [label["name"] for label in pr["labels"]]
+    return pr_prime
+
+
+# Fields of a pr object accepted when creating the pr, the rest are set through its issue afterwards
+PULL_FIELDS = ['title', 'body', 'head', 'base']
+
+
+def pull_payload(pr_prime):
+    """
+    INPUT: the pr object returned by pr_payload
+    OUTPUT: the data POSTED to create the pr
+    """
+    return {field: pr_prime[field] for field in PULL_FIELDS}
+
+
+def issue_update(pr_prime):
+    """
+    INPUT: the pr object returned by pr_payload, validated by validate_payload
+    OUTPUT: the data PATCHED to the issue of the created pr to set its labels, assignees, milestone and state.
+            Empty if there is nothing to set
+    """
+    update = {}
+    if pr_prime.get("labels"):
+        update["labels"] = pr_prime["labels"]
+    if pr_prime.get("milestone") is not None:
+        update["milestone"] = pr_prime["milestone"]
+    if pr_prime.get("assignees"):
+        update["assignees"] = pr_prime["assignees"]
+    if pr_prime["state"] != "open":
+        update["state"] = "closed"
+    return update
+
+
+def missing_branches(pr_prime, branches, destination):
+    """
+    INPUT:
+        pr_prime: the pr object returned by pr_payload
+        branches: the index of the branches of the destination, as returned by DestinationIndex.index.
+                  None if they could not be listed
+    OUTPUT: True if the head or base branch of the pr is missing from the destination, so the pr cannot be created.
+            False if both exist, or if the branches could not be listed
+    """
+    if branches is None:
+        return False
+    missing = [pr_prime[end] for end in ("head", "base") if pr_prime[end] not in branches]
+    if missing:
+        sys.stderr.write("WARNING: The branch " + " and ".join(missing) + " of \"" + pr_prime['title'] +
+                         "\" does not exist in " + destination + ". The pr was not created.\n\n")
+    return bool(missing)
+
+
+# Every element type that can be migrated, in the order they are migrated
+PHASES = ['milestones', 'labels', 'collaborators', 'issues', 'prs', 'releases']
+
+PHASE_NAMES = {'milestones': 'Milestones', 'labels': 'Labels', 'collaborators': 'Collaborators',
+               'issues': 'Issues', 'prs': 'PRs', 'releases': 'Releases'}
+
+# The phases each phase waits for, when they are migrated. Issues and prs need the milestone map and the labels,
+# and the collaborators to be added first so they can be assigned; prs also wait for the issues, so issues and prs
+# are created in the same order, and with the same numbers, as in the source.
+PHASE_DEPENDENCIES = {'milestones': [], 'labels': [], 'collaborators': [], 'releases': [],
+                      'issues': ['milestones', 'labels', 'collaborators'],
+                      'prs': ['milestones', 'labels', 'collaborators', 'issues']}
+
+DOWNLOADERS = {'milestones': download_milestones, 'labels': download_labels,
+               'collaborators': download_collaborators, 'issues': download_issues,
+               'prs': download_prs, 'releases': download_releases}
+
+
+def download_elements(source_url, source, credentials, phases=PHASES, materialize=False):
+    """Download the elements of a repository to be migrated, without their comments
+    INPUT:
+        source_url: the root url for the GitHub API
+        source: the team and repo '<team>/<repo>' to download from
+        phases: the element types to download
+        materialize: a boolean flag to download every page up front, rather than as the elements are migrated
+    OUTPUT: a dict mapping each phase to its elements. False if any element type failed to be retrieved
+    """
+    template = {}
+    for phase in phases:
+        try:
+            with migration_metrics.phase('download'):
+                elements = DOWNLOADERS[phase](source_url, source, credentials)
+                if elements is not False and materialize:
+                    elements = list(elements)
+        except IOError as error:
+            sys.stderr.write('ERROR: ' + str(error) + '\n')
+            elements = False
+        if elements is False:
+            sys.stderr.write('ERROR: ' + PHASE_NAMES[phase] + ' failed to be retrieved.\n')
+            return False
+        template[phase] = elements
+    return template
+
+
+def download_template(source_url, source, credentials, phases=PHASES, materialize=False):
+    """Download the elements of a repository to be migrated
+    INPUT:
+        source_url: the root url for the GitHub API
+        source: the team and repo '<team>/<repo>' to download from
+        phases: the element types to download
+        materialize: a boolean flag to download every page, and the comments of every issue/pr, up front,
+                     so the template can be populated into any number of destinations
+    OUTPUT: a dict mapping each phase to its elements, plus a 'comments' dict mapping the comments_url of each
+            issue/pr to its comments when materialized. False if any element type failed to be retrieved
+    """
+    template = download_elements(source_url, source, credentials, phases, materialize)
+    if template is not False and materialize:
+        threads = [item['comments_url'] for item in template.get('issues', []) + template.get('prs', [])]
+        def download_thread(url):
+            with migration_metrics.phase('download'):
+                thread = list_pages(url, credentials)
+                return thread and list(project('comments', thread))
+        with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+            template['comments'] = dict(zip(threads, executor.map(download_thread, threads)))
+        if any(thread is False for thread in template['comments'].values()):
+            sys.stderr.write('ERROR: Comments failed to be retrieved.\n')
+            return False
+    return template
 
 
-def main():
+def generate_repository(destination_url, template, destination, credentials, private=True):
+    """Create a repository from a template repository, with the files and commit history of all its branches
+    INPUT:
+        destination_url: the root url for the GitHub API
+        template: the team and repo '<team>/<repo>' of a repository marked as a template
+        destination: the team and repo '<team>/<repo>' to create
+        private: a boolean flag to create the repository as private
+    OUTPUT: True once the repository holds the content of the template, which GitHub copies after answering.
+            A repository which already exists, e.g. generated by an interrupted run, is used as it is.
+            False if it failed to be created, or was not ready within READY_TIMEOUT
+    """
+    owner, name = destination.split('/', 1)
+    r = post_req(destination_url + "repos/" + template + "/generate",
+                 # every branch is copied, as the prs of the template are opened again from their head branches
+                 json.dumps({"owner": owner, "name": name, "private": private, "include_all_branches": True}),
+                 credentials)
+    if PLAN is not None:
+        # a dry run generates nothing to wait for
+        return True
+    if r.status_code == 422 and 'already exists' in r.text:
+        log("Repository " + destination + " already exists, it is populated as it is.")
+    elif not check_res(r):
+        sys.stderr.write("ERROR: " + destination + " failed to be generated from " + template + ".\n")
+        return False
+    return wait_until_ready(destination_url, destination, credentials)
+
+
+def wait_until_ready(destination_url, destination, credentials):
+    """Poll a repository generated from a template, with exponential backoff, until GitHub has copied its content
+    OUTPUT: True as soon as the repository lists a branch. False if it did not within READY_TIMEOUT
+    """
+    url = destination_url + "repos/" + destination + "/branches"
+    deadline = time.time() + READY_TIMEOUT
+    interval = READY_POLL_INTERVAL
+    while True:
+        # the repository may not even be found until GitHub has started generating it
+        r = get_req(url, credentials)
+        if r.status_code == 200 and json.loads(r.text):
+            return True
+        if time.time() + interval > deadline:
+            sys.stderr.write("ERROR: " + destination + " was still not ready " + str(int(READY_TIMEOUT)) +
+                             " seconds after being generated.\n")
+            return False
+        time.sleep(interval)
+        interval = min(interval * 2, READY_POLL_MAX_INTERVAL)
+
+
+def populate_repository(template, destination_url, destination, credentials, sameInstall, source_credentials=None):
+    """Post the elements of a downloaded template to GitHub, each phase as soon as the phases it depends on (see
+    PHASE_DEPENDENCIES) have finished
+    INPUT:
+        template: the dict of elements returned by download_template
+        destination_url: the root url for the GitHub API
+        destination: the team and repo '<team>/<repo>' to post to
+        sameInstall: a boolean flag indicating that the source and destination are the same GitHub installation
+        source_credentials: the credentials used to GET comments that were not downloaded with the template
+    OUTPUT: True if every element was migrated. False if any failed to be, or a phase was only partly migrated
+    """
+    import async_migration
+    return async_migration.run_threaded(async_migration.populate_repository, template, destination_url, destination,
+                                        credentials, sameInstall, source_credentials)
+
+
+def migrate(source, destination, credentials, phases=PHASES, destination_credentials=None,
+            source_url=GITHUB_API_ROOT, destination_url=None, graphql=False, asynchronous=False, concurrency=None):
+    """Migrate the elements of one repository to another, without going through the command line
+    INPUT:
+        source: the team and repo '<team>/<repo>' to migrate from
+        destination: the team and repo '<team>/<repo>' to migrate to
+        credentials: the credentials of the source, also used for the destination unless destination_credentials are given
+        phases: the element types to migrate
+        source_url: the root url for the GitHub API of the source
+        destination_url: the root url for the GitHub API of the destination. Defaults to source_url
+        graphql: a boolean flag to download the source through the GraphQL API
+        asynchronous: a boolean flag to run the migration on the asyncio client path of async_migration
+        concurrency: the number of requests in flight at the same time on the asyncio client path
+    OUTPUT: the elements downloaded from the source. False if they failed to be retrieved
+    """
+    destination_url = destination_url or source_url
+    destination_credentials = destination_credentials or credentials
+    sameInstall = source_url == destination_url
+    template = None
+    if graphql:
+        import github_graphql
+        template = github_graphql.download_template(source_url, source, credentials, phases)
+        if template is False:
+            return False
+    if asynchronous:
+        import async_migration
+        # a template downloaded through GraphQL is populated as it is, otherwise it is downloaded on the event loop
+        return async_migration.run(source_url, source, [(destination_url, destination)], destination_credentials,
+                                   sameInstall, credentials, phases, template,
+                                   concurrency=concurrency or async_migration.CONCURRENCY)
+    if template is None:
+        template = download_template(source_url, source, credentials, phases)
+    if template is False:
+        return False
+    populate_repository(template, destination_url, destination, destination_credentials, sameInstall, credentials)
+    return template
+
+
+def build_parser():
+    """
+    OUTPUT: the parser of the command line arguments of main
+    """
     parser = argparse.ArgumentParser(
         description='Migrate Milestones, Labels, and Issues between two GitHub repositories. To migrate a subset of elements (Milestones, Labels, Issues), use the element specific flags (--milestones, --lables, --issues). Providing no flags defaults to all element types being migrated.')
     parser.add_argument('user_name', type=str,
@@ -427,7 +1644,74 @@ def main():
                         help='Toggle on PR migration.')
     parser.add_argument('--releases', '-r', action="store_true",
                         help='Toggle on Release migration.')
-    args = parser.parse_args()
+    parser.add_argument('--poolSize', '-ps', nargs='?', default=POOL_SIZE, type=int,
+                        help='The number of keep-alive connections to hold open for each GitHub API root. Defaults to ' + str(POOL_SIZE) + '.')
+    parser.add_argument('--workers', '-w', nargs='?', default=WORKERS, type=int,
+                        help='The number of issue and pr comment threads to migrate concurrently. Issues and prs are still created in source order. Defaults to ' + str(WORKERS) + '.')
+    parser.add_argument('--writeInterval', '-wi', nargs='?', default=WRITE_INTERVAL, type=float,
+                        help='The minimum number of seconds between two writes made with the same token, to stay under GitHub\'s secondary rate limits. Defaults to ' + str(WRITE_INTERVAL) + '.')
+    parser.add_argument('--maxRetries', '-mr', nargs='?', default=MAX_RETRIES, type=int,
+                        help='The number of times a rate limited or failed request is retried. Defaults to ' + str(MAX_RETRIES) + '.')
+    parser.add_argument('--readTokens', '-rt', nargs='+', type=str,
+                        help='Additional credentials of the source GitHub installation to spread the reads of the migration across, each as <user_name>:<token>, or as a GitHub App installation token alone. Each read of the source is sent with whichever token has the most rate limit left; writes, and reads of the destination, are always made with the destination token. Each token must be able to read the source.')
+    parser.add_argument('--snapshot', '-s', nargs='?', type=str,
+                        help='A directory keeping a snapshot of the source repository. Reads of the source are revalidated against the snapshot with conditional requests, which do not count against the rate limit.')
+    parser.add_argument('--fromSnapshot', '-fs', action="store_true",
+                        help='Read the source repository from the --snapshot directory alone, without contacting its API.')
+    parser.add_argument('--graphql', '-g', action="store_true",
+                        help='Download the milestones, labels, issues, prs and their comments from the source through the GitHub GraphQL API, 100 at a time, instead of one REST call per issue and pr.')
+    parser.add_argument('--journal', '-j', nargs='?', type=str,
+                        help='A file journaling every element created in the destination, so an interrupted migration can be resumed.')
+    parser.add_argument('--resume', '-re', action="store_true",
+                        help='Resume the migration recorded in the --journal file, skipping the elements it already created.')
+    parser.add_argument('--foldComments', '-fc', action="store_true",
+                        help='Render the comment thread of every issue and pr into its body, with the author of each comment, instead of posting the comments one by one. Comments beyond GitHub\'s limit on the size of a body are still posted.')
+    parser.add_argument('--asyncio', '-aio', action="store_true",
+                        help='Run the migration as coroutines on a single event loop, over HTTP/2 when available, instead of on threads. Requires httpx.')
+    parser.add_argument('--concurrency', '-cc', nargs='?', type=int,
+                        help='The number of requests in flight at the same time with --asyncio. Defaults to the CONCURRENCY of async_migration.py.')
+    parser.add_argument('--sync', '-sy', nargs='?', type=str,
+                        help='Bring a destination previously migrated from the source up to date instead of migrating everything again, recording what was synced in the given state file. Only the elements added or changed since the last sync are created or patched.')
+    parser.add_argument('--plan', '-pl', action="store_true",
+                        help='Dry run: make the reads of the migration but none of its writes, and print every write it would make, by phase, with the number of requests and the time the migration is projected to take under the rate limits.')
+    parser.add_argument('--planJson', '-pj', nargs='?', type=str,
+                        help='A file to write the --plan of the migration to, as JSON. Implies --plan.')
+    parser.add_argument('--metricsJson', '-mj', nargs='?', type=str,
+                        help='A file to write the request metrics of the migration to, as JSON.')
+    parser.add_argument('--metricsPrometheus', '-mp', nargs='?', type=str,
+                        help='A file to write the request metrics of the migration to, in the Prometheus textfile format.')
+    return parser
+
+
+def main(argv=None):
+    """
+    INPUT: the command line arguments, after the program name. Defaults to sys.argv
+    OUTPUT: Null
+    """
+    global POOL_SIZE, WORKERS, WRITE_INTERVAL, MAX_RETRIES, FOLD_COMMENTS
+    args = build_parser().parse_args(argv)
+
+    if args.resume and not args.journal:
+        sys.stderr.write("Error: --resume requires the --journal file of the migration to resume.")
+        quit()
+    if args.plan or args.planJson:
+        enable_plan()
+    # a dry run only reads the journal of the migration it resumes, and a new journal would be empty
+    if args.journal and (args.resume or PLAN is None):
+        enable_journal(args.journal, args.resume)
+
+    if args.fromSnapshot and not args.snapshot:
+        sys.stderr.write("Error: --fromSnapshot requires the --snapshot directory to read from.")
+        quit()
+    if args.snapshot:
+        enable_snapshot(args.snapshot, args.source_repo, args.fromSnapshot)
+
+    WRITE_INTERVAL = args.writeInterval
+    MAX_RETRIES = args.maxRetries
+    FOLD_COMMENTS = args.foldComments
+    WORKERS = max(1, args.workers)
+    # every worker, plus every phase running concurrently, needs its own pooled connection
+    POOL_SIZE = max(args.poolSize, WORKERS + len(PHASES))
 
     destination_repo = args.destination_repo
     source_repo = args.source_repo
@@ -458,95 +1742,51 @@ def main():
     source_root = args.sourceRoot + '/'
     destination_root = args.destinationRoot + '/'
 
-    milestone_map = None
-
-    if args.milestones is False and args.labels is False and args.issues is False and args.releases is False and args.prs is False and args.collaborators is False:
-        args.milestones = True
-        args.labels = True
-        args.issues = True
-        args.prs = True
-        args.releases = True
-        args.collaborators = True
-
-    if args.milestones:
-        milestones = download_milestones(
-            source_root, source_repo, source_credentials)
-        if milestones:
-            milestone_map = create_milestones(
-                milestones, destination_root, destination_repo, destination_credentials)
-        elif milestones is False:
-            sys.stderr.write(
-                'ERROR: Milestones failed to be retrieved. Exiting...')
-            quit()
-        else:
-            print("No milestones found. None migrated")
-
-    if args.labels:
-        labels = download_labels(source_root, source_repo, source_credentials)
-        if labels:
-            create_labels(labels, destination_root,
-                          destination_repo, destination_credentials)
-        elif labels is False:
-            sys.stderr.write(
-                'ERROR: Labels failed to be retrieved. Exiting...')
-            quit()
-        else:
-            print("No Labels found. None migrated")
-
-    if args.collaborators:
-        collaborators = download_collaborators(source_root, source_repo, source_credentials)
-        if collaborators:
-            create_collaborators(collaborators, destination_root,
-                        destination_repo, destination_credentials)
-        elif collaborators is False:
-            sys.stderr.write(
-                'ERROR: Collaborators failed to be retrieved. Exiting...')
-            quit()
-        else:
-            print("No Collaborators found. None migrated")
-
-    if args.issues:
-        issues = download_issues(source_root, source_repo, source_credentials)
-        if issues:
-            sameInstall = False
-            if (args.sourceRoot == args.destinationRoot):
-                sameInstall = True
-            create_issues(issues, destination_root, destination_repo, args.milestones,
-                          args.labels, milestone_map, destination_credentials, sameInstall)
-        elif issues is False:
-            sys.stderr.write(
-                'ERROR: Issues failed to be retrieved. Exiting...')
-            quit()
-        else:
-            print("No Issues found. None migrated")
-
-    if args.prs:
-        prs = download_prs(source_root, source_repo, source_credentials)
-        if prs:
-            sameInstall = False
-            if (args.sourceRoot == args.destinationRoot):
-                sameInstall = True
-            create_prs(prs, destination_root, destination_repo, args.milestones,
-                        args.labels, milestone_map, destination_credentials, sameInstall)
-        elif prs is False:
-            sys.stderr.write(
-                'ERROR: PRs failed to be retrieved. Exiting...')
-            quit()
-        else:
-            print("No PRs found. None migrated")
-
-    if args.releases:
-        releases = download_releases(source_root, source_repo, source_credentials)
-        if releases:
-            create_releases(releases, destination_root, destination_repo,
-                    destination_credentials)
-        elif releases is False:
-            sys.stderr.write(
-                'ERROR: Releases failed to be retrieved. Exiting...')
+    if args.readTokens:
+        enable_credential_pool([parse_credentials(value) for value in args.readTokens], source_root, [source_repo])
+
+    phases = [phase for phase in PHASES if getattr(args, phase)]
+    if not phases:
+        phases = PHASES
+
+    if args.asyncio and (args.sync or args.snapshot):
+        sys.stderr.write("Error: --asyncio cannot be combined with --sync or --snapshot.")
+        quit()
+
+    if args.sync:
+        import template_sync
+        result = template_sync.sync(source_root, source_repo, [(destination_root, destination_repo)],
+                                    destination_credentials, args.sync, source_root == destination_root,
+                                    source_credentials)[0]
+        if result:
+            print("Synced " + destination_repo + ": " + str(result['created']) + " created, " +
+                  str(result['patched']) + " patched, " + str(result['comments']) + " comments appended.")
+    else:
+        template = migrate(source_repo, destination_repo, source_credentials, phases, destination_credentials,
+                           source_root, destination_root, args.graphql, args.asyncio, args.concurrency)
+        if template is False:
+            sys.stderr.write('Exiting...')
             quit()
-        else:
-            print("No releases found. None migrated")
 
+    if JOURNAL is not None:
+        JOURNAL.close()
+    close_sessions()
+
+    if PLAN is not None:
+        concurrency = WORKERS
+        if args.asyncio:
+            import async_migration
+            concurrency = args.concurrency or async_migration.CONCURRENCY
+        estimate = PLAN.estimate(concurrency, WRITE_INTERVAL, SCHEDULER.budgets.get(destination_credentials['token']))
+        print(PLAN.summary(estimate))
+        if args.planJson:
+            PLAN.write_json(args.planJson, estimate)
+
+    print(migration_metrics.summary())
+    if args.metricsJson:
+        migration_metrics.write_json(args.metricsJson)
+    if args.metricsPrometheus:
+        migration_metrics.write_prometheus(args.metricsPrometheus)
 
 
 if __name__ == "__main__":
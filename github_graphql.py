@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+GraphQL fetch backend for github_duplication.
+
+Downloads the milestones, labels, issues and prs of a repository, with their comments nested inside,
+in pages of 100 per query instead of one REST call per issue/pr. The elements are returned as the same
+records as the REST downloads, so create_issues, create_prs and append_comments consume them unchanged.
+"""
+
+import json
+import sys
+
+import github_duplication
+from migration_records import Comment, Issue, Label, Milestone, PullRequest
+
+# Element types that can be fetched through GraphQL. The rest fall back to their REST download.
+GRAPHQL_PHASES = ['milestones', 'labels', 'issues', 'prs']
+
+PAGE_INFO = "pageInfo { hasNextPage endCursor }"
+
+COMMENTS = "comments(first: 100) { " + PAGE_INFO + " nodes { databaseId body author { login } } }"
+
+ITEM_FIELDS = """
+        number title body state
+        author { login }
+        assignees(first: 10) { nodes { login } }
+        milestone { number }
+        labels(first: 100) { nodes { name color } }
+        """ + COMMENTS
+
+MILESTONES_QUERY = """
+query($owner: String!, $name: String!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    milestones(first: 100, after: $cursor, states: [OPEN], orderBy: {field: NUMBER, direction: ASC}) {
+      """ + PAGE_INFO + """
+      nodes { number title state description dueOn }
+    }
+  }
+}"""
+
+LABELS_QUERY = """
+query($owner: String!, $name: String!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    labels(first: 100, after: $cursor) {
+      """ + PAGE_INFO + """
+      nodes { name color }
+    }
+  }
+}"""
+
+ISSUES_QUERY = """
+query($owner: String!, $name: String!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    issues(first: 100, after: $cursor, states: [OPEN], orderBy: {field: CREATED_AT, direction: ASC}) {
+      """ + PAGE_INFO + """
+      nodes { """ + ITEM_FIELDS + """ }
+    }
+  }
+}"""
+
+PRS_QUERY = """
+query($owner: String!, $name: String!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    pullRequests(first: 100, after: $cursor, states: [OPEN], orderBy: {field: CREATED_AT, direction: ASC}) {
+      """ + PAGE_INFO + """
+      nodes { """ + ITEM_FIELDS + """ headRefName baseRefName headRepositoryOwner { login } }
+    }
+  }
+}"""
+
+# Follows the comments of a single issue/pr past its first 100, which are fetched along with it
+MORE_COMMENTS_QUERY = """
+query($owner: String!, $name: String!, $number: Int!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    issueOrPullRequest(number: $number) {
+      ... on Issue { comments(first: 100, after: $cursor) { """ + PAGE_INFO + """ nodes { databaseId body author { login } } } }
+      ... on PullRequest { comments(first: 100, after: $cursor) { """ + PAGE_INFO + """ nodes { databaseId body author { login } } } }
+    }
+  }
+}"""
+
+
+def graphql_url(source_url):
+    """
+    INPUT: the root url for the GitHub REST API
+    OUTPUT: the GraphQL endpoint of the same GitHub installation
+    """
+    root = source_url.rstrip('/')
+    if root.endswith('/api/v3'):
+        return root[:-len('/v3')] + '/graphql'
+    return root + '/graphql'
+
+
+def run_query(url, query, variables, credentials):
+    """
+    INPUT:
+        url: the GraphQL endpoint
+        query: the GraphQL query document
+        variables: a dict of the query variables
+    OUTPUT: the data returned by the query if it succeeded. False otherwise
+    """
+    # queries only read, so they are paced as reads rather than as content-creating POSTs
+    r = github_duplication.send_req('POST', url, credentials, json.dumps({'query': query, 'variables': variables}),
+                                    write=False)
+    status = github_duplication.check_res(r)
+    if not status:
+        return False
+    result = json.loads(r.text)
+    if result.get('errors'):
+        github_duplication.log("GRAPHQL ERRORS: " + json.dumps(result['errors']))
+        return False
+    return result['data']
+
+
+def query_connection(url, query, variables, path, credentials):
+    """
+    INPUT:
+        query: a GraphQL query taking a $cursor variable
+        path: the keys leading from the query data to the paginated connection
+    OUTPUT: every node of the connection, following its cursor 100 nodes at a time. False if any page failed
+    """
+    nodes = []
+    cursor = None
+    while True:
+        data = run_query(url, query, dict(variables, cursor=cursor), credentials)
+        if data is False:
+            return False
+        connection = data
+        for key in path:
+            connection = connection[key]
+        nodes.extend(connection['nodes'])
+        if not connection['pageInfo']['hasNextPage']:
+            return nodes
+        cursor = connection['pageInfo']['endCursor']
+
+
+def login(actor):
+    """Deleted accounts are returned as a null actor, which GitHub displays as @ghost"""
+    return {'login': actor['login'] if actor else 'ghost'}
+
+
+def as_comment(node):
+    return Comment({'id': node['databaseId'], 'body': node['body'], 'user': login(node['author'])})
+
+
+def as_label(node):
+    return Label({'name': node['name'], 'color': node['color']})
+
+
+def as_milestone(node):
+    return Milestone({'number': node['number'], 'title': node['title'], 'state': node['state'].lower(),
+                      'description': node['description'], 'due_on': node['dueOn']})
+
+
+def as_item(node, comments_url):
+    """Convert an issue/pr node into the record the REST download projects the issue/pr into"""
+    assignees = [{'login': assignee['login']} for assignee in node['assignees']['nodes']]
+    item = {'number': node['number'], 'title': node['title'], 'body': node['body'], 'state': node['state'].lower(),
+            'user': login(node['author']), 'assignee': assignees[0] if assignees else None, 'assignees': assignees,
+            'milestone': {'number': node['milestone']['number']} if node['milestone'] else None,
+            'labels': [as_label(label) for label in node['labels']['nodes']], 'comments_url': comments_url}
+    if 'headRefName' in node:
+        owner = node['headRepositoryOwner']['login'] if node['headRepositoryOwner'] else 'ghost'
+        item['head'] = {'label': owner + ':' + node['headRefName'], 'ref': node['headRefName']}
+        item['base'] = {'ref': node['baseRefName']}
+        return PullRequest(item)
+    return Issue(item)
+
+
+def download_items(url, source_url, source, credentials, query, connection, comments):
+    """
+    INPUT:
+        query: the query listing the issues or the prs of the source
+        connection: the name of the connection listed by the query
+        comments: the dict in which the comments of every item are stored under its comments_url
+    OUTPUT: the issues/prs of the source, in order of their number. False if they failed to be retrieved
+    """
+    owner, name = source.split('/', 1)
+    nodes = query_connection(url, query, {'owner': owner, 'name': name}, ['repository', connection], credentials)
+    if nodes is False:
+        return False
+    items = []
+    for node in nodes:
+        comments_url = source_url + "repos/" + source + "/issues/" + str(node['number']) + "/comments"
+        thread = node['comments']['nodes']
+        if node['comments']['pageInfo']['hasNextPage']:
+            # only long threads cost an extra query per 100 comments
+            variables = {'owner': owner, 'name': name, 'number': node['number']}
+            thread = query_connection(url, MORE_COMMENTS_QUERY, variables,
+                                      ['repository', 'issueOrPullRequest', 'comments'], credentials)
+            if thread is False:
+                return False
+        comments[comments_url] = [as_comment(comment) for comment in thread]
+        items.append(as_item(node, comments_url))
+    return items
+
+
+def download_template(source_url, source, credentials, phases=github_duplication.PHASES):
+    """Download the elements of a repository to be migrated, through the GraphQL API where possible
+    INPUT:
+        source_url: the root url for the GitHub API
+        source: the team and repo '<team>/<repo>' to download from
+        phases: the element types to download
+    OUTPUT: the same dict as github_duplication.download_template with materialize set, including the comments
+            of every issue/pr. False if any element type failed to be retrieved
+    """
+    url = graphql_url(source_url)
+    owner, name = source.split('/', 1)
+    variables = {'owner': owner, 'name': name}
+    template = {'comments': {}}
+    for phase in phases:
+        if phase == 'milestones':
+            nodes = query_connection(url, MILESTONES_QUERY, variables, ['repository', 'milestones'], credentials)
+            elements = nodes and [as_milestone(node) for node in nodes]
+        elif phase == 'labels':
+            nodes = query_connection(url, LABELS_QUERY, variables, ['repository', 'labels'], credentials)
+            elements = nodes and [as_label(node) for node in nodes]
+        elif phase == 'issues':
+            elements = download_items(url, source_url, source, credentials, ISSUES_QUERY, 'issues',
+                                      template['comments'])
+        elif phase == 'prs':
+            elements = download_items(url, source_url, source, credentials, PRS_QUERY, 'pullRequests',
+                                      template['comments'])
+        else:
+            try:
+                elements = github_duplication.DOWNLOADERS[phase](source_url, source, credentials)
+                elements = elements and list(elements)
+            except IOError as error:
+                sys.stderr.write('ERROR: ' + str(error) + '\n')
+                elements = False
+        if elements is False:
+            sys.stderr.write('ERROR: ' + github_duplication.PHASE_NAMES[phase] + ' failed to be retrieved.\n')
+            return False
+        template[phase] = elements
+    return template
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Export and import archives of the elements of a repository to be migrated.
+
+`export` downloads the milestones, labels, collaborators, issues, prs, comments and releases of a repository once
+and writes them to a gzip compressed, newline-delimited JSON archive: a header line naming the format, its
+version, the source and the element types exported, followed by one line per element, each comment thread
+following the issue/pr it belongs to. Elements are stored as the compact records of migration_records, so the
+archive only holds what a migration reads.
+
+`import` replays an archive into any destination, on any GitHub installation, exactly as github_duplication
+populates a destination from a downloaded template, without reading the source API again. The archive is
+streamed line by line into the create phases, so neither it nor its elements are ever held in memory as a whole.
+The assets of releases are not archived: releases are imported without them.
+
+Usage:
+    migration_archive.py export USER TOKEN owner/templet templet.ndjson.gz
+    migration_archive.py import USER TOKEN templet.ndjson.gz owner/copy --destinationRoot https://github.example.com
+"""
+
+import argparse
+import gzip
+import itertools
+import json
+import sys
+import threading
+import time
+
+import github_duplication
+import migration_metrics
+from migration_records import RECORDS
+
+# The format named by the header of every archive, and the version of it written by export
+ARCHIVE_FORMAT = 'github-duplication-archive'
+ARCHIVE_VERSION = 1
+
+
+def api_url(domain):
+    """
+    INPUT: a GitHub domain, as given to --sourceRoot and --destinationRoot
+    OUTPUT: the root url of its API
+    """
+    domain = domain.rstrip('/')
+    if domain != 'https://api.github.com':
+        domain += '/api/v3'
+    return domain + '/'
+
+
+def write_line(archive, entry):
+    # records are Mappings, written as the JSON objects they were projected from
+    archive.write(json.dumps(entry, default=dict, separators=(',', ':')) + '\n')
+
+
+def export_archive(source_url, source, credentials, path, phases=github_duplication.PHASES, graphql=False):
+    """Download a repository to be migrated and write it to an archive
+    INPUT:
+        source_url: the root url for the GitHub API
+        source: the team and repo '<team>/<repo>' to export
+        path: the archive to write
+        phases: the element types to export
+        graphql: a boolean flag to download the source through the GraphQL API
+    OUTPUT: a dict mapping each element type to the number of elements exported. False if the source failed to be
+            downloaded, in which case no archive is written
+    """
+    if graphql:
+        import github_graphql
+        template = github_graphql.download_template(source_url, source, credentials, phases)
+    else:
+        template = github_duplication.download_template(source_url, source, credentials, phases, materialize=True)
+    if template is False:
+        return False
+    comments = template.get('comments', {})
+    counts = {}
+    with gzip.open(path, 'wt', encoding='utf-8') as archive:
+        write_line(archive, {'format': ARCHIVE_FORMAT, 'version': ARCHIVE_VERSION, 'source': source,
+                             'source_url': source_url, 'phases': [phase for phase in phases if phase in template],
+                             'exported_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())})
+        for phase in phases:
+            counts[phase] = 0
+            for element in template.get(phase, []):
+                write_line(archive, {'kind': phase, 'element': element})
+                counts[phase] += 1
+                if phase in ('issues', 'prs'):
+                    for comment in comments.get(element['comments_url'], []):
+                        write_line(archive, {'kind': 'comments', 'thread': element['comments_url'],
+                                             'element': comment})
+                        counts['comments'] = counts.get('comments', 0) + 1
+    return counts
+
+
+def read_archive(path):
+    """
+    INPUT: the path of an archive
+    OUTPUT: a generator of the header of the archive, then of every entry of it, read one line at a time
+    """
+    with gzip.open(path, 'rt', encoding='utf-8') as archive:
+        header = json.loads(archive.readline() or '{}')
+        if header.get('format') != ARCHIVE_FORMAT:
+            raise ValueError(path + " is not an archive written by migration_archive.py export.")
+        if header.get('version', 0) > ARCHIVE_VERSION:
+            raise ValueError(path + " was written by a newer version, " + str(header['version']) +
+                             ", of the archive format than this one, " + str(ARCHIVE_VERSION) + ".")
+        yield header
+        for line in archive:
+            if line.strip():
+                yield json.loads(line)
+
+
+class ArchivedThreads(object):
+    """
+    The comment threads of the issues and prs being imported, looked up by the create_* functions of
+    github_duplication like the comments dict of a downloaded template. Each thread is held from when its
+    issue/pr is read from the archive until it is looked up, so only the threads of the elements in flight are
+    in memory, never the threads of the whole archive.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.threads = {}
+
+    def put(self, comments_url, thread):
+        with self.lock:
+            self.threads[comments_url] = thread
+
+    def discard(self, comments_url):
+        with self.lock:
+            self.threads.pop(comments_url, None)
+
+    def get(self, comments_url, default=None):
+        """OUTPUT: the thread of an issue/pr, no longer held once it is looked up"""
+        with self.lock:
+            return self.threads.pop(comments_url, default)
+
+
+def archived_elements(path, kind, threads, source):
+    """
+    INPUT:
+        path: the path of an archive
+        kind: the element type to read
+        threads: the ArchivedThreads the comment threads of issues and prs are handed over in
+        source: the repository the archive was exported from
+    OUTPUT: a generator of the records of the archived elements of the type, read one line at a time. The thread
+            of an issue/pr is put in threads just before the issue/pr is generated, and dropped once the next one
+            is asked for. Releases are generated without their assets
+    """
+    entries = read_archive(path)
+    next(entries)
+    pending, thread, assets = None, [], 0
+    for entry in itertools.chain(entries, [{'kind': None}]):
+        if entry['kind'] == 'comments':
+            if pending is not None:
+                thread.append(RECORDS['comments'](entry['element']))
+            continue
+        if pending is not None:
+            # every thread is archived, so none is downloaded from the source while the archive is imported
+            threads.put(pending['comments_url'], thread)
+            yield pending
+            threads.discard(pending['comments_url'])
+            pending, thread = None, []
+        if entry['kind'] != kind:
+            continue
+        element = entry['element']
+        if kind == 'releases':
+            assets += len(element.get('assets') or [])
+            element = dict(element, assets=[])
+        if kind in ('issues', 'prs'):
+            pending = RECORDS[kind](element)
+        else:
+            yield RECORDS[kind](element)
+    if assets:
+        sys.stderr.write("WARNING: The " + str(assets) + " release assets of " + source +
+                         " are not archived, its releases are imported without them.\n")
+
+
+def load_archive(path):
+    """
+    INPUT: the path of an archive
+    OUTPUT: the header of the archive, and the same dict as github_duplication.download_template without
+            materialize, each element type streamed from the archive by archived_elements as it is migrated.
+            Phases run concurrently, so each reads its own pass over the archive
+    """
+    entries = read_archive(path)
+    header = next(entries)
+    entries.close()
+    threads = ArchivedThreads()
+    template = {phase: archived_elements(path, phase, threads, header['source']) for phase in header['phases']}
+    template['comments'] = threads
+    return header, template
+
+
+def import_archive(path, destination_url, destination, credentials):
+    """Populate a destination with the elements of an archive, without reading the source it was exported from
+    INPUT:
+        path: the archive to import
+        destination_url: the root url for the GitHub API
+        destination: the team and repo '<team>/<repo>' to import into
+    OUTPUT: the header of the archive
+    """
+    header, template = load_archive(path)
+    # assignees are only kept on the installation the archive was exported from
+    sameInstall = header['source_url'] == destination_url
+    github_duplication.populate_repository(template, destination_url, destination, credentials, sameInstall)
+    return header
+
+
+def build_parser():
+    """
+    OUTPUT: the parser of the command line arguments of main
+    """
+    parser = argparse.ArgumentParser(
+        description='Export the Milestones, Labels, Issues, PRs, their comments and the Releases of a GitHub repository to an archive, or import an archive into a GitHub repository.')
+    commands = parser.add_subparsers(dest='command')
+    export_parser = commands.add_parser('export', help='Write the elements of a repository to an archive.')
+    export_parser.add_argument('user_name', type=str,
+                               help='Your GitHub (public or enterprise) username: name@email.com')
+    export_parser.add_argument('token', type=str, help='Your GitHub (public or enterprise) personal access token')
+    export_parser.add_argument('source_repo', type=str,
+                               help='the team and repo to export: <team_name>/<repo_name>')
+    export_parser.add_argument('archive', type=str, help='the archive to write, e.g. templet.ndjson.gz')
+    export_parser.add_argument('--sourceRoot', '-sr', nargs='?', default='https://api.github.com', type=str,
+                               help='The GitHub domain to export from. Defaults to https://www.github.com. For GitHub enterprise customers, enter the domain for your GitHub installation.')
+    for phase in github_duplication.PHASES:
+        export_parser.add_argument('--' + phase, '-' + phase[0] + ('o' if phase == 'collaborators' else ''),
+                                   action="store_true", help='Toggle on ' + github_duplication.PHASE_NAMES[phase] + ' export.')
+    export_parser.add_argument('--snapshot', '-s', nargs='?', type=str,
+                               help='A directory keeping a snapshot of the source repository, revalidated rather than downloaded again.')
+    export_parser.add_argument('--graphql', '-g', action="store_true",
+                               help='Download the source through the GitHub GraphQL API.')
+    import_parser = commands.add_parser('import', help='Populate a repository with the elements of an archive.')
+    import_parser.add_argument('user_name', type=str,
+                               help='Your GitHub (public or enterprise) username: name@email.com')
+    import_parser.add_argument('token', type=str, help='Your GitHub (public or enterprise) personal access token')
+    import_parser.add_argument('archive', type=str, help='the archive to import')
+    import_parser.add_argument('destination_repo', type=str,
+                               help='the team and repo to import into: <team_name>/<repo_name>')
+    import_parser.add_argument('--destinationRoot', '-dr', nargs='?', default='https://api.github.com', type=str,
+                               help='The GitHub domain to import into. Defaults to https://www.github.com. For GitHub enterprise customers, enter the domain for your GitHub installation.')
+    import_parser.add_argument('--workers', '-w', nargs='?', default=github_duplication.WORKERS, type=int,
+                               help='The number of issue and pr comment threads to import concurrently. Defaults to ' + str(github_duplication.WORKERS) + '.')
+    import_parser.add_argument('--journal', '-j', nargs='?', type=str,
+                               help='A file journaling every element created in the destination, so an interrupted import can be resumed.')
+    import_parser.add_argument('--resume', '-re', action="store_true",
+                               help='Resume the import recorded in the --journal file, skipping the elements it already created.')
+    import_parser.add_argument('--foldComments', '-fc', action="store_true",
+                               help='Render the comment thread of every issue and pr into its body instead of posting the comments one by one.')
+    import_parser.add_argument('--plan', '-pl', action="store_true",
+                               help='Dry run: print every write the import would make, with the time it is projected to take.')
+    return parser
+
+
+def main(argv=None):
+    """
+    INPUT: the command line arguments, after the program name. Defaults to sys.argv
+    OUTPUT: Null
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return
+    credentials = {'user_name': args.user_name, 'token': args.token}
+
+    if args.command == 'export':
+        if args.snapshot:
+            github_duplication.enable_snapshot(args.snapshot, args.source_repo)
+        phases = [phase for phase in github_duplication.PHASES if getattr(args, phase)] or github_duplication.PHASES
+        counts = export_archive(api_url(args.sourceRoot), args.source_repo, credentials, args.archive, phases,
+                                args.graphql)
+        github_duplication.close_sessions()
+        if counts is False:
+            sys.stderr.write('Exiting...')
+            quit()
+        print("Exported " + args.source_repo + " to " + args.archive + ": " +
+              ", ".join(str(count) + " " + kind for kind, count in counts.items()) + ".")
+        return
+
+    if args.resume and not args.journal:
+        sys.stderr.write("Error: --resume requires the --journal file of the import to resume.")
+        quit()
+    if args.plan:
+        github_duplication.enable_plan()
+    if args.journal and (args.resume or github_duplication.PLAN is None):
+        github_duplication.enable_journal(args.journal, args.resume)
+    github_duplication.WORKERS = max(1, args.workers)
+    github_duplication.FOLD_COMMENTS = args.foldComments
+    github_duplication.POOL_SIZE = max(github_duplication.POOL_SIZE,
+                                       github_duplication.WORKERS + len(github_duplication.PHASES))
+    destination_root = api_url(args.destinationRoot)
+    try:
+        header = import_archive(args.archive, destination_root, args.destination_repo, credentials)
+    except (IOError, ValueError) as error:
+        sys.stderr.write("Error: " + str(error) + "\n")
+        quit()
+    if github_duplication.JOURNAL is not None:
+        github_duplication.JOURNAL.close()
+    github_duplication.close_sessions()
+    print("Imported " + header['source'] + ", exported " + header['exported_at'] + ", into " + args.destination_repo + ".")
+
+    if github_duplication.PLAN is not None:
+        print(github_duplication.PLAN.summary(github_duplication.PLAN.estimate(
+            github_duplication.WORKERS, github_duplication.WRITE_INTERVAL,
+            github_duplication.SCHEDULER.budgets.get(credentials['token']))))
+    print(migration_metrics.summary())
+
+
+if __name__ == "__main__":
+    main()
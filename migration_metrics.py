@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Request-level instrumentation for github_duplication.
+
+Every API call made through github_duplication.send_req is recorded with the migration phase it was made in,
+its endpoint category, method, status, latency, response size, retries, time spent throttled and the rate limit
+headroom left after it. The records are summarized per phase at the end of a run, and can be written out as JSON
+or as a Prometheus textfile.
+"""
+
+import contextlib
+import contextvars
+import json
+import math
+import os
+import threading
+from urllib.parse import urlsplit
+
+# The migration phase requests are currently made in. Propagated to worker threads with contextvars.copy_context.
+PHASE = contextvars.ContextVar('phase', default='setup')
+
+# Path segments naming an endpoint category, checked from the end of the path
+CATEGORIES = {'milestones', 'labels', 'collaborators', 'assignees', 'issues', 'pulls', 'comments', 'releases',
+              'assets', 'branches', 'generate', 'graphql'}
+
+RECORDS = []
+RECORDS_LOCK = threading.Lock()
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Attribute every request made within the block, including by the threads it submits work to, to a phase"""
+    token = PHASE.set(name)
+    try:
+        yield
+    finally:
+        PHASE.reset(token)
+
+
+def endpoint_category(url):
+    """
+    INPUT: an API endpoint
+    OUTPUT: the kind of element the endpoint reads or writes, e.g. 'issues' or 'comments'
+    """
+    segments = [segment for segment in urlsplit(url).path.split('/') if segment]
+    for segment in reversed(segments):
+        if segment in CATEGORIES:
+            return segment
+    return segments[-1] if segments else 'other'
+
+
+def record(url, method, status, latency, size, retries, throttled, remaining):
+    """
+    INPUT:
+        url: the endpoint of the request
+        method: the HTTP method of the request
+        status: the status code of its final response
+        latency: the seconds taken by its final attempt
+        size: the number of bytes in its final response
+        retries: the number of attempts made before the final one
+        throttled: the seconds spent waiting on the rate limit scheduler and retry backoff
+        remaining: the X-RateLimit-Remaining reported by the final response, None if not reported
+    OUTPUT: Null
+    """
+    entry = {'phase': PHASE.get(), 'category': endpoint_category(url), 'method': method, 'status': status,
+             'latency': latency, 'bytes': size, 'retries': retries, 'throttled': throttled, 'remaining': remaining}
+    with RECORDS_LOCK:
+        RECORDS.append(entry)
+
+
+def reset():
+    """Forget every recorded request"""
+    with RECORDS_LOCK:
+        del RECORDS[:]
+
+
+def percentile(values, fraction):
+    """
+    INPUT: a sorted list of numbers
+    OUTPUT: the nearest-rank percentile of the values at the given fraction, 0 if there are none
+    """
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))
+    return values[index]
+
+
+def aggregate():
+    """
+    OUTPUT: a dict mapping each phase, in the order it was first seen, to the totals of its requests
+    """
+    with RECORDS_LOCK:
+        records = list(RECORDS)
+    phases = {}
+    for entry in records:
+        totals = phases.setdefault(entry['phase'], {'calls': 0, 'latencies': [], 'bytes': 0, 'retries': 0,
+                                                    'throttled': 0.0, 'errors': 0, 'min_remaining': None,
+                                                    'requests': {}})
+        totals['calls'] += 1
+        totals['latencies'].append(entry['latency'])
+        totals['bytes'] += entry['bytes']
+        totals['retries'] += entry['retries']
+        totals['throttled'] += entry['throttled']
+        if entry['status'] >= 400:
+            totals['errors'] += 1
+        if entry['remaining'] is not None:
+            if totals['min_remaining'] is None or entry['remaining'] < totals['min_remaining']:
+                totals['min_remaining'] = entry['remaining']
+        key = (entry['category'], entry['method'], entry['status'])
+        totals['requests'][key] = totals['requests'].get(key, 0) + 1
+    for totals in phases.values():
+        latencies = sorted(totals.pop('latencies'))
+        totals['latency_sum'] = sum(latencies)
+        totals['p50'] = percentile(latencies, 0.50)
+        totals['p95'] = percentile(latencies, 0.95)
+    return phases
+
+
+def summary():
+    """
+    OUTPUT: a printable table of the calls, latency percentiles and throttling of every phase
+    """
+    phases = aggregate()
+    lines = ["", "API requests per phase:",
+             "\t%-14s %7s %7s %9s %9s %8s %11s %10s" % ("phase", "calls", "errors", "p50 (ms)", "p95 (ms)",
+                                                       "retries", "throttled", "headroom")]
+    for name, totals in phases.items():
+        lines.append("\t%-14s %7d %7d %9.1f %9.1f %8d %10.1fs %10s" % (
+            name, totals['calls'], totals['errors'], totals['p50'] * 1000, totals['p95'] * 1000, totals['retries'],
+            totals['throttled'], '-' if totals['min_remaining'] is None else totals['min_remaining']))
+    lines.append("\t%-14s %7d" % ("total", sum(totals['calls'] for totals in phases.values())))
+    return "\n".join(lines) + "\n"
+
+
+def write_json(path):
+    """Write the per phase totals, including the calls made per endpoint category, method and status, as JSON"""
+    phases = aggregate()
+    for totals in phases.values():
+        totals['requests'] = [{'category': category, 'method': method, 'status': status, 'calls': calls}
+                              for (category, method, status), calls in sorted(totals['requests'].items())]
+    with open(path, 'w') as json_file:
+        json.dump({'phases': phases}, json_file, indent=2)
+
+
+def write_prometheus(path):
+    """Write the per phase totals in the Prometheus textfile format, replacing the file atomically"""
+    phases = aggregate()
+    lines = ["# HELP github_migration_requests_total GitHub API requests made by the migration.",
+             "# TYPE github_migration_requests_total counter"]
+    for name, totals in phases.items():
+        for (category, method, status), calls in sorted(totals['requests'].items()):
+            lines.append('github_migration_requests_total{phase="%s",category="%s",method="%s",status="%d"} %d'
+                         % (name, category, method, status, calls))
+    lines += ["# HELP github_migration_request_seconds Latency of the GitHub API requests made by the migration.",
+              "# TYPE github_migration_request_seconds summary"]
+    for name, totals in phases.items():
+        lines.append('github_migration_request_seconds{phase="%s",quantile="0.5"} %f' % (name, totals['p50']))
+        lines.append('github_migration_request_seconds{phase="%s",quantile="0.95"} %f' % (name, totals['p95']))
+        lines.append('github_migration_request_seconds_sum{phase="%s"} %f' % (name, totals['latency_sum']))
+        lines.append('github_migration_request_seconds_count{phase="%s"} %d' % (name, totals['calls']))
+    for metric, key, kind, help_text in [
+            ('github_migration_response_bytes_total', 'bytes', 'counter', 'Bytes received from the GitHub API.'),
+            ('github_migration_retries_total', 'retries', 'counter', 'Retried GitHub API requests.'),
+            ('github_migration_throttled_seconds_total', 'throttled', 'counter', 'Seconds spent waiting on rate limits.'),
+            ('github_migration_rate_limit_remaining_min', 'min_remaining', 'gauge', 'Lowest rate limit headroom seen.')]:
+        lines += ["# HELP " + metric + " " + help_text, "# TYPE " + metric + " " + kind]
+        for name, totals in phases.items():
+            if totals[key] is not None:
+                lines.append('%s{phase="%s"} %s' % (metric, name, totals[key]))
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as prometheus_file:
+        prometheus_file.write("\n".join(lines) + "\n")
+    os.replace(temporary, path)
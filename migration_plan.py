@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Dry-run planning for github_duplication.
+
+While a plan is enabled with github_duplication.enable_plan, every read of a migration is sent as usual, while
+every write is recorded rather than sent, and answered with a response shaped like GitHub's. The migration thus
+decides which writes to make exactly as it would for real, from the destination index, the journal and the
+comment threads, and the planned writes, grouped by destination and phase, are the writes the real run will make.
+Together with the reads made to decide them they give the request count of the real run, from which its
+wall-clock time is projected under the write interval, the secondary rate limits and the remaining rate limit.
+"""
+
+import json
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import migration_metrics
+from github_duplication import WRITES_PER_HOUR
+
+# Seconds in a primary rate limit window
+RATE_LIMIT_WINDOW = 3600
+
+REPOSITORY_PATH = re.compile(r"/repos/[^/]+/[^/]+")
+
+
+def describe(method, url, payload):
+    """
+    INPUT:
+        method, url: a planned write
+        payload: the JSON object it would have sent, empty if it sends none (or sends a file)
+    OUTPUT: a short description of the element the write creates or modifies
+    """
+    for field in ['title', 'name', 'tag_name']:
+        if payload.get(field):
+            return str(payload[field])
+    parts = urlsplit(url)
+    if 'name' in parse_qs(parts.query):
+        # release assets are named in the query of their upload
+        return parse_qs(parts.query)['name'][0]
+    if 'body' in payload:
+        return (payload['body'] or '').split('\n', 1)[0][:60]
+    if method != 'POST':
+        return parts.path.rstrip('/').rsplit('/', 1)[-1]
+    return ''
+
+
+def format_seconds(seconds):
+    """OUTPUT: a number of seconds as hours, minutes and seconds, e.g. '1h 02m 05s'"""
+    seconds = int(round(seconds))
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours:
+        return "%dh %02dm %02ds" % (hours, minutes, seconds)
+    if minutes:
+        return "%dm %02ds" % (minutes, seconds)
+    return "%ds" % seconds
+
+
+class MigrationPlan(object):
+    """
+    The writes a dry run of one or more migrations would have made, in the order they would have been made.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.writes = []
+        self.repositories = set()
+
+    def respond(self, method, url, data=None):
+        """Record a write instead of sending it
+        INPUT:
+            method, url, data: the request that would have been sent
+        OUTPUT: a response object standing in for GitHub's, echoing the data with the number, id, comments_url
+                and upload_url of a new element, so whatever the migration reads from the response is there
+        """
+        import requests
+        payload = json.loads(data) if isinstance(data, str) and data else {}
+        parts = urlsplit(url)
+        match = REPOSITORY_PATH.search(parts.path)
+        with self.lock:
+            # a body that is not JSON is streamed from a download, e.g. a release asset, which the real run also reads
+            self.writes.append({'phase': migration_metrics.PHASE.get(),
+                                'destination': match.group(0)[len('/repos/'):] if match else '',
+                                'method': method, 'category': migration_metrics.endpoint_category(url), 'url': url,
+                                'element': describe(method, url, payload),
+                                'streamed': data is not None and not isinstance(data, str)})
+            number = len(self.writes)
+            if parts.path.endswith('/generate'):
+                # a repository generated from a template, which does not exist for the dry run to list
+                self.repositories.add(payload.get('owner', '') + '/' + payload.get('name', ''))
+        repository_url = parts.scheme + "://" + parts.netloc + (parts.path[:match.end()] if match else '')
+        body = dict(payload, number=number, id=number, comments=0, assets=[],
+                    comments_url=repository_url + "/issues/" + str(number) + "/comments",
+                    upload_url=repository_url + "/releases/" + str(number) + "/assets{?name,label}")
+        r = requests.models.Response()
+        r.url = url
+        r.encoding = 'utf-8'
+        r.status_code = 204 if method == 'DELETE' else 200 if method == 'PATCH' else 201
+        r._content = b'' if method == 'DELETE' else json.dumps(body).encode('utf-8')
+        return r
+
+    def generated(self, repository):
+        """Test if the repository is one the plan generates, so is still empty when the real run lists it"""
+        with self.lock:
+            return repository in self.repositories
+
+    def estimate(self, concurrency, write_interval, budget=None):
+        """
+        INPUT:
+            concurrency: the number of requests the real run keeps in flight at once
+            write_interval: the seconds the real run keeps between two writes made with the same token
+            budget: the rate limit budget of the token, as tracked by github_duplication.RequestScheduler.
+                    None if the API did not report one
+        OUTPUT: a dict of the reads, writes and requests the real run will make, the seconds it is projected to
+                take, and the seconds of them spent waiting for the rate limit to reset
+        """
+        # every request sent during the dry run was a read, and the real run makes the same reads again
+        phases = migration_metrics.aggregate()
+        sent = sum(totals['calls'] for totals in phases.values())
+        latency = sum(totals['latency_sum'] for totals in phases.values()) / sent if sent else 0.0
+        with self.lock:
+            writes = len(self.writes)
+            reads = sent + sum(1 for write in self.writes if write['streamed'])
+        requests = reads + writes
+        seconds = (reads * latency + writes * max(write_interval * concurrency, latency)) / max(concurrency, 1)
+        # the writes beyond the hourly secondary rate limit are held until the next hour
+        if writes > WRITES_PER_HOUR:
+            seconds = max(seconds, (writes - 1) // WRITES_PER_HOUR * 3600.0)
+        wait = 0.0
+        if budget is not None and budget['remaining'] is not None and requests > budget['remaining']:
+            overflow = requests - budget['remaining']
+            windows = (overflow - 1) // budget['limit'] if budget['limit'] else 0
+            wait = max(budget['reset'] - time.time(), 0.0) + windows * RATE_LIMIT_WINDOW
+        return {'reads': reads, 'writes': writes, 'requests': requests, 'latency': latency,
+                'concurrency': concurrency, 'write_interval': write_interval, 'seconds': seconds + wait,
+                'rate_limit_wait': wait,
+                'rate_limit': None if budget is None else {'limit': budget['limit'], 'remaining': budget['remaining'],
+                                                           'reset': budget['reset']}}
+
+    def grouped(self):
+        """
+        OUTPUT: a dict mapping every destination, in the order it was first written to, to a dict mapping each
+                phase to its planned writes
+        """
+        with self.lock:
+            writes = list(self.writes)
+        destinations = {}
+        for write in writes:
+            destinations.setdefault(write['destination'], {}).setdefault(write['phase'], []).append(write)
+        return destinations
+
+    def summary(self, estimate):
+        """
+        INPUT: the dict returned by estimate
+        OUTPUT: a printable list of every planned write, by destination and phase, followed by the estimate
+        """
+        lines = ["", "Planned writes:"]
+        for destination, phases in self.grouped().items():
+            lines.append("\t" + destination)
+            for phase, writes in phases.items():
+                lines.append("\t\t%-14s %7d" % (phase, len(writes)))
+                for write in writes:
+                    lines.append("\t\t\t%-6s %-14s %s" % (write['method'], write['category'], write['element']))
+        lines += ["", "Estimate:",
+                  "\t%d reads, %d writes, %d requests" % (estimate['reads'], estimate['writes'], estimate['requests']),
+                  "\tprojected wall-clock time %s, at %d concurrent requests of %.0f ms and %.2fs between writes" % (
+                      format_seconds(estimate['seconds']), estimate['concurrency'], estimate['latency'] * 1000,
+                      estimate['write_interval'])]
+        rate_limit = estimate['rate_limit']
+        if rate_limit is not None and rate_limit['remaining'] is not None:
+            lines.append("\trate limit %d of %s remaining, resetting in %s" % (
+                rate_limit['remaining'], rate_limit['limit'], format_seconds(max(rate_limit['reset'] - time.time(), 0))))
+        if estimate['rate_limit_wait']:
+            lines.append("\tWARNING: the requests exceed the remaining rate limit, %s of the run is spent waiting for "
+                         "it to reset" % format_seconds(estimate['rate_limit_wait']))
+        if estimate['writes'] > WRITES_PER_HOUR:
+            lines.append("\tWARNING: the %d writes exceed the %d per hour allowed by GitHub's secondary rate limits"
+                         % (estimate['writes'], WRITES_PER_HOUR))
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path, estimate):
+        """Write every planned write, by destination and phase, and the estimate as JSON"""
+        with open(path, 'w') as json_file:
+            json.dump({'estimate': estimate, 'destinations': self.grouped()}, json_file, indent=2)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Compact records of the elements downloaded from a repository to be migrated.
+
+The GitHub API returns every issue, pr and comment with its nested user, repository and reactions objects,
+dozens of url fields and its rendered body, while the create_* functions of github_duplication read fewer than
+ten fields of each. Every downloaded element is projected, page by page, into a record holding only the fields
+migration reads, in __slots__ rather than in a dict, so the memory held by a downloaded template, and the objects
+the garbage collector tracks, scale with what is migrated rather than with what the API returns.
+
+Records are read-only Mappings, so they are read exactly like the JSON objects they are projected from. A field
+missing from the JSON reads as None.
+"""
+
+from collections.abc import Mapping
+
+
+class Record(Mapping):
+    """
+    A read-only Mapping over the fields named by the __slots__ of its subclass.
+    INPUT:
+        element: the JSON object of the API, or another Mapping, the record is projected from
+    """
+
+    __slots__ = ()
+
+    # fields holding a nested object, projected into the given Record subclass. A list of one Record subclass
+    # projects a nested list of objects
+    NESTED = {}
+
+    def __init__(self, element):
+        for field in self.__slots__:
+            value = element.get(field)
+            kind = self.NESTED.get(field)
+            if value is not None and kind is not None:
+                value = tuple(kind[0](item) for item in value) if isinstance(kind, list) else kind(value)
+            object.__setattr__(self, field, value)
+
+    def __setattr__(self, field, value):
+        raise AttributeError(type(self).__name__ + " records are read-only")
+
+    def __getitem__(self, field):
+        if field not in self.__slots__:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __repr__(self):
+        return type(self).__name__ + "(" + repr(dict(self)) + ")"
+
+
+class User(Record):
+    __slots__ = ('login',)
+
+
+class Permissions(Record):
+    __slots__ = ('admin',)
+
+
+class Collaborator(Record):
+    __slots__ = ('login', 'permissions')
+    NESTED = {'permissions': Permissions}
+
+
+class Milestone(Record):
+    __slots__ = ('number', 'title', 'state', 'description', 'due_on')
+
+
+class Label(Record):
+    __slots__ = ('name', 'color')
+
+
+class Branch(Record):
+    __slots__ = ('label', 'ref')
+
+
+class Issue(Record):
+    __slots__ = ('number', 'title', 'body', 'state', 'user', 'assignee', 'assignees', 'milestone', 'labels',
+                 'comments', 'comments_url')
+    NESTED = {'user': User, 'assignee': User, 'assignees': [User], 'milestone': Milestone, 'labels': [Label]}
+
+
+class PullRequest(Record):
+    __slots__ = Issue.__slots__ + ('head', 'base')
+    NESTED = dict(Issue.NESTED, head=Branch, base=Branch)
+
+
+class Comment(Record):
+    __slots__ = ('id', 'body', 'user')
+    NESTED = {'user': User}
+
+
+class Asset(Record):
+    __slots__ = ('id', 'name', 'label', 'content_type', 'size', 'state', 'url')
+
+
+class Release(Record):
+    __slots__ = ('tag_name', 'target_commitish', 'name', 'body', 'prerelease', 'assets')
+    NESTED = {'assets': [Asset]}
+
+
+# The record every element type of a migration is projected into
+RECORDS = {'milestones': Milestone, 'labels': Label, 'collaborators': Collaborator, 'issues': Issue,
+           'prs': PullRequest, 'releases': Release, 'comments': Comment}
+
+
+def project(kind, elements):
+    """
+    INPUT:
+        kind: an element type of a migration, or 'comments'
+        elements: an iterable of the JSON objects of that type returned by the API
+    OUTPUT: a generator of the records of the elements, projected as the elements are consumed
+    """
+    record = RECORDS[kind]
+    return (record(element) for element in elements)
@@ -1,77 +1,296 @@
 #!/bin/python3
 
+import os
+
 # GitHub Parameters,
 # Required for authentication and duplication
-GITHUB_ACCOUNTNAME = "ACCOUNTNAME" # GitHub User Name of the account which will be performing the duplication
-GITHUB_ACCESSTOKEN = "ACCESSTOKEN" # Personal Access Token from granting the user the required permissions.
-GITHUB_TEMPLETNAME = "TEMPLETPATH" # The name of the repository to be duplicated, from user's repositories.
+# Each may also be supplied through an environment variable of the same name.
+GITHUB_ACCOUNTNAME = os.environ.get("GITHUB_ACCOUNTNAME", "ACCOUNTNAME") # GitHub User Name of the account which will be performing the duplication
+GITHUB_ACCESSTOKEN = os.environ.get("GITHUB_ACCESSTOKEN", "ACCESSTOKEN") # Personal Access Token from granting the user the required permissions.
+GITHUB_TEMPLETNAME = os.environ.get("GITHUB_TEMPLETNAME", "TEMPLETPATH") # The name of the repository to be duplicated, from user's repositories.
+
+# Directory keeping a snapshot of the templet between runs, so unchanged content is only revalidated.
+# Leave unset to download the whole templet on every run.
+TEMPLET_SNAPSHOT = os.environ.get("TEMPLET_SNAPSHOT")
+
+# File journaling the elements created in every onboarding repository. When set, rerunning an interrupted
+# onboarding resumes it rather than duplicating what was already created.
+ONBOARD_JOURNAL = os.environ.get("ONBOARD_JOURNAL")
+
+# File the request metrics of the onboarding are written to, as JSON. When set, a summary is also printed.
+ONBOARD_METRICS = os.environ.get("ONBOARD_METRICS")
+
+# File recording what was last synced to every onboarding repository, used by --sync.
+ONBOARD_SYNC_STATE = os.environ.get("ONBOARD_SYNC_STATE", "onboarding-sync-state.json")
+
+# SQLite database holding the queue of onboarding jobs run by onboarding_service.py.
+ONBOARD_QUEUE = os.environ.get("ONBOARD_QUEUE", "onboarding-queue.db")
+
+# When set, the comments of every templet issue are rendered into its body instead of being posted one by one,
+# which takes far fewer writes for templets with long discussions.
+ONBOARD_FOLD_COMMENTS = os.environ.get("ONBOARD_FOLD_COMMENTS")
+
+# Additional tokens to spread the reads of the onboarding across, separated by whitespace, each as USER:TOKEN or as
+# a GitHub App installation token alone. Each must be able to read the templet and the onboarding repositories.
+# Writes are always made with GITHUB_ACCESSTOKEN.
+ONBOARD_READ_TOKENS = os.environ.get("ONBOARD_READ_TOKENS")
+
+# Number of onboarding repositories created and populated at the same time in batch mode
+ONBOARD_PARALLELISM = 4
+
+# When set, all onboarding repositories are populated as coroutines on a single event loop instead of on threads.
+# Requires httpx.
+ONBOARD_ASYNC = os.environ.get("ONBOARD_ASYNC")
 
-import github_duplication
-import os
-import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# github_duplication, and the HTTP client it imports, are only imported once there is something to duplicate,
+# so --help and mistakes on the command line are answered immediately.
+
+GITHUB_API_ROOT = "https://api.github.com/"
+
+# Repository Name Definitions
+TEMPLET_REPOSITORY = GITHUB_ACCOUNTNAME + "/" + GITHUB_TEMPLETNAME
+CREDENTIALS = {'user_name': GITHUB_ACCOUNTNAME, 'token': GITHUB_ACCESSTOKEN}
+
+USAGE = "\n".join(
+    [ ""
+    , "Usage:"
+    , "\t" + sys.argv[0] + " NAME"
+    , "\t" + sys.argv[0] + " --batch NAME NAME ..."
+    , "\t" + sys.argv[0] + " --batch --file PATH"
+    , "\t" + sys.argv[0] + " --sync NAME NAME ..."
+    , "\t" + sys.argv[0] + " --sync --file PATH"
+    , "\t" + sys.argv[0] + " --plan ..."
+    , ""
+    , "Duplicates the templet repository github.com/" + TEMPLET_REPOSITORY + " into an onboarding repository"
+    , "for every new staff member, or syncs the changes made to the templet into their onboarding repositories."
+    , "With --plan, nothing is created: every write the onboarding would make is listed instead, along with"
+    , "the number of requests and the time it is projected to take under the rate limits."
+    , ""
+    ])
+
+CONFIGURED = False
 
-# Check command line arguments
-if len(sys.argv) < 2:
-    exit("\n".join(
-        [ ""
-        , "Error:"
-        , "\tYou must supply a new staff member name via the command line!"
-        , ""
-        , "Example:"
-        , "\t" + sys.argv[0] + " NAME"
-        , ""
-        ]))
 
-if len(sys.argv) > 2:
+def usage_error(message, example):
     exit("\n".join(
         [ ""
         , "Error:"
-        , "\tThe staff member's name must NOT contain spaces!"
+        , "\t" + message
         , ""
         , "Example:"
-        , "\t" + sys.argv[0] + " " + "-".join(sys.argv[1:])
+        , "\t" + sys.argv[0] + " " + example
         , ""
         ]))
 
-# New staff member name retreived from command line.
-ONBOARD_STAFF_NAME = sys.argv[1]
 
-# Repository Name Definitions
-ONBOARD_REPOSITORY = GITHUB_ACCOUNTNAME + "/onboarding-" + ONBOARD_STAFF_NAME
-TEMPLET_REPOSITORY = GITHUB_ACCOUNTNAME + "/" + GITHUB_TEMPLETNAME
+def read_staff_names(arguments):
+    """
+    INPUT: the command line arguments, after the program name
+    OUTPUT: the list of new staff member names to onboard, or whose onboarding repository to sync
+    """
+    # Batch and sync modes, names listed on the command line or in a file (one per line)
+    if arguments[0] in ["--batch", "--sync"]:
+        names = arguments[1:]
+        if len(names) == 2 and names[0] == "--file":
+            with open(names[1]) as name_file:
+                names = [line.strip() for line in name_file if line.strip()]
+        if not names:
+            usage_error("You must supply the new staff member names, or a file listing them, via the command line!",
+                        arguments[0] + " NAME NAME ...")
+        for name in names:
+            if " " in name:
+                usage_error("The staff member's name must NOT contain spaces!", arguments[0] + " " + "-".join(name.split()))
+        return names
 
-# 1st create the repository, copying over all the code and commit history.
-# To do so, we must export the authentication token to the local environment.
-# This is required for `gh` to interact with GitHub.
-os.environ['GITHUB_TOKEN'] = GITHUB_ACCESSTOKEN
-subprocess.call(
-    [ "gh", "repo", "create", ONBOARD_REPOSITORY, "--private", "--template", TEMPLET_REPOSITORY ]
-    , stdout=subprocess.DEVNULL
-    , stderr=subprocess.STDOUT)
-
-# 2nd copy over all the issues, labels, and milestones with `git_mover.py`.
-with open(os.devnull, "w") as devnull:
-        # Supress the output of the sub-script, far too noisy.
-        old_stdout = sys.stdout
-        sys.stdout = devnull
-        # Overwrite the command line arguments to control the sub-script parameters.
-        progname = sys.argv[0]
-        sys.argv = [ progname, GITHUB_ACCOUNTNAME, GITHUB_ACCESSTOKEN, TEMPLET_REPOSITORY, ONBOARD_REPOSITORY ]
-        # Finally, call the sub-script.
-        github_duplication.main()
-        # Restore STDOUT for final reporting.
-        sys.stdout = old_stdout
-
-# Print out the result of the duplication!
-print("\n".join(
-        [ ""
-        , "Duplicated repository:"
-        , "\t" + "github.com/" + TEMPLET_REPOSITORY
-        , ""
-        , "Onboarding repository:" 
-        , "\t" + "github.com/" + ONBOARD_REPOSITORY
-        , ""
-        , "Now " + ONBOARD_STAFF_NAME + " is ready to start the onboarding tasks!"
-        , ""
-        ]))
+    if len(arguments) > 1:
+        usage_error("The staff member's name must NOT contain spaces!", "-".join(arguments))
+
+    return arguments
+
+
+def create_repository(staff_name):
+    """
+    INPUT: the new staff member to create an onboarding repository for
+    OUTPUT: the name of the onboarding repository, created with all the code and commit history of the templet,
+            once it is ready to be populated. False if it failed to be created
+    """
+    import github_duplication
+    onboard_repository = GITHUB_ACCOUNTNAME + "/onboarding-" + staff_name
+    # the templet must be marked as a template repository in its settings
+    if not github_duplication.generate_repository(GITHUB_API_ROOT, TEMPLET_REPOSITORY, onboard_repository, CREDENTIALS):
+        return False
+    return onboard_repository
+
+
+def onboard(staff_name, template):
+    """
+    INPUT:
+        staff_name: the new staff member to create an onboarding repository for
+        template: the downloaded elements of the templet repository
+    OUTPUT: the name of the onboarding repository. False if it failed to be created, or was only partly populated
+    """
+    import github_duplication
+
+    # 1st create the repository, copying over all the code and commit history.
+    onboard_repository = create_repository(staff_name)
+    if onboard_repository is False:
+        return False
+
+    # 2nd copy over all the issues, labels, and milestones downloaded from the templet.
+    if not github_duplication.populate_repository(template, GITHUB_API_ROOT, onboard_repository, CREDENTIALS, True):
+        return False
+    return onboard_repository
+
+
+def configure():
+    """Apply the configuration above to github_duplication, once however many times staff members are onboarded"""
+    global CONFIGURED
+    import github_duplication
+    if CONFIGURED:
+        return
+    CONFIGURED = True
+
+    # Supress the output of the duplication, far too noisy.
+    github_duplication.QUIET = True
+
+    if TEMPLET_SNAPSHOT:
+        github_duplication.enable_snapshot(TEMPLET_SNAPSHOT, TEMPLET_REPOSITORY)
+
+    if ONBOARD_JOURNAL:
+        github_duplication.enable_journal(ONBOARD_JOURNAL, resume=True)
+
+    if ONBOARD_FOLD_COMMENTS:
+        github_duplication.FOLD_COMMENTS = True
+
+    if ONBOARD_READ_TOKENS:
+        github_duplication.enable_credential_pool(
+            [github_duplication.parse_credentials(value) for value in ONBOARD_READ_TOKENS.split()], GITHUB_API_ROOT,
+            [TEMPLET_REPOSITORY])
+
+    # Every repository being populated concurrently needs its own pooled connections.
+    github_duplication.POOL_SIZE = max(github_duplication.POOL_SIZE,
+                                       ONBOARD_PARALLELISM * (github_duplication.WORKERS + len(github_duplication.PHASES)))
+
+
+def onboard_staff(staff_names):
+    """
+    INPUT: the names of the new staff members to onboard
+    OUTPUT: the name of the onboarding repository created for each of them, False for those which failed to be
+            created or populated. False if the templet could not be downloaded
+    """
+    import github_duplication
+    configure()
+
+    # Download the templet only once, however many staff members are onboarded.
+    template = github_duplication.download_template(GITHUB_API_ROOT, TEMPLET_REPOSITORY, CREDENTIALS, materialize=True)
+    if template is False:
+        return False
+    if ONBOARD_ASYNC:
+        import async_migration
+        with ThreadPoolExecutor(max_workers=ONBOARD_PARALLELISM) as executor:
+            onboard_repositories = list(executor.map(create_repository, staff_names))
+        async_migration.run(GITHUB_API_ROOT, TEMPLET_REPOSITORY,
+                            [(GITHUB_API_ROOT, repository) for repository in onboard_repositories if repository],
+                            CREDENTIALS, True, template=template)
+        return onboard_repositories
+    with ThreadPoolExecutor(max_workers=ONBOARD_PARALLELISM) as executor:
+        return list(executor.map(lambda name: onboard(name, template), staff_names))
+
+
+def sync_staff(staff_names):
+    """
+    INPUT: the names of the staff members whose onboarding repositories to sync with the templet
+    OUTPUT: the totals synced into each onboarding repository, as returned by template_sync.sync
+    """
+    import template_sync
+    configure()
+    return template_sync.sync(
+        GITHUB_API_ROOT, TEMPLET_REPOSITORY,
+        [(GITHUB_API_ROOT, GITHUB_ACCOUNTNAME + "/onboarding-" + name) for name in staff_names],
+        CREDENTIALS, ONBOARD_SYNC_STATE, True, parallelism=ONBOARD_PARALLELISM)
+
+
+def main(arguments=None):
+    """
+    INPUT: the command line arguments, after the program name. Defaults to sys.argv
+    OUTPUT: Null
+    """
+    arguments = sys.argv[1:] if arguments is None else arguments
+
+    # Dry run, listing the writes of the onboarding rather than making them
+    plan = "--plan" in arguments
+    arguments = [argument for argument in arguments if argument != "--plan"]
+
+    # Check command line arguments
+    if not arguments:
+        usage_error("You must supply a new staff member name via the command line!", "NAME")
+
+    if arguments[0] in ["-h", "--help"]:
+        print(USAGE)
+        return
+
+    # New staff member name(s) retreived from command line.
+    staff_names = read_staff_names(arguments)
+
+    if plan:
+        import github_duplication
+        github_duplication.enable_plan()
+
+    if arguments[0] == "--sync":
+        # Sync mode, propagating the changes of the templet to existing onboarding repositories
+        results = sync_staff(staff_names)
+        for staff_name, result in zip(staff_names, results):
+            print("\n".join(
+                    [ ""
+                    , "Synced onboarding repository:"
+                    , "\t" + "github.com/" + GITHUB_ACCOUNTNAME + "/onboarding-" + staff_name
+                    , ""
+                    , "\t" + ("failed, see the errors above" if result is False else
+                              str(result['created']) + " created, " + str(result['patched']) + " patched, " +
+                              str(result['comments']) + " comments appended")
+                    , ""
+                    ]))
+    else:
+        onboard_repositories = onboard_staff(staff_names)
+        if onboard_repositories is False:
+            exit("\nError:\n\tThe templet repository " + TEMPLET_REPOSITORY + " could not be downloaded!\n")
+
+        # Print out the result of the duplication, unless it was only planned
+        if not plan:
+            for staff_name, onboard_repository in zip(staff_names, onboard_repositories):
+                if onboard_repository is False:
+                    sys.stderr.write("\nError:\n\tThe onboarding repository of " + staff_name +
+                                     " could not be created, or was only partly populated!\n")
+                    continue
+                print("\n".join(
+                        [ ""
+                        , "Duplicated repository:"
+                        , "\t" + "github.com/" + TEMPLET_REPOSITORY
+                        , ""
+                        , "Onboarding repository:"
+                        , "\t" + "github.com/" + onboard_repository
+                        , ""
+                        , "Now " + staff_name + " is ready to start the onboarding tasks!"
+                        , ""
+                        ]))
+
+    import github_duplication
+    if github_duplication.JOURNAL is not None:
+        github_duplication.JOURNAL.close()
+    github_duplication.close_sessions()
+
+    if plan:
+        estimate = github_duplication.PLAN.estimate(ONBOARD_PARALLELISM, github_duplication.WRITE_INTERVAL,
+                                                    github_duplication.SCHEDULER.budgets.get(GITHUB_ACCESSTOKEN))
+        print(github_duplication.PLAN.summary(estimate))
+
+    if ONBOARD_METRICS:
+        github_duplication.migration_metrics.write_json(ONBOARD_METRICS)
+        print(github_duplication.migration_metrics.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Long-running onboarding service for onboard_new_person.
+
+Staff members to onboard, or whose onboarding repositories to sync, are enqueued as jobs in a SQLite database,
+either through a small local HTTP front end or from the command line, and the caller returns immediately with
+the id of its job. A pool of worker threads takes jobs from the queue in order and runs them in the one process,
+so every job reuses the pooled keep-alive connections of github_duplication and the templet downloaded into
+memory, which is only downloaded again once it is older than TEMPLET_REFRESH. The state of every job, and the
+onboarding repository it created or the error it failed with, is kept in the database and can be queried while
+the service runs. Several services may share one queue: every running job is leased to the service running it,
+which renews the lease while it runs, and the jobs whose lease expired, left running by a service that stopped,
+are queued again by the other services, or by the same one when it restarts. With ONBOARD_JOURNAL set they resume
+where they were interrupted.
+
+Usage:
+    onboarding_service.py serve --port 8080 --workers 4
+    onboarding_service.py enqueue David Alice
+    onboarding_service.py enqueue --sync David
+    onboarding_service.py status [ID ...]
+
+HTTP front end:
+    POST /jobs        {"names": ["David", "Alice"], "sync": false}  ->  202 and the queued jobs
+    GET  /jobs        every job, or those in a given ?state=
+    GET  /jobs/ID     the job
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import re
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import onboard_new_person
+
+# Seconds an idle worker waits before checking the queue again for jobs enqueued by another process
+POLL_INTERVAL = 1.0
+
+# Seconds the templet held in memory is used for before it is downloaded (or revalidated) again
+TEMPLET_REFRESH = 300
+
+# Seconds a running job stays leased to its service without being renewed, after which the service is presumed
+# stopped and the job is queued again
+LEASE_DURATION = 60
+
+# Seconds between two renewals of the leases of the running jobs of a service, and checks for expired leases
+HEARTBEAT_INTERVAL = 15
+
+# The states of a job, in the order it goes through them
+STATES = ['queued', 'running', 'done', 'failed']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    state TEXT NOT NULL,
+    repository TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    owner TEXT,
+    heartbeat REAL
+)
+"""
+
+
+class JobQueue(object):
+    """
+    The persistent queue of onboarding jobs, shared by the service and by the processes enqueueing jobs into it.
+    INPUT:
+        path: the SQLite database holding the queue, created if it does not exist yet
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with self.connect() as connection:
+            connection.execute(SCHEMA)
+
+    @contextlib.contextmanager
+    def connect(self):
+        """A connection to the database, whose statements are committed as they are made"""
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def enqueue(self, names, mode='onboard'):
+        """
+        INPUT:
+            names: the staff members to enqueue a job for
+            mode: 'onboard' to create their onboarding repository, 'sync' to sync it with the templet
+        OUTPUT: the queued jobs
+        """
+        with self.connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            ids = [connection.execute("INSERT INTO jobs (name, mode, state, created) VALUES (?, ?, 'queued', ?)",
+                                      (name, mode, time.time())).lastrowid for name in names]
+            connection.execute("COMMIT")
+        return self.jobs(ids)
+
+    def claim(self, owner):
+        """
+        INPUT: the service claiming the job
+        OUTPUT: the oldest queued job, marked as running and leased to the owner so no other worker takes it.
+                None if none is queued
+        """
+        with self.connect() as connection:
+            # the job is selected and marked within one write transaction, which other workers wait on
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute("SELECT * FROM jobs WHERE state = 'queued' ORDER BY id LIMIT 1").fetchone()
+            now = time.time()
+            if row is not None:
+                connection.execute("UPDATE jobs SET state = 'running', started = ?, owner = ?, heartbeat = ? "
+                                   "WHERE id = ?", (now, owner, now, row['id']))
+            connection.execute("COMMIT")
+        return None if row is None else dict(row, state='running', started=now, owner=owner, heartbeat=now)
+
+    def renew(self, owner):
+        """
+        Renew the leases of the jobs the owner is running
+        OUTPUT: the number of leases renewed
+        """
+        with self.connect() as connection:
+            return connection.execute("UPDATE jobs SET heartbeat = ? WHERE state = 'running' AND owner = ?",
+                                      (time.time(), owner)).rowcount
+
+    def finish(self, job_id, repository):
+        """Record a job as done, having created or synced the given onboarding repository"""
+        with self.connect() as connection:
+            connection.execute("UPDATE jobs SET state = 'done', repository = ?, finished = ? WHERE id = ?",
+                               (repository, time.time(), job_id))
+
+    def fail(self, job_id, error):
+        """Record a job as failed with the given error"""
+        with self.connect() as connection:
+            connection.execute("UPDATE jobs SET state = 'failed', error = ?, finished = ? WHERE id = ?",
+                               (error, time.time(), job_id))
+
+    def requeue(self, lease=LEASE_DURATION):
+        """
+        Queue again the jobs left running by a service that stopped before finishing them, whose lease was not
+        renewed for the given number of seconds. The jobs of the services still running them are left alone
+        OUTPUT: the number of jobs queued again
+        """
+        with self.connect() as connection:
+            return connection.execute("UPDATE jobs SET state = 'queued', started = NULL, owner = NULL, heartbeat = NULL "
+                                      "WHERE state = 'running' AND (heartbeat IS NULL OR heartbeat < ?)",
+                                      (time.time() - lease,)).rowcount
+
+    def jobs(self, ids=None, state=None):
+        """
+        INPUT:
+            ids: the ids of the jobs to return, every job if None
+            state: the state of the jobs to return, any state if None
+        OUTPUT: a list of the jobs, in the order they were enqueued
+        """
+        query, parameters = "SELECT * FROM jobs WHERE 1 = 1", []
+        if ids is not None:
+            query += " AND id IN (" + ", ".join("?" * len(ids)) + ")"
+            parameters += list(ids)
+        if state is not None:
+            query += " AND state = ?"
+            parameters.append(state)
+        with self.connect() as connection:
+            return [dict(row) for row in connection.execute(query + " ORDER BY id", parameters)]
+
+
+def invalid_names(names):
+    """
+    INPUT: staff member names to enqueue
+    OUTPUT: an error message if any of them is not a valid name, None otherwise
+    """
+    if not names:
+        return "You must supply at least one new staff member name!"
+    for name in names:
+        if not isinstance(name, str) or not name or re.search(r"\s", name):
+            return "The staff member's name must NOT be empty or contain spaces: " + json.dumps(name)
+    return None
+
+
+class OnboardingService(object):
+    """
+    The workers running the jobs of a queue, sharing the connections of github_duplication and the templet.
+    INPUT:
+        queue: the JobQueue to take jobs from
+        workers: the number of jobs run at the same time
+    """
+
+    def __init__(self, queue, workers=onboard_new_person.ONBOARD_PARALLELISM):
+        self.queue = queue
+        self.workers = workers
+        self.threads = []
+        self.stopping = threading.Event()
+        self.wakeup = threading.Condition()
+        self.templet = None
+        self.templet_time = 0.0
+        self.templet_lock = threading.Lock()
+        # syncs read and rewrite the whole sync state file, so they are run one at a time
+        self.sync_lock = threading.Lock()
+        self.active = 0
+        self.active_lock = threading.Lock()
+        # the name the jobs run by this service are leased under, unique to this process
+        self.owner = socket.gethostname() + ":" + str(os.getpid()) + ":" + uuid.uuid4().hex[:8]
+
+    def start(self):
+        """Queue again the jobs interrupted by a stopped service, and start the workers and their heartbeat"""
+        import github_duplication
+        onboard_new_person.configure()
+        # every job running at the same time needs its own pooled connections
+        github_duplication.POOL_SIZE = max(github_duplication.POOL_SIZE,
+                                           self.workers * (github_duplication.WORKERS + len(github_duplication.PHASES)))
+        self.requeue()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self.work, name="onboarding-worker-" + str(index), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        thread = threading.Thread(target=self.heartbeat, name="onboarding-heartbeat", daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    def requeue(self):
+        """Queue again the jobs whose lease expired"""
+        requeued = self.queue.requeue()
+        if requeued:
+            sys.stderr.write("WARNING: " + str(requeued) + " interrupted jobs were queued again.\n")
+            self.notify()
+
+    def heartbeat(self):
+        """Renew the leases of the jobs being run, and queue again the expired ones, until the service is stopped"""
+        while not self.stopping.wait(HEARTBEAT_INTERVAL):
+            try:
+                self.queue.renew(self.owner)
+                self.requeue()
+            except sqlite3.Error as error:
+                sys.stderr.write("WARNING: The leases of the running jobs could not be renewed: " + str(error) + "\n")
+
+    def stop(self):
+        """Let the workers finish the jobs they are running, then stop them"""
+        self.stopping.set()
+        self.notify()
+        for thread in self.threads:
+            thread.join()
+
+    def notify(self):
+        """Wake the idle workers up, as jobs were enqueued"""
+        with self.wakeup:
+            self.wakeup.notify_all()
+
+    def templet_elements(self):
+        """
+        OUTPUT: the downloaded elements of the templet, downloaded again once they are older than TEMPLET_REFRESH.
+                The elements already held are kept if they fail to be downloaded again. False if there are none
+        """
+        import github_duplication
+        with self.templet_lock:
+            if self.templet is None or time.time() - self.templet_time > TEMPLET_REFRESH:
+                templet = github_duplication.download_template(
+                    onboard_new_person.GITHUB_API_ROOT, onboard_new_person.TEMPLET_REPOSITORY,
+                    onboard_new_person.CREDENTIALS, materialize=True)
+                if templet is not False:
+                    self.templet, self.templet_time = templet, time.time()
+                elif self.templet is not None:
+                    sys.stderr.write("WARNING: The templet could not be downloaded again, the copy downloaded " +
+                                     str(int(time.time() - self.templet_time)) + " seconds ago is used.\n")
+            return self.templet if self.templet is not None else False
+
+    def work(self):
+        """Run the jobs of the queue until the service is stopped"""
+        while not self.stopping.is_set():
+            job = self.queue.claim(self.owner)
+            if job is None:
+                with self.wakeup:
+                    self.wakeup.wait(POLL_INTERVAL)
+                continue
+            with self.active_lock:
+                self.active += 1
+            try:
+                self.run(job)
+            finally:
+                with self.active_lock:
+                    self.active -= 1
+                    idle = self.active == 0
+                if idle:
+                    self.drain()
+
+    def run(self, job):
+        """Run one job and record its outcome in the queue"""
+        import github_duplication
+        repository = onboard_new_person.GITHUB_ACCOUNTNAME + "/onboarding-" + job['name']
+        try:
+            if job['mode'] == 'sync':
+                with self.sync_lock:
+                    result = onboard_new_person.sync_staff([job['name']])[0]
+                if result is False:
+                    self.queue.fail(job['id'], "The onboarding repository failed to be synced.")
+                    return
+            else:
+                templet = self.templet_elements()
+                if templet is False:
+                    self.queue.fail(job['id'], "The templet repository " + onboard_new_person.TEMPLET_REPOSITORY +
+                                    " could not be downloaded.")
+                    return
+                if onboard_new_person.onboard(job['name'], templet) is False:
+                    self.queue.fail(job['id'], "The onboarding repository " + repository +
+                                    " could not be created, or was only partly populated.")
+                    return
+            self.queue.finish(job['id'], repository)
+        except Exception as error:
+            self.queue.fail(job['id'], type(error).__name__ + ": " + str(error))
+        finally:
+            # a finished destination is not deduplicated against again, so its listings are not kept in memory
+            github_duplication.INDEX.forget(onboard_new_person.GITHUB_API_ROOT, repository)
+
+    def drain(self):
+        """Write out the request metrics of the jobs run since the workers were last idle, then forget them"""
+        import github_duplication
+        if onboard_new_person.ONBOARD_METRICS:
+            github_duplication.migration_metrics.write_json(onboard_new_person.ONBOARD_METRICS)
+        github_duplication.migration_metrics.reset()
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "OnboardingService/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, indent=2).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        queue = self.server.service.queue
+        match = re.match(r"^/jobs/(?P<id>\d+)$", parts.path)
+        if match:
+            jobs = queue.jobs([int(match.group("id"))])
+            self.send_json(200 if jobs else 404, jobs[0] if jobs else {"message": "Not Found"})
+        elif parts.path == "/jobs":
+            state = parse_qs(parts.query).get("state", [None])[-1]
+            if state is not None and state not in STATES:
+                self.send_json(400, {"message": "The state must be one of " + ", ".join(STATES) + "."})
+                return
+            self.send_json(200, queue.jobs(state=state))
+        else:
+            self.send_json(404, {"message": "Not Found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        data = self.rfile.read(length) if length else b""
+        if urlsplit(self.path).path != "/jobs":
+            self.send_json(404, {"message": "Not Found"})
+            return
+        try:
+            request = json.loads(data.decode("utf-8") or "{}")
+        except ValueError:
+            self.send_json(400, {"message": "The body must be a JSON object."})
+            return
+        names = request.get("names", [request["name"]] if "name" in request else []) \
+            if isinstance(request, dict) else []
+        error = invalid_names(names)
+        if error is not None:
+            self.send_json(400, {"message": error})
+            return
+        jobs = self.server.service.queue.enqueue(names, 'sync' if request.get("sync") else 'onboard')
+        self.server.service.notify()
+        self.send_json(202, jobs)
+
+
+class ServiceServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+def serve(service, host="127.0.0.1", port=0):
+    """
+    INPUT:
+        service: the started OnboardingService whose queue the front end enqueues into
+        port: the port to listen on, 0 picks a free one
+    OUTPUT: the running server, serving from a daemon thread
+    """
+    server = ServiceServer((host, port), ServiceHandler)
+    server.service = service
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def format_job(job):
+    """OUTPUT: a one line description of a job"""
+    line = "%5d  %-8s %-8s %s" % (job['id'], job['mode'], job['state'], job['name'])
+    if job['repository']:
+        line += "  github.com/" + job['repository']
+    if job['finished'] and job['started']:
+        line += "  (%.1fs)" % (job['finished'] - job['started'])
+    if job['error']:
+        line += "  " + job['error']
+    return line
+
+
+def build_parser():
+    """
+    OUTPUT: the parser of the command line arguments of main
+    """
+    parser = argparse.ArgumentParser(
+        description='Onboard new staff members as jobs of a persistent queue, run by a long-running service.')
+    parser.add_argument('--queue', '-q', nargs='?', default=onboard_new_person.ONBOARD_QUEUE, type=str,
+                        help='The SQLite database holding the queue of jobs. Defaults to ' + onboard_new_person.ONBOARD_QUEUE + '.')
+    commands = parser.add_subparsers(dest='command')
+    serve_parser = commands.add_parser('serve', help='Run the jobs of the queue, and serve the HTTP front end.')
+    serve_parser.add_argument('--port', '-p', nargs='?', default=8080, type=int,
+                              help='The port the HTTP front end listens on. Defaults to 8080.')
+    serve_parser.add_argument('--host', '-ho', nargs='?', default='127.0.0.1', type=str,
+                              help='The address the HTTP front end listens on. Defaults to 127.0.0.1.')
+    serve_parser.add_argument('--workers', '-w', nargs='?', default=onboard_new_person.ONBOARD_PARALLELISM, type=int,
+                              help='The number of jobs run at the same time. Defaults to ' + str(onboard_new_person.ONBOARD_PARALLELISM) + '.')
+    serve_parser.add_argument('--apiRoot', '-ar', nargs='?', type=str,
+                              help='The root url of the GitHub API to onboard on, e.g. the url of fake_github_api.py for testing. Defaults to ' + onboard_new_person.GITHUB_API_ROOT + '.')
+    enqueue_parser = commands.add_parser('enqueue', help='Enqueue jobs for the service to run, and return immediately.')
+    enqueue_parser.add_argument('names', nargs='+', type=str, help='The names of the new staff members.')
+    enqueue_parser.add_argument('--sync', '-s', action="store_true",
+                                help='Sync the existing onboarding repositories of the staff members instead of creating them.')
+    status_parser = commands.add_parser('status', help='Print the state of jobs.')
+    status_parser.add_argument('ids', nargs='*', type=int, help='The ids of the jobs. Defaults to every job.')
+    status_parser.add_argument('--state', '-st', nargs='?', choices=STATES, type=str,
+                               help='Only print the jobs in this state.')
+    return parser
+
+
+def main(argv=None):
+    """
+    INPUT: the command line arguments, after the program name. Defaults to sys.argv
+    OUTPUT: Null
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return
+    queue = JobQueue(args.queue)
+
+    if args.command == 'enqueue':
+        error = invalid_names(args.names)
+        if error is not None:
+            exit("\nError:\n\t" + error + "\n")
+        for job in queue.enqueue(args.names, 'sync' if args.sync else 'onboard'):
+            print(format_job(job))
+        return
+
+    if args.command == 'status':
+        for job in queue.jobs(args.ids or None, args.state):
+            print(format_job(job))
+        return
+
+    if args.apiRoot:
+        onboard_new_person.GITHUB_API_ROOT = args.apiRoot.rstrip('/') + '/'
+    service = OnboardingService(queue, max(1, args.workers))
+    service.start()
+    server = serve(service, args.host, args.port)
+    print("Onboarding staff members from the queue " + args.queue + " on " + str(service.workers) + " workers, " +
+          "enqueue them at http://" + args.host + ":" + str(server.server_address[1]) + "/jobs")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        service.stop()
+        import github_duplication
+        if github_duplication.JOURNAL is not None:
+            github_duplication.JOURNAL.close()
+        github_duplication.close_sessions()
+
+
+if __name__ == "__main__":
+    main()
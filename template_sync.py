@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Incremental sync of a template into the repositories it was already migrated to.
+
+Elements are matched between the template and a destination by stable fingerprints: milestones by their
+title, labels and releases by their name, and issues by the hash of their title. Only the elements missing
+from the destination are created, and only those whose content hash differs are patched. The state file
+remembers, for every destination, which of its issues each template issue became and when the destination
+was last synced, so later syncs only list the template issues updated since then (`since=`) rather than
+rescanning both repositories. Comments added to a template issue are appended to its destination issue.
+
+Elements removed from the template are left in the destinations, as are edits made to existing comments.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import github_duplication
+import migration_metrics
+
+# Seconds subtracted from the start of a sync when recording it, so clock skew with GitHub cannot hide an update
+SINCE_MARGIN = 60
+
+# Fields of a milestone, label and release that are kept in sync once it is matched by its fingerprint
+MILESTONE_FIELDS = ['description', 'state', 'due_on']
+LABEL_FIELDS = ['color', 'description']
+RELEASE_FIELDS = ['body', 'prerelease']
+
+
+def fingerprint(*values):
+    """
+    OUTPUT: a stable hash of the given values
+    """
+    return hashlib.sha1(json.dumps(values, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def content_fingerprint(title, body, state, milestone, labels):
+    """
+    INPUT:
+        milestone: the number of the milestone of an issue in the destination, None if it has none
+        labels: the labels of an issue, as names or as label objects
+    OUTPUT: a hash of everything sync keeps up to date on an issue
+    """
+    names = sorted(label if isinstance(label, str) else label['name'] for label in labels)
+    return fingerprint(title, body or '', state, milestone, names)
+
+
+def load_state(path):
+    """
+    INPUT: the path of a sync state file
+    OUTPUT: the sync state of every destination recorded in the file, empty if it does not exist yet
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path) as state_file:
+        return json.load(state_file)
+
+
+def save_state(path, state):
+    """Write the sync state of every destination, replacing the file atomically"""
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as state_file:
+        json.dump(state, state_file, indent=2, sort_keys=True)
+    os.replace(temporary, path)
+
+
+def changes(element, counterpart, fields):
+    """
+    INPUT:
+        element: an element of the template
+        counterpart: the element of the destination it was matched to
+        fields: the fields kept in sync
+    OUTPUT: a dict of the fields of the template element differing from the destination, empty if none do
+    """
+    return {field: element[field] for field in fields if field in element and element[field] != counterpart.get(field)}
+
+
+class TemplateSync(object):
+    """
+    Propagates the changes of a template to the repositories it was migrated to. The template is listed once
+    per run, however many destinations are synced, and destinations may be synced concurrently.
+    INPUT:
+        source_url: the root url for the GitHub API of the template
+        source: the team and repo '<team>/<repo>' of the template
+        credentials: the credentials used to read the template
+        state: the sync state of every destination, as returned by load_state. It is updated in place
+    """
+
+    def __init__(self, source_url, source, credentials, state):
+        self.source_url = source_url
+        self.source = source
+        self.credentials = credentials
+        self.state = state
+        self.listings = {}
+        self.lock = threading.Lock()
+
+    def listing(self, endpoint):
+        """
+        INPUT: an endpoint of the template, relative to the repository
+        OUTPUT: every element it lists, retrieved only by the first destination to need it. False if it failed
+        """
+        with self.lock:
+            if endpoint not in self.listings:
+                self.listings[endpoint] = github_duplication.list_pages(
+                    self.source_url + "repos/" + self.source + endpoint, self.credentials)
+            return self.listings[endpoint]
+
+    def sync_named(self, endpoint, elements, destination_url, destination, credentials, key, fields, create):
+        """
+        INPUT:
+            endpoint: the endpoint of the element type, relative to the repository, e.g. '/labels'
+            elements: the elements of the template
+            key: returns the fingerprint of an element
+            fields: the fields kept in sync on matched elements
+            create: returns the payload creating an element missing from the destination
+        OUTPUT: a dict mapping the fingerprint of every template element to its destination counterpart,
+                and the number of elements created, patched and failed to be. False if the destination could not
+                be listed
+        """
+        url = destination_url + "repos/" + destination + endpoint
+        # closed milestones are listed as well, so closing one is propagated
+        existing = github_duplication.list_pages(url + ("?state=all" if endpoint == "/milestones" else ""), credentials)
+        if existing is False:
+            return False
+        counterparts = {key(counterpart): counterpart for counterpart in existing}
+        created = patched = failed = 0
+        for element in elements:
+            counterpart = counterparts.get(key(element))
+            if counterpart is None:
+                if element.get('state', 'open') != 'open':
+                    continue
+                github_duplication.log("Creating " + endpoint[1:] + ": " + key(element))
+                r = github_duplication.post_req(url, json.dumps(create(element)), credentials)
+                if github_duplication.check_res(r):
+                    counterparts[key(element)] = json.loads(r.text)
+                    created += 1
+                else:
+                    failed += 1
+                continue
+            update = changes(element, counterpart, fields)
+            if update:
+                # labels are addressed by their name, milestones by their number and releases by their id
+                address = counterpart['number'] if endpoint == '/milestones' else \
+                    quote(counterpart['name'], safe='') if endpoint == '/labels' else counterpart['id']
+                github_duplication.log("Patching " + endpoint[1:] + ": " + key(element))
+                r = github_duplication.patch_req(url + "/" + str(address), json.dumps(update), credentials)
+                if github_duplication.check_res(r):
+                    counterpart.update(update)
+                    patched += 1
+                else:
+                    failed += 1
+        return counterparts, created, patched, failed
+
+    def sync_issues(self, destination_url, destination, credentials, sameInstall, state, milestone_map):
+        """
+        INPUT:
+            state: the sync state of the destination
+            milestone_map: a dict mapping template milestone numbers to destination milestone numbers
+        OUTPUT: the number of issues created and patched, of comments appended, and of those which failed to be.
+                The failed ones are left unrecorded in the state, to be retried by the next sync.
+                False if an issue listing failed
+        """
+        url = destination_url + "repos/" + destination + "/issues"
+        issues = state.setdefault('issues', {})
+        since = state.get('synced_at') if issues else None
+        counterparts = {}
+        if since is None:
+            # the first sync of a destination matches its issues to the template's by their title
+            existing = github_duplication.list_pages(url + "?state=all&sort=created&direction=asc", credentials)
+            if existing is False:
+                return False
+            for counterpart in existing:
+                if 'pull_request' not in counterpart:
+                    counterparts.setdefault(fingerprint(counterpart['title']), counterpart)
+        # closed template issues are listed as well, so closing one is propagated
+        endpoint = "/issues?state=all&sort=created&direction=asc" + ("&since=" + since if since else "")
+        template_issues = self.listing(endpoint)
+        if template_issues is False:
+            return False
+        created = patched = appended = failed = 0
+        for issue in template_issues:
+            if 'pull_request' in issue:
+                continue
+            issue_prime = github_duplication.issue_payload(issue, True, True, milestone_map, sameInstall)
+            content = content_fingerprint(issue_prime['title'], issue_prime['body'], issue_prime['state'],
+                                          issue_prime.get('milestone'), issue_prime.get('labels', []))
+            entry = issues.get(str(issue['number']))
+            if entry is None:
+                counterpart = counterparts.pop(fingerprint(issue['title']), None)
+                if counterpart is not None:
+                    milestone = counterpart['milestone']['number'] if counterpart.get('milestone') else None
+                    entry = {'number': counterpart['number'], 'comments': counterpart.get('comments', 0),
+                             'fingerprint': content_fingerprint(counterpart['title'], counterpart['body'],
+                                                                counterpart['state'], milestone,
+                                                                counterpart.get('labels', []))}
+                elif issue['state'] == 'open':
+                    github_duplication.log("Creating issue: " + issue['title'])
+                    my_data = github_duplication.post_issue(url, issue_prime, credentials)
+                    if not my_data:
+                        failed += 1
+                        continue
+                    entry = {'number': my_data['number'], 'comments': 0, 'fingerprint': content}
+                    created += 1
+                else:
+                    continue
+                issues[str(issue['number'])] = entry
+            if entry['fingerprint'] != content:
+                github_duplication.log("Patching issue: " + issue['title'])
+                update = {field: value for field, value in issue_prime.items() if field != 'assignee'}
+                r = github_duplication.patch_req(url + "/" + str(entry['number']), json.dumps(update), credentials)
+                if github_duplication.check_res(r):
+                    entry['fingerprint'] = content
+                    patched += 1
+                else:
+                    failed += 1
+            if issue.get('comments', 0) > entry['comments']:
+                thread = github_duplication.list_pages(issue['comments_url'], self.credentials)
+                if thread is False:
+                    failed += 1
+                    continue
+                comments_url = url + "/" + str(entry['number']) + "/comments"
+                # the comments are counted as they are appended, so a failure does not append the earlier ones twice
+                for comment in thread[entry['comments']:]:
+                    if not github_duplication.append_comments([comment], credentials, comments_url):
+                        failed += 1
+                        break
+                    appended += 1
+                    entry['comments'] += 1
+        return created, patched, appended, failed
+
+    def sync_repository(self, destination_url, destination, credentials, sameInstall):
+        """Bring a repository migrated from the template up to date with it
+        INPUT:
+            destination_url: the root url for the GitHub API of the destination
+            destination: the team and repo '<team>/<repo>' to sync
+            sameInstall: true if the template and the destination are on the same GitHub installation
+        OUTPUT: a dict of the number of elements created, patched and of comments appended. False if it failed,
+                or if any change failed to be propagated, in which case the sync time is not moved forward so the
+                next sync retries them
+        """
+        started = time.time()
+        state = self.state.setdefault(destination, {})
+        totals = {'created': 0, 'patched': 0, 'comments': 0}
+
+        milestones = self.listing("/milestones?state=all")
+        if milestones is False:
+            return False
+        matched = self.sync_named("/milestones", milestones, destination_url, destination, credentials,
+                                  lambda milestone: milestone['title'], MILESTONE_FIELDS,
+                                  lambda milestone: {"title": milestone["title"], "state": milestone["state"],
+                                                     "description": milestone["description"],
+                                                     "due_on": milestone["due_on"]})
+        if matched is False:
+            return False
+        counterparts, created, patched, failed = matched
+        milestone_map = {milestone['number']: counterparts[milestone['title']]['number']
+                         for milestone in milestones if milestone['title'] in counterparts}
+        totals['created'] += created
+        totals['patched'] += patched
+
+        for endpoint, key, fields, create in [
+                ("/labels", lambda label: label['name'], LABEL_FIELDS,
+                 lambda label: {"name": label["name"], "color": label["color"]}),
+                ("/releases", lambda release: release['name'] or release['tag_name'], RELEASE_FIELDS,
+                 lambda release: {"tag_name": release["tag_name"], "target_commitish": release["target_commitish"],
+                                  "name": release["name"], "body": release["body"],
+                                  "prerelease": release["prerelease"]})]:
+            elements = self.listing(endpoint)
+            matched = elements and self.sync_named(endpoint, elements, destination_url, destination, credentials,
+                                                   key, fields, create)
+            if elements is False or matched is False:
+                return False
+            if matched:
+                totals['created'] += matched[1]
+                totals['patched'] += matched[2]
+                failed += matched[3]
+
+        synced = self.sync_issues(destination_url, destination, credentials, sameInstall, state, milestone_map)
+        if synced is False:
+            return False
+        totals['created'] += synced[0]
+        totals['patched'] += synced[1]
+        totals['comments'] += synced[2]
+        failed += synced[3]
+        if failed:
+            sys.stderr.write("ERROR: " + str(failed) + " changes of the template failed to be synced to " + destination +
+                             ", they are retried by the next sync.\n")
+            return False
+        state['synced_at'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(started - SINCE_MARGIN))
+        return totals
+
+
+def sync(source_url, source, destinations, credentials, state_path, sameInstall, source_credentials=None,
+         parallelism=1):
+    """Sync every destination with the template and record the new sync state
+    INPUT:
+        destinations: a list of tuples of the root url for the GitHub API and the team and repo '<team>/<repo>'
+                      of each repository migrated from the template
+        state_path: the sync state file, created on the first sync
+        parallelism: the number of destinations synced at the same time
+    OUTPUT: a list of the totals returned by TemplateSync.sync_repository for each destination
+    """
+    state = load_state(state_path)
+    template = TemplateSync(source_url, source, source_credentials or credentials, state)
+
+    def sync_destination(destination):
+        with migration_metrics.phase('sync'):
+            return template.sync_repository(destination[0], destination[1], credentials, sameInstall)
+
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        results = list(executor.map(sync_destination, destinations))
+    # a dry run created nothing, so there is no new sync state to record
+    if github_duplication.PLAN is None:
+        save_state(state_path, state)
+    for (destination_url, destination), result in zip(destinations, results):
+        if result is False:
+            sys.stderr.write("ERROR: " + destination + " failed to be synced.\n")
+    return results
@@ -0,0 +1,92 @@
+# coding=utf-8
+
+"""
+Fixtures running the migration scripts against fake_github_api, served on a free local port, with the state
+github_duplication keeps in module globals reset between tests.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_github_api
+import github_duplication
+import migration_metrics
+import onboard_new_person
+
+
+@pytest.fixture(autouse=True)
+def migration_state(monkeypatch):
+    """Run every test with no journal, plan, snapshot, index or rate limit state left over from another"""
+    monkeypatch.setattr(github_duplication, 'QUIET', True)
+    monkeypatch.setattr(github_duplication, 'WRITE_INTERVAL', 0)
+    monkeypatch.setattr(github_duplication, 'MAX_RETRIES', 0)
+    monkeypatch.setattr(github_duplication, 'WORKERS', 1)
+    monkeypatch.setattr(github_duplication, 'FOLD_COMMENTS', False)
+    monkeypatch.setattr(github_duplication, 'JOURNAL', None)
+    monkeypatch.setattr(github_duplication, 'PLAN', None)
+    monkeypatch.setattr(github_duplication, 'SNAPSHOT', None)
+    monkeypatch.setattr(github_duplication, 'CREDENTIAL_POOLS', {})
+    monkeypatch.setattr(github_duplication, 'INDEX', github_duplication.DestinationIndex())
+    monkeypatch.setattr(github_duplication, 'SCHEDULER', github_duplication.RequestScheduler())
+    migration_metrics.reset()
+    yield
+    if github_duplication.JOURNAL is not None:
+        github_duplication.JOURNAL.close()
+    github_duplication.close_sessions()
+
+
+@pytest.fixture
+def api():
+    """The state of a fake API holding the template owner/template"""
+    api = fake_github_api.FakeGitHub()
+    fake_github_api.populate(api, "owner/template", issues=5, comments=2)
+    return api
+
+
+@pytest.fixture
+def root(api):
+    """The root url of the API of the fake, served while the test runs"""
+    server = fake_github_api.serve(api)
+    yield "http://127.0.0.1:" + str(server.server_address[1]) + "/api/v3/"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def credentials():
+    return {'user_name': 'owner', 'token': 'token'}
+
+
+@pytest.fixture
+def onboarding(root, credentials, monkeypatch):
+    """Configure onboard_new_person to onboard staff members as owner, from the templet owner/template of the fake"""
+    monkeypatch.setattr(onboard_new_person, 'GITHUB_API_ROOT', root)
+    monkeypatch.setattr(onboard_new_person, 'GITHUB_ACCOUNTNAME', "owner")
+    monkeypatch.setattr(onboard_new_person, 'TEMPLET_REPOSITORY', "owner/template")
+    monkeypatch.setattr(onboard_new_person, 'CREDENTIALS', credentials)
+    monkeypatch.setattr(onboard_new_person, 'CONFIGURED', True)
+    monkeypatch.setattr(github_duplication, 'POOL_SIZE', github_duplication.POOL_SIZE)
+    monkeypatch.setattr(github_duplication, 'READY_POLL_INTERVAL', 0.05)
+
+
+def restart():
+    """Forget what a run indexed and journaled, as a new process running the migration again would"""
+    if github_duplication.JOURNAL is not None:
+        github_duplication.JOURNAL.close()
+    github_duplication.JOURNAL = None
+    github_duplication.INDEX = github_duplication.DestinationIndex()
+
+
+def comment_counts(api, repository):
+    """OUTPUT: the number of comments of every issue/pr of a repository of the fake, by number"""
+    return {number: len(comments) for number, comments in api.repository(repository)["comments"].items()}
+
+
+def writes(api, repository):
+    """OUTPUT: the writes the fake served to a repository"""
+    return [(method, path) for method, path in api.requests
+            if method != 'GET' and "/repos/" + repository + "/" in path + "/"]
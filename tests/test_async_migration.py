@@ -0,0 +1,34 @@
+# coding=utf-8
+
+import pytest
+
+import github_duplication
+from conftest import comment_counts
+
+pytest.importorskip('httpx')
+
+
+def test_the_asyncio_path_lists_each_destination_once(api, root, credentials):
+    template = api.repository("owner/template")
+    template["labels"] += [{"name": "extra-" + str(index), "color": "ededed"} for index in range(35)]
+    for index in range(30):
+        template["collaborators"]["user" + str(index)] = {"login": "user" + str(index), "permissions": {"admin": False}}
+
+    assert github_duplication.migrate("owner/template", "owner/dest", credentials, source_url=root,
+                                      asynchronous=True) is not False
+    dest = api.repository("owner/dest")
+    assert len(dest["labels"]) == 40 and len(dest["issues"]) == 5
+    assert comment_counts(api, "owner/dest") == comment_counts(api, "owner/template")
+    listings = [path.split("?")[0] for method, path in api.requests if method == 'GET' and "/owner/dest/" in path]
+    for kind in ["labels", "collaborators", "milestones"]:
+        assert listings.count("/api/v3/repos/owner/dest/" + kind) == 1, kind
+
+
+def test_the_asyncio_path_migrates_the_graphql_download(api, root, credentials):
+    assert github_duplication.migrate("owner/template", "owner/dest", credentials, source_url=root,
+                                      graphql=True, asynchronous=True) is not False
+    assert ('POST', '/api/graphql') in api.requests
+    # the template downloaded through GraphQL is populated as it is, its comments are not downloaded again
+    assert not [path for method, path in api.requests if method == 'GET' and "/owner/template/issues" in path]
+    assert len(api.repository("owner/dest")["issues"]) == 5
+    assert comment_counts(api, "owner/dest") == comment_counts(api, "owner/template")
@@ -0,0 +1,305 @@
+# coding=utf-8
+
+import base64
+import collections
+import time
+
+import pytest
+
+import fake_github_api
+import github_duplication
+import migration_metrics
+from conftest import comment_counts, restart, writes
+
+
+def migrate(root, credentials, destination="owner/dest", phases=github_duplication.PHASES):
+    return github_duplication.migrate("owner/template", destination, credentials, phases, source_url=root)
+
+
+def test_migrate_copies_the_template(api, root, credentials):
+    assert migrate(root, credentials) is not False
+    template, dest = api.repository("owner/template"), api.repository("owner/dest")
+    for kind in ["milestones", "labels", "issues", "releases"]:
+        assert len(dest[kind]) == len(template[kind])
+    assert [issue["title"] for issue in dest["issues"]] == [issue["title"] for issue in template["issues"]]
+    assert comment_counts(api, "owner/dest") == comment_counts(api, "owner/template")
+
+
+def test_comment_threads_are_migrated_on_several_workers(api, root, credentials, monkeypatch):
+    monkeypatch.setattr(github_duplication, 'WORKERS', 4)
+    assert migrate(root, credentials) is not False
+    template, dest = api.repository("owner/template"), api.repository("owner/dest")
+    # issues are still created in order while the threads of the previous ones are posted
+    assert [issue["title"] for issue in dest["issues"]] == [issue["title"] for issue in template["issues"]]
+    assert comment_counts(api, "owner/dest") == comment_counts(api, "owner/template")
+
+
+def test_a_snapshot_revalidates_the_source_and_is_read_offline(api, root, credentials, tmp_path):
+    github_duplication.enable_snapshot(str(tmp_path), "owner/template")
+    github_duplication.download_template(root, "owner/template", credentials, materialize=True)
+    calls = len(api.requests)
+
+    migration_metrics.reset()
+    api.repository("owner/template")["labels"].append({"name": "label-new", "color": "ff0000"})
+    template = github_duplication.download_template(root, "owner/template", credentials, materialize=True)
+    # every read is revalidated, only the endpoint which changed is downloaded again
+    statuses = collections.Counter()
+    for (category, method, status), count in migration_metrics.aggregate()['download']['requests'].items():
+        statuses[status] += count
+    assert statuses == {304: calls - 1, 200: 1}
+    assert "label-new" in [label["name"] for label in template["labels"]]
+
+    del api.requests[:]
+    github_duplication.enable_snapshot(str(tmp_path), "owner/template", offline=True)
+    offline = github_duplication.download_template(root, "owner/template", credentials, materialize=True)
+    assert api.requests == []
+    assert [issue["title"] for issue in offline["issues"]] == [issue["title"] for issue in template["issues"]]
+    assert offline["comments"] == template["comments"]
+    assert "label-new" in [label["name"] for label in offline["labels"]]
+
+
+def test_rerun_does_not_duplicate(api, root, credentials):
+    migrate(root, credentials)
+    restart()
+    del api.requests[:]
+    migrate(root, credentials)
+    dest = api.repository("owner/dest")
+    assert len(dest["issues"]) == 5 and len(dest["milestones"]) == 3 and len(dest["labels"]) == 5
+    assert comment_counts(api, "owner/dest") == comment_counts(api, "owner/template")
+    assert writes(api, "owner/dest") == []
+
+
+def test_resume_migrates_a_thread_that_failed_to_download(api, root, credentials, tmp_path):
+    journal = str(tmp_path / "journal.jsonl")
+    api.fail('GET', r"/owner/template/issues/1/comments")
+    github_duplication.enable_journal(journal)
+    migrate(root, credentials, phases=['issues'])
+    assert comment_counts(api, "owner/dest")[1] == 0
+
+    del api.faults[:]
+    restart()
+    github_duplication.enable_journal(journal, resume=True)
+    migrate(root, credentials, phases=['issues'])
+    assert len(api.repository("owner/dest")["issues"]) == 5
+    assert comment_counts(api, "owner/dest") == comment_counts(api, "owner/template")
+
+
+def test_resume_after_a_crash_posts_only_what_is_missing(api, root, credentials, tmp_path):
+    journal = str(tmp_path / "journal.jsonl")
+    # the second comment of issue 2, and the creation of issue 4, fail as if the run was interrupted there
+    api.fail('POST', r"/owner/dest/issues/2/comments", times=1)
+    api.fail('POST', r"/owner/dest/issues$", times=1)
+    github_duplication.enable_journal(journal)
+    migrate(root, credentials, phases=['milestones', 'labels', 'issues'])
+    assert len(api.repository("owner/dest")["issues"]) == 4
+
+    restart()
+    github_duplication.enable_journal(journal, resume=True)
+    migrate(root, credentials, phases=['milestones', 'labels', 'issues'])
+    dest = api.repository("owner/dest")
+    assert sorted(issue["title"] for issue in dest["issues"]) == sorted("Issue " + str(n) for n in range(1, 6))
+    assert len(dest["milestones"]) == 3
+    assert sorted(comment_counts(api, "owner/dest").values()) == [2] * 5
+
+
+def test_a_listing_failing_part_way_is_not_taken_as_complete(api, root, credentials, tmp_path, monkeypatch):
+    journal = str(tmp_path / "journal.jsonl")
+    monkeypatch.setattr(github_duplication, 'PER_PAGE', 2)
+    api.fail('GET', r"/owner/template/issues\?.*[?&]page=2")
+    github_duplication.enable_journal(journal)
+    migrate(root, credentials, phases=['issues'])
+    assert len(api.repository("owner/dest")["issues"]) == 2
+
+    del api.faults[:]
+    restart()
+    github_duplication.enable_journal(journal, resume=True)
+    migrate(root, credentials, phases=['issues'])
+    assert [issue["title"] for issue in api.repository("owner/dest")["issues"]] == \
+        ["Issue " + str(n) for n in range(1, 6)]
+
+
+def test_a_page_failing_after_the_first_fails_the_listing(api, root, credentials, monkeypatch):
+    monkeypatch.setattr(github_duplication, 'PER_PAGE', 2)
+    api.fail('GET', r"/owner/template/labels\?.*[?&]page=2")
+    url = root + "repos/owner/template/labels"
+    pages = github_duplication.get_pages(url, credentials)
+    # the items of the first page are yielded before the failure is raised
+    labels = api.repository("owner/template")["labels"]
+    assert [next(pages)["name"] for _ in range(2)] == [label["name"] for label in labels[:2]]
+    with pytest.raises(IOError):
+        next(pages)
+    assert github_duplication.list_pages(url, credentials) is False
+    assert github_duplication.download_template(root, "owner/template", credentials, ['labels'],
+                                                materialize=True) is False
+
+
+def folded(body, comments):
+    return body + "".join("\n\n---\n\n" + comment + "\n\nOriginal by @owner" for comment in comments)
+
+
+def test_folded_comments_are_rendered_into_the_bodies(api, root, credentials, monkeypatch):
+    monkeypatch.setattr(github_duplication, 'FOLD_COMMENTS', True)
+    migrate(root, credentials, phases=['issues'])
+    assert [issue["body"] for issue in api.repository("owner/dest")["issues"]] == \
+        [folded("Task " + str(n), ["Comment 0", "Comment 1"]) for n in range(1, 6)]
+    assert not [path for method, path in writes(api, "owner/dest") if path.endswith("/comments")]
+
+
+def test_comments_which_do_not_fit_the_body_are_still_posted(api, root, credentials, monkeypatch):
+    monkeypatch.setattr(github_duplication, 'FOLD_COMMENTS', True)
+    # only the first comment of each thread fits within the body
+    monkeypatch.setattr(github_duplication, 'MAX_BODY_LENGTH', len(folded("Task 1", ["Comment 0"])))
+    migrate(root, credentials, phases=['issues'])
+    dest = api.repository("owner/dest")
+    assert [issue["body"] for issue in dest["issues"]] == [folded("Task " + str(n), ["Comment 0"]) for n in range(1, 6)]
+    assert [[comment["body"] for comment in dest["comments"][n]] for n in range(1, 6)] == \
+        [["Comment 1\n\nOriginal by @owner"]] * 5
+
+
+def assets(api, repository):
+    """OUTPUT: the content of every asset of the releases of a repository of the fake, by release and asset name"""
+    state = api.repository(repository)
+    return {(release["name"], asset["name"]): state["assets"][asset["id"]]
+            for release in state["releases"] for asset in release["assets"]}
+
+
+def test_release_assets_are_streamed_intact(api, root, credentials, monkeypatch):
+    fake_github_api.populate(api, "owner/source", issues=0, releases=2, assets=2, asset_size=5000)
+    # every asset is streamed in several chunks
+    monkeypatch.setattr(github_duplication, 'ASSET_CHUNK_SIZE', 1024)
+    github_duplication.migrate("owner/source", "owner/dest", credentials, ['releases'], source_url=root)
+    assert len(assets(api, "owner/dest")) == 4
+    assert assets(api, "owner/dest") == assets(api, "owner/source")
+
+
+def test_an_asset_failing_to_be_uploaded_is_transferred_by_a_resumed_run(api, root, credentials, tmp_path):
+    journal = str(tmp_path / "journal.jsonl")
+    fake_github_api.populate(api, "owner/source", issues=0, releases=1, assets=2, asset_size=2000)
+    api.fail('POST', r"/assets\?name=dataset-0-1", times=1)
+    github_duplication.enable_journal(journal)
+    template = github_duplication.download_template(root, "owner/source", credentials, ['releases'])
+    assert github_duplication.populate_repository(template, root, "owner/dest", credentials, True) is False
+    assert list(assets(api, "owner/dest")) == [("Release 0", "dataset-0-0.bin")]
+
+    restart()
+    github_duplication.enable_journal(journal, resume=True)
+    del api.requests[:]
+    template = github_duplication.download_template(root, "owner/source", credentials, ['releases'])
+    assert github_duplication.populate_repository(template, root, "owner/dest", credentials, True) is True
+    assert assets(api, "owner/dest") == assets(api, "owner/source")
+    # only the asset which failed is uploaded again
+    assert len([path for method, path in writes(api, "owner/dest") if "/assets?" in path]) == 1
+
+
+def test_an_interrupted_upload_is_replaced(api, root, credentials):
+    fake_github_api.populate(api, "owner/source", issues=0, releases=1, assets=1, asset_size=2000)
+    # a previous run created the release, and was interrupted while uploading its asset
+    dest = api.repository("owner/dest")
+    dest["releases"].append({"id": 1000, "tag_name": "v0", "target_commitish": "master", "name": "Release 0",
+                             "body": "", "prerelease": False,
+                             "assets": [{"id": 1001, "name": "dataset-0-0.bin", "label": None, "size": 2000,
+                                         "content_type": "application/octet-stream", "state": "starter"}]})
+    dest["assets"][1001] = b"partial"
+    github_duplication.migrate("owner/source", "owner/dest", credentials, ['releases'], source_url=root)
+    assert ('DELETE', '/repos/owner/dest/releases/assets/1001') in api.requests
+    assert len(dest["releases"]) == 1
+    assert assets(api, "owner/dest") == assets(api, "owner/source")
+
+
+def test_a_pr_whose_branch_is_missing_is_skipped(api, root, credentials, capsys):
+    fake_github_api.populate(api, "owner/source", issues=0, comments=0, releases=0, prs=3)
+    # the branch of the second pr was not pushed to the destination
+    api.repository("owner/dest")["branches"] = ["master", "feature-1", "feature-3"]
+    phases = ['milestones', 'labels', 'collaborators', 'prs']
+    template = github_duplication.download_template(root, "owner/source", credentials, phases)
+    # the pr is skipped rather than failed, so it does not fail the migration
+    assert github_duplication.populate_repository(template, root, "owner/dest", credentials, True) is True
+    assert "WARNING: The branch feature-2 of \"Pull request 2\"" in capsys.readouterr().err
+    prs = api.repository("owner/dest")["issues"]
+    assert [pr["title"] for pr in prs] == ["Pull request 1", "Pull request 3"]
+    assert [label["name"] for label in prs[1]["labels"]] == ["label-3"]
+    assert [assignee["login"] for assignee in prs[1]["assignees"]] == ["owner"]
+    # the labels and assignees of every pr are set in a single write to its issue
+    assert [method for method, path in writes(api, "owner/dest") if "/issues/" in path] == ['PATCH', 'PATCH']
+
+
+@pytest.mark.parametrize('listed', [False, True])
+def test_collaborators_added_by_the_migration_stay_assignees(api, root, credentials, listed):
+    # slow enough for issues to be created while collaborators were still being added, were they not waited for
+    api.latency = 0.01
+    template = api.repository("owner/template")
+    for index in range(10):
+        template["collaborators"]["user" + str(index)] = {"login": "user" + str(index), "permissions": {"admin": False}}
+    for issue in template["issues"]:
+        issue["assignee"] = {"login": "user7"}
+    if listed:
+        # the assignees of the destination were listed before its collaborators were added
+        github_duplication.INDEX.index(root, "owner/dest", 'assignees', credentials)
+    migrate(root, credentials, phases=['collaborators', 'issues'])
+    assert [issue["assignee"] for issue in api.repository("owner/dest")["issues"]] == [{"login": "user7"}] * 5
+
+
+def test_writes_are_held_to_the_hourly_limit(monkeypatch):
+    monkeypatch.setattr(github_duplication, 'WRITES_PER_HOUR', 3)
+    scheduler = github_duplication.RequestScheduler()
+    delays = [scheduler.reserve('token', True) for _ in range(4)]
+    assert delays[:3] == [0.0, 0.0, 0.0]
+    assert 3590 < delays[3] <= 3600
+    # reads are not held by it
+    assert scheduler.reserve('token', False) == 0.0
+
+
+class Response(object):
+    def __init__(self, remaining, limit=5000):
+        self.headers = {'X-RateLimit-Remaining': str(remaining), 'X-RateLimit-Limit': str(limit),
+                        'X-RateLimit-Reset': str(time.time() + 3600)}
+
+
+def test_the_pool_picks_the_token_with_the_most_requests_left():
+    given, first, second = [{'user_name': name, 'token': name} for name in ["given", "first", "second"]]
+    pool = github_duplication.CredentialPool([first, second], ["owner/template"])
+    # tokens whose budget is not known yet are taken in turn
+    assert [pool.pick(given)['token'] for _ in range(3)] == ["given", "first", "second"]
+
+    github_duplication.SCHEDULER.update("given", Response(4000))
+    github_duplication.SCHEDULER.update("first", Response(4500))
+    github_duplication.SCHEDULER.update("second", Response(3000))
+    assert pool.pick(given)['token'] == "first"
+    # a token down to its reserve is not picked while another has requests left
+    github_duplication.SCHEDULER.update("first", Response(github_duplication.RATE_LIMIT_RESERVE))
+    assert pool.pick(given)['token'] == "given"
+
+
+def test_only_the_reads_of_the_pooled_repositories_are_spread(root, credentials):
+    github_duplication.enable_credential_pool([{'user_name': 'reader', 'token': 'reader'}], root, ["owner/template"])
+    for url in [root + "repos/Owner/Template/issues?page=2", root + "graphql"]:
+        assert [github_duplication.read_credentials(url, credentials)['token'] for _ in range(2)] == ["token", "reader"]
+    for _ in range(3):
+        assert github_duplication.read_credentials(root + "repos/owner/dest/labels", credentials) == credentials
+    assert github_duplication.read_credentials(root + "repos/owner/template/issues", credentials,
+                                               {'If-None-Match': '"etag"'}) == credentials
+
+
+def test_a_destination_the_pooled_tokens_cannot_see_is_still_deduplicated(api, root, credentials):
+    migrate(root, credentials)
+    restart()
+    api.restrict("reader", ["owner/template"])
+    github_duplication.enable_credential_pool([{'user_name': 'reader', 'token': 'reader'}], root, ["owner/template"])
+    del api.requests[:]
+    migrate(root, credentials)
+    assert writes(api, "owner/dest") == []
+    assert len(api.repository("owner/dest")["issues"]) == 5
+
+
+def test_reads_move_off_an_exhausted_token(api, root, credentials, monkeypatch):
+    monkeypatch.setattr(github_duplication, 'MAX_RETRIES', 2)
+    api.rate_limit = 1000
+    # the pooled token has no requests left in its window, which only its first response tells
+    api.budgets["Basic " + base64.b64encode(b"spent:spent").decode()] = (0, int(time.time()) + 3600)
+    github_duplication.enable_credential_pool([{'user_name': 'spent', 'token': 'spent'}], root, ["owner/template"])
+    github_duplication.SCHEDULER.update("token", Response(900, 1000))
+    started = time.time()
+    assert migrate(root, credentials) is not False
+    assert time.time() - started < 30
+    assert comment_counts(api, "owner/dest") == comment_counts(api, "owner/template")
+    assert github_duplication.SCHEDULER.headroom("spent")[0] is False
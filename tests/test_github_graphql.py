@@ -0,0 +1,50 @@
+# coding=utf-8
+
+import fake_github_api
+import github_duplication
+import github_graphql
+from conftest import restart, writes
+
+
+def migrated(api, repository):
+    """OUTPUT: what a migration wrote to a repository of the fake, comparable between two destinations"""
+    state = api.repository(repository)
+    issues = [{key: issue[key] for key in ("title", "body", "state", "assignee", "milestone", "labels")}
+              for issue in state["issues"]]
+    threads = {number: [comment["body"] for comment in thread] for number, thread in state["comments"].items()}
+    return state["milestones"], state["labels"], issues, threads
+
+
+def test_the_graphql_download_migrates_the_same_as_the_rest_download(api, root, credentials):
+    fake_github_api.populate(api, "owner/source", issues=5, comments=3, prs=2)
+    # every connection, and every comment thread, spans several pages
+    api.graphql_page_size = 2
+    for destination in ["owner/rest", "owner/graphql"]:
+        api.repository(destination)["branches"] = list(api.repository("owner/source")["branches"])
+
+    github_duplication.migrate("owner/source", "owner/rest", credentials, source_url=root)
+    restart()
+    del api.requests[:]
+    assert github_duplication.migrate("owner/source", "owner/graphql", credentials, source_url=root,
+                                      graphql=True) is not False
+    assert migrated(api, "owner/graphql") == migrated(api, "owner/rest")
+    assert len(api.repository("owner/graphql")["issues"]) == 7
+    # the comments are fetched along with their issues/prs rather than one REST listing each
+    assert not [path for method, path in api.requests if method == 'GET' and "/owner/source/issues" in path]
+
+
+def test_a_graphql_page_failing_fails_the_download(api, root, credentials):
+    api.graphql_page_size = 2
+    api.fail('POST', r"^/api/graphql$", after=1)
+    assert github_graphql.download_template(root, "owner/template", credentials) is False
+    assert github_duplication.migrate("owner/template", "owner/dest", credentials, source_url=root,
+                                      graphql=True) is False
+    assert writes(api, "owner/dest") == []
+
+
+def test_a_rest_listing_failing_part_way_fails_the_download(api, root, credentials, monkeypatch):
+    monkeypatch.setattr(github_duplication, 'PER_PAGE', 1)
+    api.repository("owner/template")["collaborators"]["reviewer"] = {"login": "reviewer", "permissions": {"admin": False}}
+    # collaborators are downloaded through REST, and their second page fails
+    api.fail('GET', r"/owner/template/collaborators\?.*[?&]page=2")
+    assert github_graphql.download_template(root, "owner/template", credentials) is False
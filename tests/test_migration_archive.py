@@ -0,0 +1,50 @@
+# coding=utf-8
+
+import gzip
+import json
+
+import pytest
+
+import migration_archive
+from conftest import comment_counts
+
+
+def test_archive_round_trip(api, root, credentials, tmp_path):
+    path = str(tmp_path / "templet.ndjson.gz")
+    counts = migration_archive.export_archive(root, "owner/template", credentials, path)
+    assert counts['issues'] == 5 and counts['comments'] == 10 and counts['milestones'] == 3
+
+    del api.requests[:]
+    header = migration_archive.import_archive(path, root, "owner/copy", credentials)
+    assert header['source'] == "owner/template"
+    # the archive alone is replayed, the source is never read again
+    assert not [path for method, path in api.requests if "/owner/template" in path]
+
+    template, copy = api.repository("owner/template"), api.repository("owner/copy")
+    for kind in ["milestones", "labels", "issues", "releases"]:
+        assert len(copy[kind]) == len(template[kind])
+    assert comment_counts(api, "owner/copy") == comment_counts(api, "owner/template")
+
+
+def test_an_archive_of_a_newer_version_is_refused(tmp_path):
+    path = str(tmp_path / "newer.ndjson.gz")
+    with gzip.open(path, 'wt') as archive:
+        archive.write(json.dumps({'format': migration_archive.ARCHIVE_FORMAT,
+                                  'version': migration_archive.ARCHIVE_VERSION + 1}) + '\n')
+    with pytest.raises(ValueError):
+        migration_archive.load_archive(path)
+
+
+def test_the_archive_is_streamed_into_the_import(api, root, credentials, tmp_path):
+    path = str(tmp_path / "templet.ndjson.gz")
+    migration_archive.export_archive(root, "owner/template", credentials, path)
+    header, template = migration_archive.load_archive(path)
+    threads = template['comments']
+    titles = []
+    for issue in template['issues']:
+        # only the thread of the issue being imported is held
+        assert list(threads.threads) == [issue['comments_url']]
+        assert len(threads.get(issue['comments_url'])) == 2
+        titles.append(issue['title'])
+    assert titles == ["Issue " + str(n) for n in range(1, 6)]
+    assert threads.threads == {}
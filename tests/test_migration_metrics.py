@@ -0,0 +1,35 @@
+# coding=utf-8
+
+import json
+
+import github_duplication
+import migration_metrics
+
+
+def test_percentile_is_the_nearest_rank():
+    assert migration_metrics.percentile([], 0.5) == 0.0
+    assert migration_metrics.percentile([1.0], 0.95) == 1.0
+    # the rank of the 50th percentile of two values is the first, not rounded up to the second
+    assert migration_metrics.percentile([1.0, 2.0], 0.50) == 1.0
+    values = [float(value) for value in range(1, 21)]
+    assert migration_metrics.percentile(values, 0.50) == 10.0
+    assert migration_metrics.percentile(values, 0.95) == 19.0
+    assert migration_metrics.percentile(values, 1.0) == 20.0
+
+
+def test_the_requests_of_a_migration_are_recorded_per_phase(api, root, credentials, tmp_path):
+    api.fail('GET', r"/owner/dest/releases", times=1, status=404)
+    github_duplication.migrate("owner/template", "owner/dest", credentials, source_url=root)
+    phases = migration_metrics.aggregate()
+    assert {'download', 'milestones', 'labels', 'issues', 'releases'} <= set(phases)
+    assert sum(totals['calls'] for totals in phases.values()) == len(api.requests)
+    issues = phases['issues']['requests']
+    assert issues[('issues', 'POST', 201)] == 5 and issues[('comments', 'POST', 201)] == 10
+    assert phases['releases']['errors'] == 1
+
+    path = str(tmp_path / "metrics.json")
+    migration_metrics.write_json(path)
+    with open(path) as json_file:
+        written = json.load(json_file)['phases']
+    assert written['issues']['calls'] == phases['issues']['calls']
+    assert {'category': 'issues', 'method': 'POST', 'status': 201, 'calls': 5} in written['issues']['requests']
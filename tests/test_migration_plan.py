@@ -0,0 +1,23 @@
+# coding=utf-8
+
+import github_duplication
+from conftest import restart, writes
+
+
+def test_plan_lists_the_writes_of_the_real_run(api, root, credentials):
+    # the destination already holds some of the template, which neither run writes again
+    github_duplication.migrate("owner/template", "owner/dest", credentials, ['labels'], source_url=root)
+    restart()
+
+    plan = github_duplication.enable_plan()
+    github_duplication.migrate("owner/template", "owner/dest", credentials, source_url=root)
+    planned = [(write['method'], write['category']) for write in plan.writes]
+    assert planned
+    assert len(api.repository("owner/dest")["issues"]) == 0
+
+    github_duplication.PLAN = None
+    restart()
+    del api.requests[:]
+    github_duplication.migrate("owner/template", "owner/dest", credentials, source_url=root)
+    assert len(writes(api, "owner/dest")) == len(planned)
+    assert sorted(method for method, path in writes(api, "owner/dest")) == sorted(method for method, _ in planned)
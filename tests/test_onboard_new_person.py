@@ -0,0 +1,30 @@
+# coding=utf-8
+
+import fake_github_api
+import github_duplication
+import onboard_new_person
+from conftest import comment_counts
+
+
+def test_onboarding_repositories_get_the_branches_and_prs_of_the_templet(api, onboarding, monkeypatch):
+    fake_github_api.populate(api, "owner/templet", issues=3, comments=1, prs=2)
+    monkeypatch.setattr(onboard_new_person, 'TEMPLET_REPOSITORY', "owner/templet")
+    # the repositories stay empty for a while after being generated, as on GitHub
+    api.generation_delay = 0.2
+
+    assert onboard_new_person.onboard_staff(["alice", "bob"]) == ["owner/onboarding-alice", "owner/onboarding-bob"]
+    templet = api.repository("owner/templet")
+    for name in ["alice", "bob"]:
+        repository = api.repository("owner/onboarding-" + name)
+        assert repository["branches"] == templet["branches"]
+        prs = [issue for issue in repository["issues"] if "pull_request" in issue]
+        assert [pr["title"] for pr in prs] == ["Pull request 4", "Pull request 5"]
+        assert [pr["head"]["ref"] for pr in prs] == ["feature-4", "feature-5"]
+        assert comment_counts(api, "owner/onboarding-" + name) == comment_counts(api, "owner/templet")
+
+
+def test_a_repository_that_never_gets_ready_fails_to_be_onboarded(api, onboarding, monkeypatch):
+    monkeypatch.setattr(github_duplication, 'READY_TIMEOUT', 0.3)
+    api.generation_delay = 60
+    assert onboard_new_person.onboard_staff(["alice"]) == [False]
+    assert api.repository("owner/onboarding-alice")["issues"] == []
@@ -0,0 +1,69 @@
+# coding=utf-8
+
+import time
+
+import onboarding_service
+
+
+def wait_for(queue, ids, timeout=30):
+    """Wait until the given jobs are done or failed"""
+    deadline = time.time() + timeout
+    while time.time() < deadline and any(job['state'] in ('queued', 'running') for job in queue.jobs(ids)):
+        time.sleep(0.05)
+
+def test_only_the_jobs_whose_lease_expired_are_requeued(tmp_path):
+    queue = onboarding_service.JobQueue(str(tmp_path / "queue.db"))
+    queue.enqueue(["alice", "bob", "carol"])
+    alive, stale = queue.claim("A"), queue.claim("B")
+    with queue.connect() as connection:
+        connection.execute("UPDATE jobs SET heartbeat = ? WHERE id = ?", (time.time() - 120, stale['id']))
+
+    # the job of the service still renewing its lease is left running
+    assert queue.renew("A") == 1
+    assert queue.requeue() == 1
+    jobs = {job['name']: job for job in queue.jobs()}
+    assert jobs["alice"]['state'] == 'running' and jobs["alice"]['owner'] == "A"
+    assert jobs["bob"]['state'] == 'queued' and jobs["bob"]['owner'] is None
+    # the requeued job is claimed again before the ones enqueued after it
+    assert queue.claim("A")['name'] == "bob"
+    assert queue.requeue() == 0
+
+
+def test_the_service_runs_the_queued_jobs(api, onboarding, tmp_path):
+
+    queue = onboarding_service.JobQueue(str(tmp_path / "queue.db"))
+    service = onboarding_service.OnboardingService(queue, 2)
+    service.start()
+    try:
+        ids = [job['id'] for job in queue.enqueue(["alice", "bob", "carol"])]
+        service.notify()
+        wait_for(queue, ids)
+    finally:
+        service.stop()
+
+    jobs = queue.jobs(ids)
+    assert [job['state'] for job in jobs] == ['done'] * 3, [job['error'] for job in jobs]
+    for name in ["alice", "bob", "carol"]:
+        assert len(api.repository("owner/onboarding-" + name)["issues"]) == 5
+
+
+def test_a_job_whose_repository_was_only_partly_populated_fails(api, onboarding, tmp_path):
+    queue = onboarding_service.JobQueue(str(tmp_path / "queue.db"))
+    service = onboarding_service.OnboardingService(queue, 1)
+    api.fail('POST', r"/owner/onboarding-bob/issues$", times=1)
+    service.start()
+    try:
+        ids = [job['id'] for job in queue.enqueue(["alice", "bob"])]
+        service.notify()
+        wait_for(queue, ids)
+        assert [job['state'] for job in queue.jobs(ids)] == ['done', 'failed']
+
+        # the failed job is run again into the repository it partly populated
+        ids = [job['id'] for job in queue.enqueue(["bob"])]
+        service.notify()
+        wait_for(queue, ids)
+    finally:
+        service.stop()
+    assert [job['state'] for job in queue.jobs(ids)] == ['done']
+    assert sorted(issue["title"] for issue in api.repository("owner/onboarding-bob")["issues"]) == \
+        ["Issue " + str(n) for n in range(1, 6)]
@@ -0,0 +1,65 @@
+# coding=utf-8
+
+import fake_github_api
+import github_duplication
+import template_sync
+from conftest import comment_counts, restart, writes
+
+
+def sync(root, credentials, state):
+    return template_sync.sync(root, "owner/template", [(root, "owner/dest")], credentials, state, True)[0]
+
+
+def test_sync_propagates_the_changes_of_the_template(api, root, credentials, tmp_path):
+    state = str(tmp_path / "sync-state.json")
+    github_duplication.migrate("owner/template", "owner/dest", credentials, source_url=root)
+    restart()
+    assert sync(root, credentials, state) == {'created': 0, 'patched': 0, 'comments': 0}
+
+    template = api.repository("owner/template")
+    template["issues"][1]["body"] = "Edited"
+    template["issues"][1]["updated_at"] = fake_github_api.timestamp()
+    template["comments"][3].append({"id": 1000, "body": "Late", "user": {"login": "owner"}})
+    template["issues"][2]["updated_at"] = fake_github_api.timestamp()
+    template["labels"].append({"name": "label-new", "color": "ff0000"})
+    result = sync(root, credentials, state)
+    assert result == {'created': 1, 'patched': 1, 'comments': 1}
+
+    dest = api.repository("owner/dest")
+    assert dest["issues"][1]["body"] == "Edited"
+    assert comment_counts(api, "owner/dest")[3] == 3
+    assert "label-new" in [label["name"] for label in dest["labels"]]
+    assert len(dest["issues"]) == 5
+
+    # nothing changed since, so nothing is written
+    del api.requests[:]
+    assert sync(root, credentials, state) == {'created': 0, 'patched': 0, 'comments': 0}
+    assert writes(api, "owner/dest") == []
+
+
+def test_changes_failing_to_be_synced_are_retried_by_the_next_sync(api, root, credentials, tmp_path):
+    state = str(tmp_path / "sync-state.json")
+    github_duplication.migrate("owner/template", "owner/dest", credentials, source_url=root)
+    restart()
+    sync(root, credentials, state)
+
+    template = api.repository("owner/template")
+    template["issues"].append(dict(template["issues"][0], number=6, title="Issue 6", body="New",
+                                   updated_at=fake_github_api.timestamp()))
+    template["comments"][6] = []
+    template["issues"][1]["body"] = "Edited"
+    template["issues"][1]["updated_at"] = fake_github_api.timestamp()
+    template["comments"][3] += [{"id": 1000 + n, "body": "Late " + str(n), "user": {"login": "owner"}} for n in range(3)]
+    template["issues"][2]["updated_at"] = fake_github_api.timestamp()
+    api.fail('POST', r"/owner/dest/issues$", times=1)
+    api.fail('PATCH', r"/owner/dest/issues/2$", times=1)
+    # the second of the three new comments fails, after the first was appended
+    api.fail('POST', r"/owner/dest/issues/3/comments", times=1, after=1)
+    assert sync(root, credentials, state) is False
+
+    result = sync(root, credentials, state)
+    assert result == {'created': 1, 'patched': 1, 'comments': 2}
+    dest = api.repository("owner/dest")
+    assert [issue["title"] for issue in dest["issues"]] == ["Issue " + str(n) for n in range(1, 7)]
+    assert dest["issues"][1]["body"] == "Edited"
+    assert [comment["body"].split("\n")[0] for comment in dest["comments"][3][2:]] == ["Late 0", "Late 1", "Late 2"]